@@ -0,0 +1,264 @@
+"""
+Benchmarks hors ligne du bot contre le faux indexer de `func_mock_indexer`, servi en HTTP local :
+le bot l'interroge par son propre client et son transport, comme en réel.
+
+Chaque scénario (nombre de marchés x nombre de paires ouvertes) s'exécute dans un processus
+neuf et un répertoire temporaire (bougies, paires et journal des trades repartent de zéro).
+Étapes mesurées :
+- market_prices_cold : `construct_market_prices` sans bougies stockées ;
+- market_prices_warm : le même appel une fois le stockage local rempli (complément seulement) ;
+- cointegration : `store_cointegration_results` ;
+- snapshot / exits / entries : une itération de boucle, moyennée sur `--iterations`.
+Pour chaque étape : durée, appels à l'API (et réponses 429), pic mémoire Python (tracemalloc).
+
+Exemple :
+    python bench.py --markets 50 100 300 --open-pairs 0 50 --latency 0.02
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Colonnes du rapport
+COLUMNS = ("markets", "open_pairs", "stage", "seconds", "api_calls", "api_errors", "peak_mib", "detail")
+
+
+class _Stage:
+    """
+    Mesure d'une étape : durée, appels au faux indexer et pic mémoire.
+    """
+
+    def __init__(self, indexer, memory):
+        self.indexer = indexer
+        self.memory = memory
+
+    def __enter__(self):
+        self.calls = dict(self.indexer.calls)
+        self.errors = dict(self.indexer.errors)
+        if self.memory:
+            tracemalloc.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self.peak_mib = None
+        if self.memory:
+            self.peak_mib = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        self.api_calls = sum(self.indexer.calls.values()) - sum(self.calls.values())
+        self.api_errors = sum(self.indexer.errors.values()) - sum(self.errors.values())
+        return False
+
+
+def _seed_open_pairs(client, n_pairs):
+    """
+    Ouvrir `n_pairs` paires sur le faux indexer et les enregistrer dans le journal des trades.
+    """
+    from func_pairs_store import load_cointegrated_pairs
+    from func_trade_store import get_trade_store
+
+    pairs = load_cointegrated_pairs()
+    trade_store = get_trade_store()
+    used = set()
+    opened = 0
+
+    for pair in pairs.itertuples():
+        if opened >= n_pairs:
+            break
+        if pair.base_market in used or pair.quote_market in used:
+            continue
+        used.update((pair.base_market, pair.quote_market))
+        legs = []
+        for market, side in ((pair.base_market, "BUY"), (pair.quote_market, "SELL")):
+            order = client.create_order(market=market, side=side, size="1", price="0", reduce_only=False)
+            legs.append(order.data["order"])
+        trade_store.insert({
+            "market_1": pair.base_market,
+            "market_2": pair.quote_market,
+            "hedge_ratio": float(pair.hedge_ratio),
+            "z_score": -2.0,
+            "half_life": float(pair.half_life),
+            "order_id_m1": legs[0]["id"],
+            "order_m1_size": legs[0]["size"],
+            "order_m1_side": legs[0]["side"],
+            "order_id_m2": legs[1]["id"],
+            "order_m2_size": legs[1]["size"],
+            "order_m2_side": legs[1]["side"],
+            "pair_status": "LIVE",
+        })
+        opened += 1
+    return opened
+
+
+def run_scenario(n_markets, n_open_pairs, options):
+    """
+    Exécuter toutes les étapes d'un scénario dans le processus courant.
+
+    Returns:
+    list: Une ligne (dict) par étape.
+    """
+    from func_mock_indexer import MockIndexer
+    from func_transport import set_indexer_transport
+
+    indexer = MockIndexer(
+        n_markets=n_markets,
+        n_groups=max(1, n_markets // options.markets_per_group),
+        group_size=options.group_size,
+        latency=options.latency,
+        jitter=options.jitter,
+        rate_limit=options.rate_limit,
+        seed=options.seed,
+    ).start()
+    client = indexer.client()
+    set_indexer_transport(client.transport)
+    if options.limiter_rate is not None:
+        import func_rate_limit
+        func_rate_limit._INDEXER_LIMITER = func_rate_limit.TokenBucket(options.limiter_rate, options.limiter_burst)
+
+    rows = []
+
+    def record(stage, measure, detail=""):
+        rows.append({
+            "markets": n_markets,
+            "open_pairs": n_open_pairs,
+            "stage": stage,
+            "seconds": measure.seconds,
+            "api_calls": measure.api_calls,
+            "api_errors": measure.api_errors,
+            "peak_mib": measure.peak_mib,
+            "detail": detail,
+        })
+
+    from func_public import construct_market_prices
+    from func_cointegration import store_cointegration_results
+    from func_pairs_store import load_cointegrated_pairs
+
+    for stage in ("market_prices_cold", "market_prices_warm"):
+        with _Stage(indexer, options.memory) as measure:
+            df_market_prices = construct_market_prices(client)
+        record(stage, measure, f"{df_market_prices.shape[0]}x{df_market_prices.shape[1]}")
+
+    with _Stage(indexer, options.memory) as measure:
+        store_cointegration_results(df_market_prices)
+    record("cointegration", measure, f"{len(load_cointegrated_pairs())} pairs")
+
+    opened = _seed_open_pairs(client.private, n_open_pairs)
+
+    # Une itération de boucle : instantané partagé, sorties puis entrées
+    from func_scheduler import LoopState
+    from func_exit_pairs import manage_trade_exits
+    from func_entry_pairs import open_positions
+
+    state = LoopState(client, max_age=0)
+    stages = [
+        ("snapshot", state.get),
+        ("exits", lambda: manage_trade_exits(client, state.snapshot, state.positions)),
+        ("entries", lambda: open_positions(client, state.snapshot, state.positions)),
+    ]
+
+    totals = {}
+    for _ in range(options.iterations):
+        for stage, func in stages:
+            with _Stage(indexer, options.memory) as measure:
+                func()
+            total = totals.setdefault(stage, [0.0, 0, 0, 0.0])
+            total[0] += measure.seconds
+            total[1] += measure.api_calls
+            total[2] += measure.api_errors
+            total[3] = max(total[3], measure.peak_mib or 0.0)
+
+    for stage, (seconds, calls, errors, peak) in totals.items():
+        measure = _Stage(indexer, False)
+        measure.seconds = seconds / options.iterations
+        measure.api_calls = calls / options.iterations
+        measure.api_errors = errors / options.iterations
+        measure.peak_mib = peak if options.memory else None
+        record(stage, measure, f"{opened} open pairs, mean of {options.iterations}")
+
+    return rows
+
+
+def _scenario_process(n_markets, n_open_pairs, options, queue):
+    workdir = tempfile.mkdtemp(prefix="dydx-bench-")
+    try:
+        os.chdir(workdir)
+        queue.put(run_scenario(n_markets, n_open_pairs, options))
+    except Exception as e:
+        queue.put(e)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _format(rows):
+    lines = ["  ".join(f"{c:>18}" if c != "detail" else c for c in COLUMNS)]
+    for row in rows:
+        values = []
+        for column in COLUMNS:
+            value = row[column]
+            if column == "detail":
+                values.append(str(value))
+            elif isinstance(value, float):
+                values.append(f"{value:>18.3f}")
+            elif value is None:
+                values.append(f"{'-':>18}")
+            else:
+                values.append(f"{value:>18}")
+        lines.append("  ".join(values))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks hors ligne contre un faux indexer dYdX")
+    parser.add_argument("--markets", type=int, nargs="+", default=[50, 100, 300], help="nombres de marchés")
+    parser.add_argument("--open-pairs", type=int, nargs="+", default=[0, 20], help="nombres de paires ouvertes")
+    parser.add_argument("--markets-per-group", type=int, default=10, help="un groupe cointégré pour N marchés")
+    parser.add_argument("--group-size", type=int, default=4, help="marchés par groupe cointégré")
+    parser.add_argument("--latency", type=float, default=0.0, help="latence de chaque appel (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latence aléatoire supplémentaire maximale (s)")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requêtes acceptées par fenêtre de 10 s (429 au-delà)")
+    parser.add_argument("--limiter-rate", type=float, default=None, help="débit du limiteur du bot (défaut : constants)")
+    parser.add_argument("--limiter-burst", type=float, default=20, help="capacité du limiteur du bot")
+    parser.add_argument("--iterations", type=int, default=3, help="itérations de boucle mesurées")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="sans tracemalloc (durées plus justes)")
+    parser.add_argument("--csv", default=None, help="fichier CSV des résultats")
+    options = parser.parse_args(argv)
+
+    # Le répertoire du programme reste importable depuis le répertoire temporaire du scénario
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    failures = []
+    for n_markets in options.markets:
+        for n_open_pairs in options.open_pairs:
+            print(f"=== {n_markets} marchés, {n_open_pairs} paires ouvertes ===")
+            queue = context.Queue()
+            process = context.Process(target=_scenario_process, args=(n_markets, n_open_pairs, options, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            if isinstance(result, Exception):
+                print(f"Échec du scénario : {result!r}")
+                failures.append((n_markets, n_open_pairs))
+                continue
+            rows.extend(result)
+
+    print(_format(rows))
+    if options.csv:
+        import csv
+        with open(options.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    if failures:
+        raise SystemExit(f"{len(failures)} scénario(s) en échec : {failures}")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,130 @@
 # constants.py
-# Configuration du réseau
-NETWORK_MODE = "testnet"
+from decouple import config
+
+# Configuration du réseau (NETWORK_MODE du .env, comme le client : les URL de l'indexer en dépendent)
+NETWORK_MODE = config('NETWORK_MODE', default='testnet')
+
+# Résolution des bougies
+RESOLUTION = "1HOUR"
+
+# Étapes du bot
+ABORT_ALL_POSITIONS = False
+FIND_COINTEGRATED = True
+PLACE_TRADES = True
+MANAGE_EXITS = True
+
+# Planification de la boucle principale (secondes, alignées sur les frontières de bougie)
+SCHEDULE_EXITS_INTERVAL = 60       # sorties : chaque minute, donc aussi à chaque clôture
+SCHEDULE_ENTRIES_INTERVAL = None   # entrées : None = une fois par bougie
+SCHEDULE_HEALTH_INTERVAL = 300     # contrôle de santé
+SCHEDULE_DELAY = 2                 # décalage après la frontière, le temps que l'indexer publie la bougie
+SCHEDULE_SNAPSHOT_MAX_AGE = 30     # âge maximal de l'instantané partagé par les tâches de trading
+SCHEDULE_RETRY_BACKOFF = 5         # délai initial avant de relancer une tâche en échec, doublé à chaque échec
+SCHEDULE_MAX_BACKOFF = 300
+
+# Mode superviseur : les paires cointégrées sont réparties entre plusieurs processus (workers),
+# chacun sur son subcompte et avec son journal des trades ; un seul processus interroge l'indexer
+SUPERVISOR_WORKERS = 0             # 0 = un seul processus (mode normal)
+SUPERVISOR_SUBACCOUNTS = None      # subcompte de chaque worker (None = 0 .. SUPERVISOR_WORKERS - 1)
+SUPERVISOR_WORKER_LAG = 5          # les tâches des workers suivent de N secondes la publication des prix
+SUPERVISOR_FEED_MAX_AGE = 180      # au-delà, les workers interrogent eux-mêmes l'indexer
+SUPERVISOR_MARKETS_BYTES = 4 * 2 ** 20  # place réservée aux métadonnées des marchés (JSON)
+SUPERVISOR_CHECK_INTERVAL = 30     # surveillance (et redémarrage) des workers
+
+# Notifications Telegram (envoyées par un thread d'arrière-plan)
+NOTIFY_API_URL = "https://api.telegram.org"
+NOTIFY_QUEUE_SIZE = 100            # messages en attente au maximum (les suivants sont abandonnés)
+NOTIFY_TIMEOUT = (3.05, 10)        # délais de connexion et de lecture (s)
+NOTIFY_COALESCE_WINDOW = 60        # secondes pendant lesquelles un message identique est regroupé
+NOTIFY_RATE = 1                    # messages par seconde
+NOTIFY_BURST = 5
+
+# Instrumentation (latences, appels à l'API, endpoint Prometheus local)
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108                # None = pas d'endpoint HTTP
+METRICS_LOG_INTERVAL = 300         # secondes entre deux lignes de résumé
+
+# Limites de l'API indexer (100 requêtes / 10 s par IP)
+INDEXER_RATE_LIMIT = 10        # jetons rechargés par seconde
+INDEXER_RATE_BURST = 20        # capacité du seau à jetons
+INDEXER_MAX_CONCURRENCY = 8    # requêtes simultanées au maximum (et taille du pool de connexions)
+INDEXER_MAX_RETRIES = 4        # nouvelles tentatives après un échec
+INDEXER_RETRY_BACKOFF = 0.5    # délai initial (s), doublé à chaque tentative
+
+# Transport HTTP partagé de l'API REST de l'indexer (keep-alive, compression, décodage rapide)
+USE_INDEXER_TRANSPORT = True
+INDEXER_REST_URL = "https://indexer.dydx.trade/v4" if NETWORK_MODE == "mainnet" else "https://indexer.v4testnet.dydx.exchange/v4"
+INDEXER_HTTP_TIMEOUT = (3.05, 15)  # délais de connexion et de lecture (s)
+
+# Exécution des ordres
+ORDER_GOOD_TIL_SECONDS = 70    # validité d'un ordre (les ordres MARKET courts expirent au bloc près)
+ORDER_STATUS_TIMEOUT = 10      # attente maximale de l'état final d'un ordre par l'indexer (s)
+ORDER_STATUS_INTERVAL = 0.5    # délai entre deux lectures de l'état d'un ordre (s)
+
+# Cache des métadonnées de marchés (status, tickSize, stepSize)
+MARKETS_CACHE_TTL = 300        # secondes
+
+# Stockage local des bougies
+USE_CANDLE_STORE = True
+CANDLE_STORE_DIR = "candles"
+CANDLE_LOOKBACK_HOURS = 400
+
+# Cointégration
+COINT_WORKERS = None           # None = nombre de cœurs
+COINT_CHUNK_SIZE = 256         # paires par tâche envoyée au pool
+
+COINT_PVALUE_THRESH = 0.05     # p-value maximale pour retenir une paire
+
+# Présélection des paires avant les tests de cointégration exacts
+COINT_PREFILTER = True
+PREFILTER_MIN_CORR_PRICES = 0.3    # corrélation minimale (absolue) des log-prix
+PREFILTER_MIN_CORR_RETURNS = 0.0   # corrélation minimale (absolue) des rendements
+PREFILTER_MAX_DF_STAT = -2.5       # statistique Dickey-Fuller approchée maximale (None = désactivé)
+PREFILTER_TOP_K = None             # nombre maximal de candidats (None = pas de limite)
+
+# Journal des trades (remplace bot_agents.json)
+TRADE_STORE_FILE = "trades.db"
+TRADE_STORE_COMPACT_INTERVAL = 3600  # intégration du journal WAL (s)
+
+# Résultats de cointégration
+COINT_RESULTS_FILE = "cointegrated_pairs.npz"
+COINT_RESULTS_VERSION = 1
+
+# Re-cointégration glissante en cours d'exécution
+RECOINTEGRATE = True
+RECOINT_INTERVAL_CANDLES = 1   # bougies clôturées entre deux remplacements des paires
+RECOINT_REFIT_EVERY = 50       # bougies entre deux recalculs complets des statistiques suffisantes
+RECOINT_EXACT_CONFIRM = True   # confirmer les paires retenues par le test ADF exact
+
+# Signaux de trading
+ZSCORE_THRESH = 1.5
+ZSCORE_WINDOW = 21
+CLOSE_AT_ZSCORE_CROSS = True
+
+# Autres règles de sortie (None = désactivée)
+EXIT_HALF_LIFE_MULT = 3.0      # stop temporel : paire ouverte depuis plus de N demi-vies
+EXIT_STOP_ZSCORE = 4.0         # stop-loss : |z| au-delà de ce seuil, du côté de l'entrée
+EXIT_TAKE_PROFIT = 0.02        # take-profit : PnL latent en fraction du notionnel d'entrée
+
+# Taille des trades
+USD_PER_TRADE = 50
+USD_MIN_COLLATERAL = 1880
+
+# Backtest
+BACKTEST_FEE_RATE = 0.0005     # frais par exécution, en fraction du notionnel
+BACKTEST_SLIPPAGE = 0.001      # glissement par exécution, en fraction du prix
+
+# Flux WebSocket de l'indexer (remplace le polling REST des prix et des marchés)
+USE_WEBSOCKET = False
+INDEXER_WS_URL = "wss://indexer.dydx.trade/v4/ws" if NETWORK_MODE == "mainnet" else "wss://indexer.v4testnet.dydx.exchange/v4/ws"
+WS_RECONNECT_DELAY = 5         # secondes entre deux tentatives de reconnexion
+
+# Balayage de paramètres (backtest)
+SWEEP_ZSCORE_THRESHOLDS = [1.0, 1.5, 2.0, 2.5]
+SWEEP_ZSCORE_WINDOWS = [14, 21, 34]
+SWEEP_LOOKBACK_HOURS = [200, 300, 400]
+SWEEP_PVALUE_THRESHOLDS = [0.01, 0.05, 0.1]
+SWEEP_TRAIN_FRACTION = 0.7     # part des bougies réservée à la cointégration, le reste est hors échantillon
+SWEEP_WORKERS = None           # None = nombre de cœurs
+SWEEP_RESULTS_FILE = "sweep_results.csv"
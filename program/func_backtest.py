@@ -0,0 +1,222 @@
+import time
+import numpy as np
+import pandas as pd
+
+from constants import (
+    RESOLUTION,
+    ZSCORE_THRESH,
+    ZSCORE_WINDOW,
+    CLOSE_AT_ZSCORE_CROSS,
+    EXIT_HALF_LIFE_MULT,
+    EXIT_STOP_ZSCORE,
+    EXIT_TAKE_PROFIT,
+    USD_PER_TRADE,
+    BACKTEST_FEE_RATE,
+    BACKTEST_SLIPPAGE,
+)
+from func_utils import format_number, resolution_seconds
+from func_cointegration import calculate_zscore_matrix
+from func_rules import entry_signals, entry_base_direction, exit_reasons, EXIT_REASON_NAMES
+
+
+def _market_sizes(markets_data, market):
+    """
+    (tickSize, stepSize) d'un marché, None si les métadonnées ne sont pas fournies.
+    """
+    if markets_data is None or market not in markets_data["markets"]:
+        return None, None
+    info = markets_data["markets"][market]
+    return info.get("tickSize"), info.get("stepSize")
+
+
+def _round(value, size):
+    return float(format_number(value, size)) if size is not None else value
+
+
+def run_backtest(
+    prices,
+    markets,
+    pairs,
+    zscore_thresh=ZSCORE_THRESH,
+    window=ZSCORE_WINDOW,
+    close_at_cross=CLOSE_AT_ZSCORE_CROSS,
+    half_life_mult=EXIT_HALF_LIFE_MULT,
+    stop_zscore=EXIT_STOP_ZSCORE,
+    take_profit=EXIT_TAKE_PROFIT,
+    usd_per_trade=USD_PER_TRADE,
+    fee_rate=BACKTEST_FEE_RATE,
+    slippage=BACKTEST_SLIPPAGE,
+    markets_data=None,
+    exclusive_markets=True,
+):
+    """
+    Rejouer hors ligne les règles d'entrée et de sortie de `open_positions` et `manage_trade_exits`.
+
+    Les spreads et z-scores de toutes les paires sont calculés en bloc, puis les bougies sont
+    parcourues une à une avec des opérations vectorisées sur l'ensemble des paires ; seules les
+    exécutions (entrées et sorties) passent par une boucle Python, pour l'arrondi via `format_number`.
+
+    Parameters:
+    prices (np.ndarray): Matrice (bougies x marchés) des prix de clôture, comme construct_market_prices.
+    markets (list): Noms des marchés, dans l'ordre des colonnes.
+    pairs (pd.DataFrame): Colonnes base_market, quote_market, hedge_ratio (et half_life pour le stop temporel).
+    zscore_thresh (float): Seuil d'entrée (ZSCORE_THRESH).
+    window (int): Fenêtre du z-score glissant.
+    close_at_cross, half_life_mult, stop_zscore, take_profit: Règles de sortie, comme `exit_reasons`
+        en réel (None désactive une règle).
+    usd_per_trade (float): Notionnel de chaque jambe (USD_PER_TRADE).
+    fee_rate (float): Frais par exécution, en fraction du notionnel.
+    slippage (float): Glissement par exécution, en fraction du prix.
+    markets_data (dict): Métadonnées au format de la réponse /perpetualMarkets, pour l'arrondi tick / step.
+    exclusive_markets (bool): Comme en réel, ne pas ouvrir de paire sur un marché déjà en position.
+
+    Returns:
+    dict: equity (PnL cumulé marqué au marché à chaque bougie), trades (pd.DataFrame),
+          pnl, n_trades, turnover (notionnel échangé), sharpe (annualisé), open_pairs, elapsed.
+    """
+    start = time.perf_counter()
+    index = {market: col for col, market in enumerate(markets)}
+    known = pairs["base_market"].isin(index) & pairs["quote_market"].isin(index)
+    pairs = pairs[known].reset_index(drop=True)
+
+    bases = np.array([index[m] for m in pairs["base_market"]], dtype=np.int64)
+    quotes = np.array([index[m] for m in pairs["quote_market"]], dtype=np.int64)
+    hedge_ratios = pairs["hedge_ratio"].to_numpy(dtype=np.float64)
+    half_lives = pairs["half_life"].to_numpy(dtype=np.float64) if "half_life" in pairs else np.full(len(pairs), np.nan)
+
+    prices_1 = prices[:, bases].T
+    prices_2 = prices[:, quotes].T
+    z_scores = calculate_zscore_matrix(prices_1 - hedge_ratios[:, np.newaxis] * prices_2, window)
+
+    n_pairs, n_steps = prices_1.shape
+    base_markets = pairs["base_market"].tolist()
+    quote_markets = pairs["quote_market"].tolist()
+    sizes_1 = [_market_sizes(markets_data, m) for m in base_markets]
+    sizes_2 = [_market_sizes(markets_data, m) for m in quote_markets]
+
+    # État des positions (quantités signées, prix d'entrée, z-score d'entrée)
+    is_open = np.zeros(n_pairs, dtype=bool)
+    qty_1 = np.zeros(n_pairs)
+    qty_2 = np.zeros(n_pairs)
+    entry_1 = np.zeros(n_pairs)
+    entry_2 = np.zeros(n_pairs)
+    entry_z = np.zeros(n_pairs)
+    entry_step = np.zeros(n_pairs, dtype=np.int64)
+    market_busy = np.zeros(len(markets), dtype=bool)
+
+    equity = np.zeros(n_steps)
+    turnover = 0.0
+    trades = []
+
+    for t in range(n_steps):
+        p1 = prices_1[:, t]
+        p2 = prices_2[:, t]
+
+        # Marquer au marché les positions détenues depuis la bougie précédente
+        if t > 0:
+            pnl = qty_1 * (p1 - prices_1[:, t - 1]) + qty_2 * (p2 - prices_2[:, t - 1])
+            equity[t] = equity[t - 1] + np.nansum(pnl[is_open])
+
+        # Sorties : les mêmes règles qu'en réel, PnL latent mesuré depuis les prix d'entrée
+        if is_open.any():
+            with np.errstate(invalid="ignore"):
+                unrealized = qty_1 * (p1 - entry_1) + qty_2 * (p2 - entry_2)
+            entry_notional = np.abs(qty_1) * entry_1 + np.abs(qty_2) * entry_2
+            reasons = exit_reasons(
+                z_scores[:, t], entry_z, t - entry_step, half_lives, unrealized, entry_notional,
+                close_at_cross, half_life_mult, stop_zscore, take_profit,
+            )
+            exits = np.flatnonzero(is_open & (reasons > 0) & np.isfinite(p1) & np.isfinite(p2))
+            for k in exits:
+                exit_1 = _round(p1[k] * (1 - np.sign(qty_1[k]) * slippage), sizes_1[k][0])
+                exit_2 = _round(p2[k] * (1 - np.sign(qty_2[k]) * slippage), sizes_2[k][0])
+                notional = abs(qty_1[k]) * exit_1 + abs(qty_2[k]) * exit_2
+                cost = abs(qty_1[k]) * abs(exit_1 - p1[k]) + abs(qty_2[k]) * abs(exit_2 - p2[k]) + fee_rate * notional
+                equity[t] -= cost
+                turnover += notional
+
+                gross = qty_1[k] * (exit_1 - entry_1[k]) + qty_2[k] * (exit_2 - entry_2[k])
+                fees = fee_rate * (notional + abs(qty_1[k]) * entry_1[k] + abs(qty_2[k]) * entry_2[k])
+                trades.append({
+                    "base_market": base_markets[k],
+                    "quote_market": quote_markets[k],
+                    "entry_step": int(entry_step[k]),
+                    "exit_step": t,
+                    "z_score_entry": entry_z[k],
+                    "z_score_exit": z_scores[k, t],
+                    "exit_reason": EXIT_REASON_NAMES[reasons[k]],
+                    "base_size": qty_1[k],
+                    "quote_size": qty_2[k],
+                    "pnl": gross - fees,
+                })
+                is_open[k] = False
+                qty_1[k] = qty_2[k] = 0.0
+                market_busy[bases[k]] = market_busy[quotes[k]] = False
+
+        # Entrées
+        candidates = ~is_open & entry_signals(z_scores[:, t], zscore_thresh) & np.isfinite(p1) & np.isfinite(p2)
+        if exclusive_markets:
+            candidates &= ~market_busy[bases] & ~market_busy[quotes]
+        candidates = np.flatnonzero(candidates)
+        directions = entry_base_direction(z_scores[candidates, t])
+        for k, direction in zip(candidates, directions):
+            if exclusive_markets and (market_busy[bases[k]] or market_busy[quotes[k]]):
+                continue
+
+            tick_1, step_1 = sizes_1[k]
+            tick_2, step_2 = sizes_2[k]
+            size_1 = _round(usd_per_trade / p1[k], step_1)
+            size_2 = _round(usd_per_trade / p2[k], step_2)
+            # Sur dYdX v4, la taille minimale d'un ordre est un stepSize : une taille arrondie à zéro est refusée
+            if size_1 <= 0 or size_2 <= 0:
+                continue
+
+            fill_1 = _round(p1[k] * (1 + direction * slippage), tick_1)
+            fill_2 = _round(p2[k] * (1 - direction * slippage), tick_2)
+            notional = size_1 * fill_1 + size_2 * fill_2
+            equity[t] -= size_1 * abs(fill_1 - p1[k]) + size_2 * abs(fill_2 - p2[k]) + fee_rate * notional
+            turnover += notional
+
+            is_open[k] = True
+            qty_1[k] = direction * size_1
+            qty_2[k] = -direction * size_2
+            entry_1[k] = fill_1
+            entry_2[k] = fill_2
+            entry_z[k] = z_scores[k, t]
+            entry_step[k] = t
+            if exclusive_markets:
+                market_busy[bases[k]] = market_busy[quotes[k]] = True
+
+    # Sharpe annualisé des variations de PnL par bougie
+    increments = np.diff(equity)
+    periods_per_year = 365 * 24 * 3600 / resolution_seconds(RESOLUTION)
+    std = increments.std() if len(increments) > 1 else 0.0
+    sharpe = increments.mean() / std * np.sqrt(periods_per_year) if std > 0 else 0.0
+
+    return {
+        "equity": equity,
+        "trades": pd.DataFrame(trades),
+        "pnl": float(equity[-1]) if n_steps > 0 else 0.0,
+        "n_trades": len(trades),
+        "turnover": float(turnover),
+        "sharpe": float(sharpe),
+        "open_pairs": int(is_open.sum()),
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+if __name__ == "__main__":
+    # Backtest hors ligne sur les bougies stockées localement et les paires cointégrées sauvegardées
+    from func_candle_store import CandleStore
+    from func_pairs_store import load_cointegrated_pairs
+    from func_public import build_market_prices_frame
+
+    pairs = load_cointegrated_pairs()
+    markets = list(dict.fromkeys(list(pairs["base_market"]) + list(pairs["quote_market"])))
+    store = CandleStore()
+    df = build_market_prices_frame(markets, [store.load(market) for market in markets])
+
+    result = run_backtest(df.to_numpy(), df.columns.to_list(), pairs)
+    print(f"Paires : {len(pairs)}, bougies : {len(df)}")
+    print(f"PnL : {result['pnl']:.2f} USD, trades : {result['n_trades']}, Sharpe : {result['sharpe']:.2f}, turnover : {result['turnover']:.0f} USD")
+    print(f"Durée : {result['elapsed'] * 1000:.1f} ms")
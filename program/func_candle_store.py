@@ -0,0 +1,71 @@
+import os
+import numpy as np
+
+from constants import RESOLUTION, CANDLE_STORE_DIR, CANDLE_LOOKBACK_HOURS
+
+CANDLE_DTYPE = np.dtype([("epoch", np.int64), ("close", np.float64)])
+
+
+class CandleStore:
+    """
+    Stockage local des bougies : un fichier NumPy structuré (epoch, close) par marché et résolution.
+    Au démarrage, seules les bougies plus récentes que la dernière bougie stockée sont récupérées.
+    """
+
+    def __init__(self, directory=CANDLE_STORE_DIR, resolution=RESOLUTION, lookback_hours=CANDLE_LOOKBACK_HOURS):
+        self.directory = directory
+        self.resolution = resolution
+        self.lookback_seconds = int(lookback_hours * 3600)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, market):
+        return os.path.join(self.directory, f"{market}_{self.resolution}.npy")
+
+    def load(self, market):
+        """
+        Charger les bougies stockées d'un marché.
+
+        Returns:
+        tuple: (epochs int64, closes float64), vides si le marché n'est pas encore stocké.
+        """
+        try:
+            records = np.load(self.path(market), mmap_mode="r")
+            return np.array(records["epoch"]), np.array(records["close"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Fichier de bougies illisible pour {market}, il sera reconstruit : {e}")
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    def save(self, market, epochs, closes):
+        records = np.empty(len(epochs), dtype=CANDLE_DTYPE)
+        records["epoch"] = epochs
+        records["close"] = closes
+
+        # Écriture atomique : fichier temporaire puis remplacement
+        tmp_path = self.path(market) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, records)
+        os.replace(tmp_path, self.path(market))
+
+    def update(self, market, epochs, closes, now):
+        """
+        Fusionner les nouvelles bougies avec celles stockées, tronquer à la fenêtre
+        de lookback et sauvegarder. Les nouvelles valeurs remplacent les anciennes
+        pour une même date (la dernière bougie stockée pouvait être incomplète).
+
+        Returns:
+        tuple: (epochs int64, closes float64) fusionnés et triés.
+        """
+        stored_epochs, stored_closes = self.load(market)
+        all_epochs = np.concatenate([epochs, stored_epochs])
+        all_closes = np.concatenate([closes, stored_closes])
+
+        all_epochs, first = np.unique(all_epochs, return_index=True)
+        all_closes = all_closes[first]
+
+        keep = all_epochs >= now - self.lookback_seconds
+        all_epochs, all_closes = all_epochs[keep], all_closes[keep]
+
+        self.save(market, all_epochs, all_closes)
+        return all_epochs, all_closes
@@ -1,27 +1,282 @@
-import pandas as pd
-from statsmodels.tsa.stattools import coint
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
+from func_pairs_store import save_cointegrated_pairs
+from func_metrics import timed
+from constants import (
+    COINT_WORKERS,
+    COINT_CHUNK_SIZE,
+    COINT_PVALUE_THRESH,
+    COINT_PREFILTER,
+    PREFILTER_MIN_CORR_PRICES,
+    PREFILTER_MIN_CORR_RETURNS,
+    PREFILTER_MAX_DF_STAT,
+    PREFILTER_TOP_K,
+    ZSCORE_WINDOW,
+)
+
+# Résultats par paire, dans l'ordre de np.triu_indices(n_markets, 1)
+COINT_DTYPE = np.dtype([
+    ("base", np.int32),
+    ("quote", np.int32),
+    ("p_value", np.float32),
+    ("t_stat", np.float32),
+    ("hedge_ratio", np.float32),
+    ("half_life", np.float32),
+])
+
+# Matrice de prix partagée par les processus du pool (copiée une seule fois par processus)
+_PRICES = None
+
+
+def _init_worker(prices):
+    global _PRICES
+    _PRICES = prices
+
+
+def compute_hedge_ratios(prices):
+    """
+    Régressions MCO de toutes les paires en une seule passe matricielle.
+
+    Parameters:
+    prices (np.ndarray): Matrice (T, N) des prix de clôture.
+
+    Returns:
+    tuple: (hedge_ratio, slope, intercept), matrices (N, N) où [i, j] correspond à la régression de i sur j.
+           `hedge_ratio` est sans constante (spread = i - hedge_ratio * j, comme à l'entrée et à la sortie),
+           `slope` et `intercept` sont ceux de la régression avec constante utilisée par le test d'Engle-Granger.
+    """
+    # Sans constante : beta = <x, y> / <x, x>
+    gram = prices.T @ prices
+    hedge_ratio = gram / np.diag(gram)[np.newaxis, :]
+
+    # Avec constante : beta = cov(x, y) / var(x)
+    means = prices.mean(axis=0)
+    centered = prices - means
+    cov = centered.T @ centered
+    slope = cov / np.diag(cov)[np.newaxis, :]
+    intercept = means[:, np.newaxis] - slope * means[np.newaxis, :]
+
+    return hedge_ratio, slope, intercept
+
+
+def approximate_df_stats(prices, bases, quotes, slope, intercept, chunk_size=4096):
+    """
+    Statistique de Dickey-Fuller sans retard sur les résidus de chaque paire, calculée en bloc.
+    Approximation rapide de l'ADF exact, utilisée uniquement pour la présélection.
+
+    Returns:
+    np.ndarray: Statistiques t (plus elles sont négatives, plus le spread est stationnaire).
+    """
+    stats = np.empty(len(bases), dtype=np.float64)
+    n_obs = prices.shape[0] - 1
+
+    for start in range(0, len(bases), chunk_size):
+        b = bases[start:start + chunk_size]
+        q = quotes[start:start + chunk_size]
+        resid = prices[:, b] - intercept[b, q] - slope[b, q] * prices[:, q]
+        lag = resid[:-1]
+        diff = resid[1:] - lag
+        lag_ss = np.einsum("ij,ij->j", lag, lag)
+        gamma = np.einsum("ij,ij->j", lag, diff) / lag_ss
+        sigma2 = np.einsum("ij,ij->j", diff - gamma * lag, diff - gamma * lag) / (n_obs - 1)
+        stats[start:start + chunk_size] = gamma / np.sqrt(sigma2 / lag_ss)
+
+    return stats
+
+
+@timed("prefilter")
+def prefilter_pairs(
+    prices,
+    min_corr_prices=PREFILTER_MIN_CORR_PRICES,
+    min_corr_returns=PREFILTER_MIN_CORR_RETURNS,
+    max_df_stat=PREFILTER_MAX_DF_STAT,
+    top_k=PREFILTER_TOP_K,
+):
+    """
+    Présélection peu coûteuse des paires avant les tests de cointégration exacts.
+    Les matrices de corrélation des log-prix et des rendements sont calculées en une passe,
+    puis, optionnellement, une statistique de Dickey-Fuller approchée sur le spread.
+
+    Parameters:
+    prices (np.ndarray): Matrice (T, N) des prix de clôture.
+    min_corr_prices (float): Corrélation minimale (en valeur absolue) des log-prix.
+    min_corr_returns (float): Corrélation minimale (en valeur absolue) des rendements logarithmiques.
+    max_df_stat (float): Statistique DF approchée maximale (None pour ne pas la calculer).
+    top_k (int): Nombre maximal de candidats conservés, les plus stationnaires d'abord.
+
+    Returns:
+    tuple: (bases, quotes), indices des paires candidates (i < j).
+    """
+    log_prices = np.log(prices)
+    corr_prices = np.corrcoef(log_prices, rowvar=False)
+    corr_returns = np.corrcoef(np.diff(log_prices, axis=0), rowvar=False)
+
+    bases, quotes = np.triu_indices(prices.shape[1], 1)
+    # Valeurs absolues : un ratio de couverture négatif reste exploitable
+    keep = (np.abs(corr_prices[bases, quotes]) >= min_corr_prices) & (np.abs(corr_returns[bases, quotes]) >= min_corr_returns)
+    bases, quotes = bases[keep], quotes[keep]
+    score = -np.abs(corr_prices[bases, quotes])
+
+    if max_df_stat is not None or top_k is not None:
+        _, slope, intercept = compute_hedge_ratios(prices)
+        score = approximate_df_stats(prices, bases, quotes, slope, intercept)
+        if max_df_stat is not None:
+            keep = score <= max_df_stat
+            bases, quotes, score = bases[keep], quotes[keep], score[keep]
+
+    if top_k is not None and len(bases) > top_k:
+        best = np.argsort(score, kind="stable")[:top_k]
+        best.sort()
+        bases, quotes = bases[best], quotes[best]
+
+    return bases, quotes
+
+
+def calculate_half_life(spread):
+    """
+    Demi-vie de retour à la moyenne du spread (régression de Δspread sur spread décalé).
+    """
+    spread_lag = spread[:-1]
+    spread_ret = np.diff(spread)
+    lag_centered = spread_lag - spread_lag.mean()
+    denom = np.dot(lag_centered, lag_centered)
+    if denom == 0:
+        return np.nan
+    beta = np.dot(lag_centered, spread_ret - spread_ret.mean()) / denom
+    if beta >= 0:
+        return np.inf
+    return round(-np.log(2) / beta, 0)
+
+
+def calculate_zscore_matrix(spreads, window=ZSCORE_WINDOW):
+    """
+    Z-scores glissants de plusieurs spreads sur tout leur historique, sans boucle Python.
+
+    Parameters:
+    spreads (np.ndarray): Matrice (paires x bougies) des spreads.
+    window (int): Longueur de la fenêtre glissante.
+
+    Returns:
+    np.ndarray: Matrice de même forme (NaN tant que la fenêtre est incomplète).
+    """
+    z_scores = np.full(spreads.shape, np.nan)
+    if spreads.shape[1] < window:
+        return z_scores
+    windows = np.lib.stride_tricks.sliding_window_view(spreads, window, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = windows.mean(axis=-1)
+        std = windows.std(axis=-1, ddof=1)
+        z_scores[:, window - 1:] = (spreads[:, window - 1:] - mean) / std
+    return z_scores
+
+
+def _adf_chunk(task):
+    """
+    Test ADF sur les résidus de chaque paire d'un lot (équivalent à `statsmodels.coint`).
+    """
+    # statsmodels (long à importer) n'est chargé que par les processus qui font les tests ADF
+    from statsmodels.tsa.stattools import adfuller
+    from statsmodels.tsa.adfvalues import mackinnonp
+
+    bases, quotes, slopes, intercepts, hedge_ratios = task
+    prices = _PRICES
+    results = np.empty(len(bases), dtype=COINT_DTYPE)
+    results["base"] = bases
+    results["quote"] = quotes
+    results["hedge_ratio"] = hedge_ratios
+
+    for k in range(len(bases)):
+        y = prices[:, bases[k]]
+        x = prices[:, quotes[k]]
+        try:
+            resid = y - intercepts[k] - slopes[k] * x
+            t_stat = adfuller(resid, autolag="aic", regression="n")[0]
+            results["t_stat"][k] = t_stat
+            results["p_value"][k] = mackinnonp(t_stat, regression="c", N=2)
+            results["half_life"][k] = calculate_half_life(y - hedge_ratios[k] * x)
+        except Exception:
+            results["t_stat"][k] = np.nan
+            results["p_value"][k] = np.nan
+            results["half_life"][k] = np.nan
+
+    return results
+
+
+@timed("cointegration")
+def compute_cointegration(prices, pairs=None, workers=COINT_WORKERS, chunk_size=COINT_CHUNK_SIZE):
+    """
+    Moteur de cointégration de toutes les paires i < j.
+    Les régressions sont calculées en bloc, les tests ADF sont répartis sur un pool de processus.
+
+    Parameters:
+    prices (np.ndarray): Matrice (T, N) des prix de clôture.
+    pairs (tuple): (bases, quotes) à tester, par exemple issus de `prefilter_pairs` (toutes les paires par défaut).
+    workers (int): Nombre de processus (None = nombre de cœurs, 1 = sans pool).
+    chunk_size (int): Nombre de paires par tâche.
+
+    Returns:
+    np.ndarray: Tableau structuré COINT_DTYPE, une ligne par paire testée (triangle supérieur).
+    """
+    prices = np.ascontiguousarray(prices, dtype=np.float64)
+    bases, quotes = pairs if pairs is not None else np.triu_indices(prices.shape[1], 1)
+    if len(bases) == 0:
+        return np.empty(0, dtype=COINT_DTYPE)
+
+    hedge_ratio, slope, intercept = compute_hedge_ratios(prices)
+    tasks = []
+    for start in range(0, len(bases), chunk_size):
+        b = bases[start:start + chunk_size]
+        q = quotes[start:start + chunk_size]
+        tasks.append((b, q, slope[b, q], intercept[b, q], hedge_ratio[b, q]))
+
+    if workers == 1 or len(tasks) == 1:
+        _init_worker(prices)
+        chunks = [_adf_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(prices,)) as executor:
+            chunks = list(executor.map(_adf_chunk, tasks))
+
+    return np.concatenate(chunks)
+
+
+@timed("store_cointegration")
 def store_cointegration_results(df_market_prices):
     """
     Analyse la cointégration des paires de marchés à partir des prix récupérés et stocke les résultats.
     La cointégration est utilisée pour identifier les paires de marchés qui peuvent être utilisées pour des stratégies de trading à long terme.
 
-    :param df_market_prices: DataFrame contenant les prix de marché
+    :param df_market_prices: DataFrame contenant les prix de marché (une colonne par marché)
     :return: Résultat de l'opération de sauvegarde ou une indication d'échec
     """
     try:
         # Analyse de la cointégration sur toutes les combinaisons possibles de marchés
-        n = len(df_market_prices)
-        p_values = pd.DataFrame(index=df_market_prices['market'], columns=df_market_prices['market'])
-        for i in range(n):
-            for j in range(i+1, n):
-                result = coint(df_market_prices.iloc[i]['price'], df_market_prices.iloc[j]['price'])
-                p_values.iloc[i, j] = result[1]
+        markets = df_market_prices.columns.to_list()
+        prices = df_market_prices.to_numpy(dtype=np.float64)
+        n_pairs = len(markets) * (len(markets) - 1) // 2
+
+        # Présélection des candidats
+        pairs = None
+        if COINT_PREFILTER:
+            pairs = prefilter_pairs(prices)
+
+        # Tests exacts
+        start = time.perf_counter()
+        results = compute_cointegration(prices, pairs)
+        elapsed = time.perf_counter() - start
+
+        if pairs is not None:
+            dropped = n_pairs - len(results)
+            saved = elapsed / len(results) * dropped if len(results) > 0 else 0.0
+            print(f"Présélection : {dropped}/{n_pairs} paires écartées, environ {saved:.1f}s de tests évitées")
 
-        # Filtre les paires avec une p-value inférieure à un seuil, e.g., 0.05
-        pairs_to_trade = p_values.where(lambda x: x < 0.05).stack().index.tolist()
+        # Filtre les paires avec une p-value inférieure au seuil
+        selected = results[results["p_value"] < COINT_PVALUE_THRESH]
+        pairs_to_trade = [(markets[r["base"]], markets[r["quote"]]) for r in selected]
 
-        # Sauvegarde des résultats (simulé ici comme un simple print ou retour de valeur)
+        # Sauvegarde des résultats
+        save_cointegrated_pairs(selected, markets, df_market_prices.index)
         print("Paires cointégrées trouvées et sauvegardées :", pairs_to_trade)
         return "saved"
     except Exception as e:
@@ -1,38 +1,70 @@
 import asyncio
+import threading
 from decouple import config
-from v4_client_py.clients.constants import Network
-from v4_client_py.chain.aerial.wallet import LocalWallet
-from v4_client_py.clients.dydx_indexer_client import IndexerClient
-from v4_client_py.clients.dydx_subaccount import Subaccount
-from v4_client_py.clients.dydx_validator_client import ValidatorClient
+
+from constants import NETWORK_MODE
+
+# Clients du processus par subcompte, créés à la première demande
+_CLIENTS = {}
+_CLIENT_LOCK = threading.Lock()
+
 
 def get_network_config():
-    network_mode = config('NETWORK_MODE', default='testnet')
-    if network_mode == "mainnet":
+    # Le client v4 (grpc, web3, bip_utils...) n'est importé qu'à la connexion
+    from v4_client_py.clients.constants import Network
+
+    if NETWORK_MODE == "mainnet":
         return Network.config_network()  # Assurez-vous que cette configuration est correctement définie
     else:
         return Network.config_network()  # Assurez-vous que cette configuration est correctement définie
 
-async def connect_dydx_v4():
+
+async def connect_dydx_v4(subaccount_number=None):
+    """
+    Connecte à dYdX V4 avec le CompositeClient et vérifie le subcompte
+    (SUBACCOUNT_NUMBER de la configuration, 0 par défaut).
+
+    Returns:
+    DydxV4Client: Le client du subcompte (CompositeClient enveloppé, voir func_v4_client).
+    """
+    from v4_client_py.chain.aerial.wallet import LocalWallet
+    from v4_client_py.clients import CompositeClient
+    from v4_client_py.clients.dydx_subaccount import Subaccount
+    from func_v4_client import DydxV4Client
+
     mnemonic = config('MNEMONIC')
     network = get_network_config()
     wallet = LocalWallet.from_mnemonic(mnemonic)
-    subaccount = Subaccount(wallet)
+    if subaccount_number is None:
+        subaccount_number = config('SUBACCOUNT_NUMBER', default=0, cast=int)
+    subaccount = Subaccount(wallet, subaccount_number)
 
-    # Création des clients
-    indexer_client = IndexerClient(network.indexer_config)
-    validator_client = ValidatorClient(network.validator_config)
+    client = DydxV4Client(CompositeClient(network), subaccount)
 
-    # Utiliser `IndexerClient` pour obtenir les informations du compte
-    account_info = await indexer_client.account.get_subaccount(wallet.address(), subaccount.subaccount_number)
+    # Récupération des informations du subcompte
+    account_info = client.private.get_account().data["subaccount"]
 
-    # Afficher les informations obtenues
     print("Connection Successful")
     print(f"Account ID: {wallet.address()}")
     print(f"Subaccount ID: {subaccount.subaccount_number}")
-    print(f"Account Info: {account_info}")
+    print(f"Equity: {account_info['equity']} / Free collateral: {account_info['freeCollateral']}")
+
+    return client
+
+
+def get_client(subaccount_number=None):
+    """
+    Client dYdX du processus pour un subcompte : connecté à la première demande, puis réutilisé.
+    Utilisable depuis du code synchrone (la connexion est exécutée par `asyncio.run`).
+    """
+    client = _CLIENTS.get(subaccount_number)
+    if client is None:
+        with _CLIENT_LOCK:
+            client = _CLIENTS.get(subaccount_number)
+            if client is None:
+                client = _CLIENTS[subaccount_number] = asyncio.run(connect_dydx_v4(subaccount_number))
+    return client
 
-    return account_info
 
 if __name__ == "__main__":
-    asyncio.run(connect_dydx_v4())
+    get_client()
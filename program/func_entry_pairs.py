@@ -1,144 +1,176 @@
-from constants import ZSCORE_THRESH, USD_PER_TRADE, USD_MIN_COLLATERAL
+from constants import USD_PER_TRADE, USD_MIN_COLLATERAL
 from func_utils import format_number
-from func_public import get_candles_recent
-from func_cointegration import calculate_zscore
-from func_private import is_open_positions
-from func_bot_agent import BotAgent
-import pandas as pd
-import json
+from func_public import get_recent_prices_snapshot, get_markets_data
+from func_zscore_stream import get_zscore_book
+from func_rules import entry_signals
+from func_private import PositionBook, place_pair_orders, place_market_order, wait_for_orders
+from func_pairs_store import load_cointegrated_pairs
+from func_trade_store import get_trade_store
+from func_metrics import timed
+import numpy as np
 
-from pprint import pprint
 
-def open_positions(client):
+
+def open_pair(client, legs, failsafe_prices):
+    """
+    Ouvrir les deux jambes d'une paire simultanément.
+    Si une jambe n'est pas exécutée, la jambe exécutée est refermée (ordre reduce-only au prix de secours).
+
+    Parameters:
+    client (obj): Client de l'API.
+    legs (list): Arguments de `place_market_order` de chaque jambe (market, side, size, price).
+    failsafe_prices (list): Prix acceptable de fermeture de chaque jambe en cas d'échec.
+
+    Returns:
+    list: Les ordres exécutés, dans l'ordre de `legs` (None si la paire n'a pas pu être ouverte).
+    """
+    placed = place_pair_orders(client, [dict(leg, reduce_only=False) for leg in legs])
+    orders = [result["order"] if result else None for result in placed]
+    # L'indexer suit la chaîne avec retard : attendre l'état final des ordres avant de conclure
+    statuses = wait_for_orders(client, [order["id"] for order in orders if order is not None])
+    filled = [order is not None and statuses.get(order["id"], {}).get("status") == "FILLED" for order in orders]
+    if all(filled):
+        return orders
+
+    # Ne pas garder une jambe seule
+    for leg, is_filled, price in zip(legs, filled, failsafe_prices):
+        if is_filled:
+            print(f"Fermeture de la jambe {leg['market']} : l'autre jambe n'a pas été exécutée")
+            place_market_order(client, leg["market"], "SELL" if leg["side"] == "BUY" else "BUY", leg["size"], price, True)
+    return None
+
+
+@timed("entries")
+def open_positions(client, snapshot=None, positions=None):
     """
     Gérer la recherche de déclencheurs pour l'entrée en position.
     Stocker les trades pour une gestion ultérieure dans la fonction de sortie.
+    `snapshot` : instantané des prix de la boucle (construit ici s'il n'est pas fourni).
+    `positions` : PositionBook des positions ouvertes de la boucle (récupéré ici s'il n'est pas fourni).
     """
     
-    # Charger les paires cointegrées
-    df = pd.read_csv("cointegrated_pairs.csv")
+    # Charger les paires cointegrées (relues uniquement si le fichier a changé)
+    df = load_cointegrated_pairs()
+
+    # Récupérer les prix récents une seule fois par marché
+    if snapshot is None:
+        snapshot = get_recent_prices_snapshot(client, list(df["base_market"]) + list(df["quote_market"]))
 
     # Obtenir les marchés pour référencer la taille minimale des ordres, la taille des ticks, etc.
-    markets = client.public.get_markets().data
-
-    # Initialiser le conteneur pour les résultats de BotAgent
-    bot_agents = []
-
-    # Ouvrir le fichier JSON
-    try:
-        with open("bot_agents.json") as open_positions_file:
-            open_positions_dict = json.load(open_positions_file)
-            for p in open_positions_dict:
-                bot_agents.append(p)
-    except FileNotFoundError:
-        bot_agents = []
-    
+    markets = get_markets_data(client)
+
+    # Journal des trades
+    trade_store = get_trade_store()
+
+    # Récupérer les positions ouvertes une seule fois
+    if positions is None:
+        positions = PositionBook().refresh(client)
+
+    # Mettre à jour les ZScores de toutes les paires (incrémental, O(1) par paire)
+    z_scores = get_zscore_book("entry").update(snapshot, df["base_market"], df["quote_market"], df["hedge_ratio"])
+
     # Trouver les déclencheurs ZScore
-    for index, row in df.iterrows():
+    for index in np.flatnonzero(entry_signals(z_scores)):
         # Extraire les variables
+        row = df.iloc[index]
         base_market = row["base_market"]
         quote_market = row["quote_market"]
         hedge_ratio = row["hedge_ratio"]
         half_life = row["half_life"]
+        z_score = float(z_scores[index])
 
         # Obtenir les prix
-        series_1 = get_candles_recent(client, base_market)
-        series_2 = get_candles_recent(client, quote_market)
-
-        # Calculer le ZScore
-        if len(series_1) > 0 and len(series_1) == len(series_2):
-            spread = series_1 - (hedge_ratio * series_2)
-            z_score = calculate_zscore(spread).values.tolist()[-1]
-
-            # Établir si c'est un trade potentiel
-            if abs(z_score) >= ZSCORE_THRESH:
-                # S'assurer qu'aucune position similaire n'est déjà ouverte (diversifier le trading)
-                is_base_open = is_open_positions(client, base_market)
-                is_quote_open = is_open_positions(client, quote_market)
-
-                # Placer le trade
-                if not is_base_open and not is_quote_open:
-                    # Déterminer le côté
-                    base_side = "BUY" if z_score < 0 else "SELL"
-                    quote_side = "BUY" if z_score > 0 else "SELL"
-
-                    # Obtenir les prix acceptables sous forme de chaîne avec le bon nombre de décimales
-                    base_price = series_1[-1]
-                    quote_price = series_2[-1]
-                    accept_base_price = float(base_price) * 1.01 if z_score < 0 else float(base_price) * 0.99
-                    accept_quote_price = float(quote_price) * 1.01 if z_score > 0 else float(quote_price) * 0.99
-                    failsafe_base_price = float(base_price) * 0.05 if z_score < 0 else float(base_price) * 1.7
-                    base_tick_size = markets["markets"][base_market]["tickSize"]
-                    quote_tick_size = markets["markets"][quote_market]["tickSize"]
-
-                    # Formater les prix
-                    accept_base_price = format_number(accept_base_price, base_tick_size)
-                    accept_quote_price = format_number(accept_quote_price, quote_tick_size)
-                    accept_failsafe_base_price = format_number(failsafe_base_price, base_tick_size)
-
-                    # Obtenir la taille
-                    base_quantity = 1 / base_price * USD_PER_TRADE
-                    quote_quantity = 1 / quote_price * USD_PER_TRADE
-                    base_step_size = markets["markets"][base_market]["stepSize"]
-                    quote_step_size = markets["markets"][quote_market]["stepSize"]
-
-                    # Formater les tailles
-                    base_size = format_number(base_quantity, base_step_size)
-                    quote_size = format_number(quote_quantity, quote_step_size)
-
-                    # S'assurer de la taille
-                    base_min_order_size = markets["markets"][base_market]["minOrderSize"]
-                    quote_min_order_size = markets["markets"][quote_market]["minOrderSize"]
-                    check_base = float(base_quantity) > float(base_min_order_size)
-                    check_quote = float(quote_quantity) > float(quote_min_order_size)
-
-                    # Si les vérifications sont validées, placer les trades
-                    if check_base and check_quote:
-                        # Vérifier le solde du compte
-                        account = client.private.get_account()
-                        free_collateral = float(account.data["account"]["freeCollateral"])
-                        print(f"Solde : {free_collateral} et minimum à {USD_MIN_COLLATERAL}")
-
-                        # Vérification : S'assurer du collatéral
-                        if free_collateral < USD_MIN_COLLATERAL:
-                            break
-
-                        # Créer un BotAgent
-                        bot_agent = BotAgent(
-                            client,
-                            market_1=base_market,
-                            market_2=quote_market,
-                            base_side=base_side,
-                            base_size=base_size,
-                            base_price=accept_base_price,
-                            quote_side=quote_side,
-                            quote_size=quote_size,
-                            quote_price=accept_quote_price,
-                            accept_failsafe_base_price=accept_failsafe_base_price,
-                            z_score=z_score,
-                            half_life=half_life,
-                            hedge_ratio=hedge_ratio
-                        )
-
-                        # Ouvrir les trades
-                        bot_open_dict = bot_agent.open_trades()
-
-                        # Vérification : Gérer les échecs
-                        if bot_open_dict == "failed":
-                            continue
-
-                        # Gérer le succès de l'ouverture des trades
-                        if bot_open_dict["pair_status"] == "LIVE":
-                            # Ajouter à la liste des agents de bots
-                            bot_agents.append(bot_open_dict)
-                            del(bot_open_dict)
-
-                            # Confirmer le statut live dans le print
-                            print("Statut du trade : Live")
-                            print("---")
-
-    # Sauvegarder les agents
+        series_1 = snapshot.series(base_market)
+        series_2 = snapshot.series(quote_market)
+
+        # S'assurer qu'aucune position similaire n'est déjà ouverte (diversifier le trading)
+        is_base_open = positions.is_open(base_market)
+        is_quote_open = positions.is_open(quote_market)
+
+        # Placer le trade
+        if not is_base_open and not is_quote_open:
+            # Déterminer le côté
+            base_side = "BUY" if z_score < 0 else "SELL"
+            quote_side = "BUY" if z_score > 0 else "SELL"
+
+            # Obtenir les prix acceptables sous forme de chaîne avec le bon nombre de décimales
+            base_price = series_1[-1]
+            quote_price = series_2[-1]
+            accept_base_price = float(base_price) * 1.01 if z_score < 0 else float(base_price) * 0.99
+            accept_quote_price = float(quote_price) * 1.01 if z_score > 0 else float(quote_price) * 0.99
+            failsafe_base_price = float(base_price) * 0.05 if z_score < 0 else float(base_price) * 1.7
+            failsafe_quote_price = float(quote_price) * 0.05 if z_score > 0 else float(quote_price) * 1.7
+            base_tick_size = markets["markets"][base_market]["tickSize"]
+            quote_tick_size = markets["markets"][quote_market]["tickSize"]
+
+            # Formater les prix
+            accept_base_price = format_number(accept_base_price, base_tick_size)
+            accept_quote_price = format_number(accept_quote_price, quote_tick_size)
+            accept_failsafe_base_price = format_number(failsafe_base_price, base_tick_size)
+            accept_failsafe_quote_price = format_number(failsafe_quote_price, quote_tick_size)
+
+            # Obtenir la taille
+            base_quantity = 1 / base_price * USD_PER_TRADE
+            quote_quantity = 1 / quote_price * USD_PER_TRADE
+            base_step_size = markets["markets"][base_market]["stepSize"]
+            quote_step_size = markets["markets"][quote_market]["stepSize"]
+
+            # Formater les tailles
+            base_size = format_number(base_quantity, base_step_size)
+            quote_size = format_number(quote_quantity, quote_step_size)
+
+            # S'assurer de la taille (v4 : pas de minOrderSize, la taille minimale d'un ordre est un stepSize)
+            check_base = float(base_size) >= float(base_step_size)
+            check_quote = float(quote_size) >= float(quote_step_size)
+
+            # Si les vérifications sont validées, placer les trades
+            if check_base and check_quote:
+                # Vérifier le solde du compte
+                account = client.private.get_account()
+                free_collateral = float(account.data["subaccount"]["freeCollateral"])
+                print(f"Solde : {free_collateral} et minimum à {USD_MIN_COLLATERAL}")
+
+                # Vérification : S'assurer du collatéral
+                if free_collateral < USD_MIN_COLLATERAL:
+                    break
+
+                # Ouvrir les deux jambes
+                orders = open_pair(
+                    client,
+                    [
+                        dict(market=base_market, side=base_side, size=base_size, price=accept_base_price),
+                        dict(market=quote_market, side=quote_side, size=quote_size, price=accept_quote_price),
+                    ],
+                    [accept_failsafe_base_price, accept_failsafe_quote_price],
+                )
+
+                # Vérification : Gérer les échecs
+                if orders is None:
+                    continue
+                order_m1, order_m2 = orders
+
+                # Enregistrer la paire dans le journal des trades, avec les prix d'entrée (PnL latent)
+                trade_store.insert({
+                    "market_1": base_market,
+                    "market_2": quote_market,
+                    "hedge_ratio": float(hedge_ratio),
+                    "z_score": z_score,
+                    "half_life": float(half_life),
+                    "order_id_m1": order_m1["id"],
+                    "order_m1_size": order_m1["size"],
+                    "order_m1_side": order_m1["side"],
+                    "order_id_m2": order_m2["id"],
+                    "order_m2_size": order_m2["size"],
+                    "order_m2_side": order_m2["side"],
+                    "entry_price_m1": float(base_price),
+                    "entry_price_m2": float(quote_price),
+                    "pair_status": "LIVE",
+                })
+                positions.mark_open(base_market, base_side, base_size)
+                positions.mark_open(quote_market, quote_side, quote_size)
+
+                # Confirmer le statut live dans le print
+                print("Statut du trade : Live")
+                print("---")
+
     print("Succès : Vérification de la gestion des trades ouverts")
-    if len(bot_agents) > 0:
-        with open("bot_agents.json", "w") as f:
-            json.dump(bot_agents, f)
@@ -1,188 +1,171 @@
-from constants import CLOSE_AT_ZSCORE_CROSS
 from func_utils import format_number
-from func_public import get_candles_recent
-from func_cointegration import calculate_zscore
-from func_private import place_market_order
-import json
+from func_public import get_recent_prices_snapshot, get_markets_data
+from func_zscore_stream import get_zscore_book
+from func_rules import exit_reasons, EXIT_REASON_NAMES
+from func_open_book import get_open_pair_book
+from func_private import place_pair_orders, get_orders, wait_for_orders, PositionBook
+from func_trade_store import get_trade_store
+from func_metrics import timed
 import time
-from pprint import pprint
+import numpy as np
 
-def manage_trade_exits(client):
+@timed("exits")
+def manage_trade_exits(client, snapshot=None, positions=None):
     """
     Gérer les sorties de positions ouvertes selon les critères définis dans constants.
+    Toutes les règles (croisement du z-score, stop temporel, stop-loss, take-profit) sont évaluées
+    en une passe vectorisée sur le carnet des paires ouvertes ; seules les paires à fermer
+    donnent lieu à des appels à l'API.
+    `snapshot` : instantané des prix de la boucle (construit ici s'il n'est pas fourni).
+    `positions` : PositionBook des positions ouvertes de la boucle (récupéré ici s'il n'est pas fourni).
     """
     
-    # Initialiser la sauvegarde de la sortie
-    save_output = []
-
     try:
-        # Ouvrir le fichier JSON des positions ouvertes
-        with open("bot_agents.json") as open_positions_file:
-            open_positions_dict = json.load(open_positions_file)
+        # Charger les paires ouvertes du journal des trades (vue en colonnes, en cache)
+        trade_store = get_trade_store()
+        book = get_open_pair_book(trade_store)
     except Exception as e:
-        print(f"Erreur lors de l'ouverture du fichier bot_agents.json : {e}")
+        print(f"Erreur lors de la lecture du journal des trades : {e}")
         return "complete"
 
-    # Garder: Sortir s'il n'y a pas de positions ouvertes dans le fichier
-    if len(open_positions_dict) < 1:
+    # Garder: Sortir s'il n'y a pas de positions ouvertes dans le journal
+    if len(book) < 1:
         return "complete"
 
     try:
         # Obtenir toutes les positions ouvertes par plateforme de trading
-        exchange_pos = client.private.get_positions(status="OPEN")
-        all_exc_pos = exchange_pos.data["positions"]
-        markets_live = [p["market"] for p in all_exc_pos]
+        if positions is None:
+            positions = PositionBook().refresh(client)
+        markets_live = positions.markets()
     except Exception as e:
         print(f"Erreur lors de la récupération des positions ouvertes : {e}")
         return "complete"
 
-    # Protéger l'API
-    time.sleep(0.5)
-
-    # Vérifier que toutes les positions enregistrées correspondent à l'ordre enregistré
-    # Sortir de la position selon les règles de sortie
-    for position in open_positions_dict:
-        is_close = False
-
-        # Extraire les informations de correspondance de la position du fichier - marché 1
-        position_market_m1 = position["market_1"]
-        position_size_m1 = position["order_m1_size"]
-        position_side_m1 = position["order_m1_side"]
-
-        # Extraire les informations de correspondance de la position du fichier - marché 2
-        position_market_m2 = position["market_2"]
-        position_size_m2 = position["order_m2_size"]
-        position_side_m2 = position["order_m2_side"]
-
-        # Protéger l'API
-        time.sleep(0.5)
+    # Récupérer les prix récents une seule fois par marché
+    if snapshot is None:
+        snapshot = get_recent_prices_snapshot(client, book.markets())
+
+    # Mettre à jour les ZScores de toutes les positions (incrémental, O(1) par position)
+    pairs = book.pairs
+    z_scores = get_zscore_book("exit").update(snapshot, pairs["market_1"], pairs["market_2"], pairs["hedge_ratio"])
+
+    # Évaluer toutes les règles de sortie en une passe
+    price_1, price_2 = book.last_prices(snapshot)
+    pnl, notional = book.unrealized_pnl(price_1, price_2)
+    reasons = exit_reasons(z_scores, pairs["z_traded"], book.elapsed_candles(time.time()), pairs["half_life"], pnl, notional)
+    # Une paire dont une seule jambe est fermée se ferme en priorité, quelles que soient les règles
+    open_1, open_2 = pairs["open_1"], pairs["open_2"]
+    naked = ~(open_1 & open_2)
+    exiting = (reasons > 0) | naked
+    # Sans prix récent pour une jambe ouverte, impossible de fixer un prix d'acceptation : la paire attend la bougie suivante
+    unpriced = exiting & ~((np.isfinite(price_1) | ~open_1) & (np.isfinite(price_2) | ~open_2))
+    if unpriced.any():
+        print(f"{int(unpriced.sum())} paire(s) à fermer sans prix récent, fermeture reportée")
+    to_close = np.flatnonzero(exiting & ~unpriced)
+
+    if len(to_close) == 0:
+        print(f"{len(book)} éléments restants.")
+        return "complete"
 
-        try:
-            # Obtenir les infos de l'ordre m1 par exchange
-            order_m1 = client.private.get_order_by_id(position["order_id_m1"])
-            order_market_m1 = order_m1.data["order"]["market"]
-            order_size_m1 = order_m1.data["order"]["size"]
-            order_side_m1 = order_m1.data["order"]["side"]
-        except Exception as e:
-            print(f"Erreur lors de la récupération de l'ordre pour {position_market_m1} : {e}")
-            continue
+    try:
+        # Récupérer simultanément les ordres des jambes à fermer, et les marchés pour la taille de tick
+        trades = [book.trades[i] for i in to_close]
+        orders = get_orders(client, [t[f"order_id_m{leg}"] for t in trades for leg in (1, 2) if not t.get(f"closed_m{leg}")])
+        markets = get_markets_data(client)
+    except Exception as e:
+        print(f"Erreur lors de la récupération des données de marché : {e}")
+        return "complete"
 
-        # Protéger l'API
-        time.sleep(0.5)
+    # Vérifier que les positions à fermer correspondent à l'ordre enregistré, puis les fermer
+    closed = 0
+    for i, position in zip(to_close, trades):
+        position_markets = f"{position['market_1']} et {position['market_2']}"
+
+        # Jambes encore ouvertes : (jambe, marché, taille, côté, dernier prix)
+        legs = [
+            (leg, position[f"market_{leg}"], position[f"order_m{leg}_size"], position[f"order_m{leg}_side"], price[i])
+            for leg, price in ((1, price_1), (2, price_2))
+            if not position.get(f"closed_m{leg}")
+        ]
+
+        # Une jambe restante absente des positions de la plateforme a été fermée depuis la dernière tentative
+        # (ordre de fermeture exécuté après le délai d'attente) : elle est marquée comme fermée
+        flat = []
+        if naked[i]:
+            flat = [leg for leg, market, _, _, _ in legs if market not in markets_live]
+            legs = [l for l in legs if l[0] not in flat]
+            if not legs:
+                trade_store.close(position["trade_id"])
+                closed += 1
+                continue
 
         try:
-            # Obtenir les infos de l'ordre m2 par exchange
-            order_m2 = client.private.get_order_by_id(position["order_id_m2"])
-            order_market_m2 = order_m2.data["order"]["market"]
-            order_size_m2 = order_m2.data["order"]["size"]
-            order_side_m2 = order_m2.data["order"]["side"]
+            # Obtenir les infos des ordres par exchange
+            opening_orders = [orders[position[f"order_id_m{leg}"]] for leg, _, _, _, _ in legs]
         except Exception as e:
-            print(f"Erreur lors de la récupération de l'ordre pour {position_market_m2} : {e}")
+            print(f"Erreur lors de la récupération des ordres pour {position_markets} : {e}")
             continue
 
-        # Effectuer les vérifications de correspondance
-        check_m1 = position_market_m1 == order_market_m1 and position_size_m1 == order_size_m1 and position_side_m1 == order_side_m1
-        check_m2 = position_market_m2 == order_market_m2 and position_size_m2 == order_size_m2 and position_side_m2 == order_side_m2
-        check_live = position_market_m1 in markets_live and position_market_m2 in markets_live
+        # Effectuer les vérifications de correspondance (l'indexer renvoie les tailles sans zéros finaux)
+        check = all(
+            market == order["market"] and float(size) == float(order["size"]) and side == order["side"]
+            for (_, market, size, side, _), order in zip(legs, opening_orders)
+        )
+        check_live = all(market in markets_live for _, market, _, _, _ in legs)
 
         # Garder: Si tous ne correspondent pas, sortir avec une erreur
-        if not check_m1 or not check_m2 or not check_live:
-            print(f"Warning: Not all open positions match exchange records for {position_market_m1} and {position_market_m2}")
+        if not check or not check_live:
+            print(f"Warning: Not all open positions match exchange records for {position_markets}")
             continue
 
         try:
-            # Obtenir les prix
-            series_1 = get_candles_recent(client, position_market_m1)
-            time.sleep(0.2)
-            series_2 = get_candles_recent(client, position_market_m2)
-            time.sleep(0.2)
-
-            # Obtenir les marchés pour référence de la taille de tick
-            markets = client.public.get_markets().data
-            time.sleep(0.2)
+            # Ordres de fermeture : côté opposé, prix d'acceptation à 5 % du dernier prix
+            close_legs = []
+            for _, market, size, side, price in legs:
+                close_side = "SELL" if side == "BUY" else "BUY"
+                accept_price = price * 1.05 if close_side == "BUY" else price * 0.95
+                close_legs.append(dict(
+                    market=market,
+                    side=close_side,
+                    size=size,
+                    price=format_number(float(accept_price), markets["markets"][market]["tickSize"]),
+                    reduce_only=True,
+                ))
+
+            # Fermer les jambes ouvertes simultanément
+            reason = EXIT_REASON_NAMES[reasons[i]] if reasons[i] else "jambe restante"
+            print(">>> Fermeture des marchés 1 et 2 <<<")
+            print(f"Fermeture des positions pour {position_markets} ({reason})")
+            close_orders = place_pair_orders(client, close_legs)
+
+            # Attendre que l'indexer confirme l'exécution des ordres FOK envoyés
+            close_ids = [order["order"]["id"] for order in close_orders if order is not None]
+            fills = wait_for_orders(client, close_ids)
+            filled = set()
+            for (leg, market, _, _, _), order in zip(legs, close_orders):
+                status = fills.get(order["order"]["id"], {}).get("status") if order is not None else None
+                print(f"{market} : {order['order']['id'] if order is not None else 'ordre refusé'} ({status})")
+                if status == "FILLED":
+                    positions.mark_closed(market)
+                    filled.add(leg)
+            print(">>> Fermeture <<<")
         except Exception as e:
-            print(f"Erreur lors de la récupération des données de marché : {e}")
+            print(f"Échec de la sortie pour {position_markets} : {e}")
             continue
 
-        if CLOSE_AT_ZSCORE_CROSS:
-            try:
-                # Initialiser les z_scores
-                hedge_ratio = position["hedge_ratio"]
-                z_score_traded = position["z_score"]
-                if len(series_1) > 0 and len(series_1) == len(series_2):
-                    spread = series_1 - (hedge_ratio * series_2)
-                    z_score_current = calculate_zscore(spread).values.tolist()[-1]
-
-                # Déterminer le déclencheur
-                z_score_level_check = abs(z_score_current) >= abs(z_score_traded)
-                z_score_cross_check = (z_score_current < 0 and z_score_traded > 0) or (z_score_current > 0 and z_score_traded < 0)
-
-                # Fermer la position
-                if z_score_level_check and z_score_cross_check:
-                    is_close = True
-            except Exception as e:
-                print(f"Erreur lors du calcul du Z-Score : {e}")
-                continue
-
-        # Ajouter toute autre logique de fermeture ici
-
-        if is_close:
-            try:
-                # Déterminer le côté - m1
-                side_m1 = "SELL" if position_side_m1 == "BUY" else "BUY"
-
-                # Déterminer le côté - m2
-                side_m2 = "SELL" if position_side_m2 == "BUY" else "BUY"
-
-                # Obtenir et formater le prix
-                price_m1 = float(series_1[-1])
-                price_m2 = float(series_2[-1])
-                accept_price_m1 = price_m1 * 1.05 if side_m1 == "BUY" else price_m1 * 0.95
-                accept_price_m2 = price_m2 * 1.05 if side_m2 == "BUY" else price_m2 * 0.95
-                tick_size_m1 = markets["markets"][position_market_m1]["tickSize"]
-                tick_size_m2 = markets["markets"][position_market_m2]["tickSize"]
-                accept_price_m1 = format_number(accept_price_m1, tick_size_m1)
-                accept_price_m2 = format_number(accept_price_m2, tick_size_m2)
-
-                # Fermer les positions pour le marché 1
-                print(">>> Fermeture du marché 1 <<<")
-                print(f"Fermeture de la position pour {position_market_m1}")
-                close_order_m1 = place_market_order(
-                    client,
-                    market=position_market_m1,
-                    side=side_m1,
-                    size=position_size_m1,
-                    price=accept_price_m1,
-                    reduce_only=True,
-                )
-                print(close_order_m1["order"]["id"])
-                print(">>> Fermeture <<<")
-
-                time.sleep(1)
-
-                # Fermer les positions pour le marché 2
-                print(">>> Fermeture du marché 2 <<<")
-                print(f"Fermeture de la position pour {position_market_m2}")
-                close_order_m2 = place_market_order(
-                    client,
-                    market=position_market_m2,
-                    side=side_m2,
-                    size=position_size_m2,
-                    price=accept_price_m2,
-                    reduce_only=True,
-                )
-                print(close_order_m2["order"]["id"])
-                print(">>> Fermeture <<<")
-            except Exception as e:
-                print(f"Échec de la sortie pour {position_market_m1} et {position_market_m2} : {e}")
-                save_output.append(position)
+        # La paire n'est fermée dans le journal que lorsque ses deux jambes sont fermées ;
+        # sinon les jambes fermées y sont notées et seule la jambe restante est fermée au prochain passage
+        still_open = [market for leg, market, _, _, _ in legs if leg not in filled]
+        if not still_open:
+            trade_store.close(position["trade_id"])
+            closed += 1
         else:
-            save_output.append(position)
+            done = [leg for leg in (1, 2) if position.get(f"closed_m{leg}") or leg in filled or leg in flat]
+            if done:
+                trade_store.update(position["trade_id"], {f"closed_m{leg}": True for leg in done})
+            print(f"Warning: {', '.join(still_open)} toujours ouvert(s) pour {position_markets}, nouvelle tentative au prochain passage")
 
-    # Sauvegarder les éléments restants
-    print(f"{len(save_output)} éléments restants. Sauvegarde du fichier...")
-    with open("bot_agents.json", "w") as f:
-        json.dump(save_output, f)
+    print(f"{len(book) - closed} éléments restants.")
 
 # Améliorations et clarifications ajoutées:
 # - Gestion des erreurs avec try-except
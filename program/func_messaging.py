@@ -1,13 +1,152 @@
+import atexit
+import queue
+import threading
+import time
 import requests
 from decouple import config
+from requests.adapters import HTTPAdapter
+
+from constants import (
+  NOTIFY_API_URL,
+  NOTIFY_QUEUE_SIZE,
+  NOTIFY_TIMEOUT,
+  NOTIFY_COALESCE_WINDOW,
+  NOTIFY_RATE,
+  NOTIFY_BURST,
+)
+from func_rate_limit import TokenBucket
+
+
+class Notifier:
+  """
+    Envoi des messages Telegram par un thread d'arrière-plan.
+
+    `send` ne fait que placer le message dans une file bornée : O(1), jamais bloquant
+    (le message est abandonné si la file est pleine). Le thread envoie les messages avec une
+    session HTTP persistante, des délais d'attente et un débit limité. Un message identique
+    reçu pendant `window` secondes après son premier envoi n'est pas renvoyé : il est compté,
+    puis résumé en un seul message à la fin de la fenêtre.
+  """
+
+  def __init__(self, token, chat_id, api_url=NOTIFY_API_URL, maxsize=NOTIFY_QUEUE_SIZE, timeout=NOTIFY_TIMEOUT,
+               window=NOTIFY_COALESCE_WINDOW, rate=NOTIFY_RATE, burst=NOTIFY_BURST):
+    self.url = f"{api_url}/bot{token}/sendMessage"
+    self.chat_id = chat_id
+    self.timeout = timeout
+    self.window = window
+    self.limiter = TokenBucket(rate, burst)
+    self.queue = queue.Queue(maxsize)
+    self.recent = {}
+    self.dropped = 0
+    self.sent = 0
+    self.failed = 0
+    self._lock = threading.Lock()
+    self._thread = None
+
+    self.session = requests.Session()
+    self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+    self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+  def start(self):
+    self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+    self._thread.start()
+    return self
+
+  def send(self, message):
+    """
+      Returns:
+      str: "queued", "coalesced" (doublon récent, compté) ou "dropped" (file pleine).
+    """
+    now = time.monotonic()
+    with self._lock:
+      entry = self.recent.get(message)
+      if entry is not None and now - entry[0] < self.window:
+        entry[1] += 1
+        return "coalesced"
+      self.recent[message] = [now, 0]
+    return self._enqueue(message)
+
+  def _enqueue(self, message):
+    try:
+      self.queue.put_nowait(message)
+      return "queued"
+    except queue.Full:
+      self.dropped += 1
+      return "dropped"
+
+  def _flush_recent(self):
+    # Résumer les doublons dont la fenêtre est terminée
+    now = time.monotonic()
+    with self._lock:
+      expired = [(message, entry[1]) for message, entry in self.recent.items() if now - entry[0] >= self.window]
+      for message, _ in expired:
+        del self.recent[message]
+    for message, repeats in expired:
+      if repeats > 0:
+        self._enqueue(f"{message} (répété {repeats} fois en {self.window:g} s)")
+
+  def _post(self, message):
+    self.limiter.acquire_blocking()
+    try:
+      res = self.session.post(self.url, data={"chat_id": self.chat_id, "text": message}, timeout=self.timeout)
+      if res.status_code == 200:
+        self.sent += 1
+        return "sent"
+      print(f"Échec de l'envoi du message ({res.status_code})")
+    except requests.RequestException as e:
+      print(f"Échec de l'envoi du message : {e}")
+    self.failed += 1
+    return "failed"
+
+  def _run(self):
+    while True:
+      try:
+        message = self.queue.get(timeout=1)
+      except queue.Empty:
+        self._flush_recent()
+        continue
+      try:
+        self._post(message)
+      finally:
+        self.queue.task_done()
+      self._flush_recent()
+
+  def flush(self, timeout=5):
+    """
+      Attendre (au plus `timeout` secondes) que les messages en file soient envoyés.
+    """
+    deadline = time.monotonic() + timeout
+    while self.queue.unfinished_tasks and time.monotonic() < deadline:
+      time.sleep(0.05)
+
+
+# Notificateur du processus, créé au premier message
+_NOTIFIER = None
+_NOTIFIER_LOCK = threading.Lock()
+
+
+def get_notifier():
+  global _NOTIFIER
+  if _NOTIFIER is None:
+    with _NOTIFIER_LOCK:
+      if _NOTIFIER is None:
+        notifier = Notifier(config("TELEGRAM_TOKEN"), config("TELEGRAM_CHAT_ID")).start()
+        # Laisser partir les derniers messages (par exemple avant un exit(1))
+        atexit.register(notifier.flush)
+        _NOTIFIER = notifier
+  return _NOTIFIER
+
 
 # Send Message
 def send_message(message):
-  bot_token = config("TELEGRAM_TOKEN")
-  chat_id = config("TELEGRAM_CHAT_ID")
-  url = f"https://api.telegram.org/bot{bot_token}/sendMessage?chat_id={chat_id}&text={message}"
-  res = requests.get(url)
-  if res.status_code == 200:
-    return "sent"
-  else:
+  """
+    Envoyer un message Telegram sans bloquer l'appelant.
+
+    Returns:
+    str: "queued", "coalesced", "dropped" ou "failed" (configuration Telegram absente).
+  """
+  try:
+    return get_notifier().send(str(message))
+  except Exception as e:
+    print(f"Notification impossible : {e}")
     return "failed"
@@ -0,0 +1,251 @@
+import bisect
+import functools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from constants import METRICS_ENABLED, METRICS_HOST, METRICS_PORT
+
+# Préfixe des métriques exposées
+PREFIX = "dydx_bot"
+
+# Bornes supérieures des seaux des histogrammes de latence (secondes)
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+# Aide de chaque métrique, pour l'export Prometheus
+HELP = {
+    "api_call_seconds": ("histogram", "Latence des appels au client dYdX par endpoint"),
+    "api_calls_total": ("counter", "Appels au client dYdX par endpoint"),
+    "api_errors_total": ("counter", "Appels au client dYdX en erreur par endpoint"),
+    "stage_seconds": ("histogram", "Durée des étapes du pipeline"),
+    "task_seconds": ("histogram", "Durée d'une exécution de chaque tâche planifiée"),
+    "task_errors_total": ("counter", "Exécutions en erreur de chaque tâche planifiée"),
+    "rate_limit_wait_seconds": ("histogram", "Attente imposée par le limiteur de débit de l'indexer"),
+}
+
+
+class Histogram:
+    """
+    Histogramme à seaux fixes (BUCKETS), avec somme et nombre d'observations.
+    """
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Quantile approché : borne supérieure du seau qui le contient.
+        """
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class MetricsRegistry:
+    """
+    Compteurs et histogrammes du processus, indexés par (nom, étiquettes).
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def render(self):
+        """
+        Export au format texte de Prometheus.
+        """
+        lines = []
+        with self._lock:
+            for name in HELP:
+                kind, text = HELP[name]
+                counters = [(labels, v) for (n, labels), v in self.counters.items() if n == name]
+                histograms = [(labels, h) for (n, labels), h in self.histograms.items() if n == name]
+                if not counters and not histograms:
+                    continue
+                lines.append(f"# HELP {PREFIX}_{name} {text}")
+                lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+                for labels, value in sorted(counters):
+                    lines.append(f"{PREFIX}_{name}{_labels(labels)} {value}")
+                for labels, histogram in sorted(histograms, key=lambda item: item[0]):
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{PREFIX}_{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{PREFIX}_{name}_sum{_labels(labels)} {histogram.total}")
+                    lines.append(f"{PREFIX}_{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Résumé sur une ligne : appels et erreurs de l'API, puis durée moyenne et p95 de chaque étape et tâche.
+        """
+        with self._lock:
+            calls = sum(v for (n, _), v in self.counters.items() if n == "api_calls_total")
+            errors = sum(v for (n, _), v in self.counters.items() if n == "api_errors_total")
+            parts = [f"api {calls} calls / {errors} errors"]
+            for (name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                if name not in ("stage_seconds", "task_seconds") or histogram.count == 0:
+                    continue
+                label = ",".join(str(v) for _, v in labels)
+                parts.append(f"{label} n={histogram.count} avg={histogram.total / histogram.count:.3f}s p95<={histogram.quantile(0.95)}s")
+        return "Metrics: " + " | ".join(parts)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def inc(name, value=1, **labels):
+    if METRICS_ENABLED:
+        REGISTRY.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    if METRICS_ENABLED:
+        REGISTRY.observe(name, value, **labels)
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        REGISTRY.observe("stage_seconds", time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+def timed(stage):
+    """
+    Décorateur mesurant chaque appel de la fonction comme une étape.
+    Métriques désactivées : la fonction est retournée telle quelle, sans aucun surcoût.
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _StageTimer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _InstrumentedNamespace:
+    """
+    Enveloppe de `client.public` / `client.private` : chaque méthode appelée est chronométrée
+    et comptée (appels et erreurs) sous l'étiquette endpoint="<espace>.<méthode>".
+    """
+
+    def __init__(self, target, prefix):
+        self._target = target
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        endpoint = f"{self._prefix}.{name}"
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            except Exception:
+                REGISTRY.inc("api_errors_total", endpoint=endpoint)
+                raise
+            finally:
+                REGISTRY.inc("api_calls_total", endpoint=endpoint)
+                REGISTRY.observe("api_call_seconds", time.perf_counter() - start, endpoint=endpoint)
+
+        # Les appels suivants évitent __getattr__
+        self.__dict__[name] = call
+        return call
+
+
+def instrument_client(client):
+    """
+    Chronométrer tous les appels du client (sans effet si les métriques sont désactivées).
+    """
+    if not METRICS_ENABLED:
+        return client
+    for namespace in ("public", "private"):
+        target = getattr(client, namespace, None)
+        if target is not None and not isinstance(target, _InstrumentedNamespace):
+            setattr(client, namespace, _InstrumentedNamespace(target, namespace))
+    return client
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """
+    Servir /metrics au format Prometheus dans un thread d'arrière-plan.
+
+    Returns:
+    ThreadingHTTPServer: Le serveur (None si désactivé).
+    """
+    if not METRICS_ENABLED or port is None:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Métriques disponibles sur http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def log_metrics_summary():
+    print(REGISTRY.summary())
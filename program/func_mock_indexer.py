@@ -0,0 +1,338 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from enum import Enum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from func_utils import resolution_seconds
+
+# Nombre de bougies synthétiques par marché (la série boucle au-delà)
+MOCK_HISTORY = 8192
+
+# Adresse du portefeuille des clients du faux indexer
+MOCK_ADDRESS = "dydx1mock0000000000000000000000000000000000"
+
+# Énumérations des ordres, mêmes noms que celles de v4_client_py (chain_helpers)
+MOCK_ORDER_ENUMS = SimpleNamespace(
+    OrderType=Enum("OrderType", {name: name for name in ("MARKET", "LIMIT", "STOP_MARKET", "TAKE_PROFIT_MARKET")}),
+    OrderSide=Enum("OrderSide", {name: name for name in ("BUY", "SELL")}),
+    OrderTimeInForce=Enum("OrderTimeInForce", {name: name for name in ("GTT", "IOC", "FOK")}),
+    OrderExecution=Enum("OrderExecution", {name: name for name in ("DEFAULT", "IOC", "FOK", "POST_ONLY")}),
+)
+
+
+def _decimal(value):
+    """
+    Nombre au format des réponses de l'indexer ("0.01", "-1.5", "3").
+    """
+    return f"{Decimal(str(value)).normalize():f}"
+
+
+class MockIndexer:
+    """
+    Faux exchange dYdX v4 pour les benchmarks et les tests hors ligne.
+
+    L'API REST de l'indexer est servie en HTTP local (`start`, URL dans `url`) avec les chemins et
+    les réponses de l'indexer v4 : /perpetualMarkets, /candles/perpetualMarkets/{ticker},
+    /addresses/{address}/subaccountNumber/{n}, /perpetualPositions et /orders. Le bot y accède
+    par son propre client (`client()` : un `DydxV4Client` et son `IndexerTransport`), comme en réel.
+    Le faux indexer tient aussi le rôle du CompositeClient (`place_order`, `cancel_order`) : un
+    ordre est exécuté immédiatement et apparaît ensuite dans /orders et /perpetualPositions.
+
+    Les bougies sont synthétiques et déterministes (graine fixe) : les marchés sont répartis en
+    `n_groups` groupes qui partagent une tendance commune (donc cointégrés entre eux), les autres
+    suivent des marches aléatoires indépendantes. Chaque requête attend `latency` secondes, et la
+    limite de `rate_limit` requêtes par `rate_window` secondes renvoie un statut 429 si elle est
+    dépassée. Les requêtes sont comptées par endpoint. Comme sur l'exchange, les positions et les
+    ordres sont séparés par adresse et numéro de subcompte.
+    """
+
+    def __init__(
+        self,
+        n_markets=50,
+        n_groups=5,
+        group_size=4,
+        latency=0.0,
+        jitter=0.0,
+        rate_limit=None,
+        rate_window=10.0,
+        resolution="1HOUR",
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.step = resolution_seconds(resolution)
+        self.resolution = resolution
+        self.markets = [f"MOCK{i:03d}-USD" for i in range(n_markets)]
+        self.rows = {market: row for row, market in enumerate(self.markets)}
+        self.calls = {}
+        self.errors = {}
+        self._requests = deque()
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(seed)
+
+        self.prices = self._generate_prices(n_markets, n_groups, group_size)
+        self.positions = {}  # (adresse, subcompte) -> marché -> position
+        self.orders = {}     # (adresse, subcompte) -> ordres, du plus récent au plus ancien
+        self.n_orders = 0
+        self.server = None
+        self.url = None
+
+        self.routes = [
+            (re.compile(r"/v4/perpetualMarkets$"), "get_markets", self.get_markets),
+            (re.compile(r"/v4/candles/perpetualMarkets/([^/]+)$"), "get_candles", self.get_candles),
+            (re.compile(r"/v4/addresses/([^/]+)/subaccountNumber/(\d+)$"), "get_subaccount", self.get_subaccount),
+            (re.compile(r"/v4/perpetualPositions$"), "get_positions", self.get_positions),
+            (re.compile(r"/v4/orders$"), "get_orders", self.get_orders),
+        ]
+
+    def _generate_prices(self, n_markets, n_groups, group_size):
+        rng = np.random.default_rng(self._rng.integers(1 << 32))
+        prices = np.empty((n_markets, MOCK_HISTORY), dtype=np.float64)
+        n_grouped = min(n_markets, n_groups * group_size)
+        trends = np.cumsum(rng.normal(scale=0.01, size=(max(n_groups, 1), MOCK_HISTORY)), axis=1)
+
+        # Écarts stationnaires AR(1) des marchés groupés, calculés pour tous les marchés à la fois
+        noise = rng.normal(scale=0.005, size=(n_grouped, MOCK_HISTORY))
+        for t in range(1, MOCK_HISTORY):
+            noise[:, t] += 0.9 * noise[:, t - 1]
+
+        for i in range(n_markets):
+            level = 10 ** rng.uniform(-1, 4)
+            if i < n_grouped:
+                # Tendance du groupe plus un écart stationnaire
+                log_price = trends[i % n_groups] * rng.uniform(0.5, 1.5) + noise[i]
+            else:
+                log_price = np.cumsum(rng.normal(scale=0.01, size=MOCK_HISTORY))
+            prices[i] = level * np.exp(log_price)
+        return prices
+
+    # --- Serveur ---
+
+    def start(self):
+        """
+        Servir l'API REST dans un thread d'arrière-plan.
+        """
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _MockHandler)
+        self.server.daemon_threads = True
+        self.server.indexer = self
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v4"
+        threading.Thread(target=self.server.serve_forever, name="mock-indexer", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def client(self, subaccount_number=0, address=MOCK_ADDRESS):
+        """
+        Client du bot pour un subcompte du faux exchange.
+
+        Returns:
+        DydxV4Client: Le client, avec son propre transport vers `url`.
+        """
+        from func_transport import IndexerTransport
+        from func_v4_client import DydxV4Client
+
+        wallet = SimpleNamespace(address=lambda: address)
+        subaccount = SimpleNamespace(wallet=wallet, subaccount_number=subaccount_number)
+        return DydxV4Client(self, subaccount, transport=IndexerTransport(self.url), enums=MOCK_ORDER_ENUMS)
+
+    def handle(self, path, params):
+        """
+        Traiter une requête GET : comptage, limite de débit, latence puis réponse.
+
+        Returns:
+        tuple: (statut HTTP, corps JSON).
+        """
+        for pattern, name, func in self.routes:
+            match = pattern.match(path)
+            if match is None:
+                continue
+            if not self._count(name):
+                return 429, {"errors": [{"msg": "Too many requests"}]}
+            try:
+                return 200, func(*match.groups(), **params)
+            except (KeyError, ValueError, TypeError) as e:
+                return 400, {"errors": [{"msg": str(e)}]}
+        return 404, {"errors": [{"msg": f"{path} not found"}]}
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                while self._requests and now - self._requests[0] > self.rate_window:
+                    self._requests.popleft()
+                if len(self._requests) >= self.rate_limit:
+                    self.errors[name] = self.errors.get(name, 0) + 1
+                    return False
+                self._requests.append(now)
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = {}
+            self.errors = {}
+
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def price(self, market, epoch):
+        row = self.rows[market]
+        return float(self.prices[row, (epoch // self.step) % MOCK_HISTORY])
+
+    # --- Indexer ---
+
+    def get_markets(self):
+        markets = {}
+        for row, market in enumerate(self.markets):
+            price = self.prices[row, (int(time.time()) // self.step) % MOCK_HISTORY]
+            tick = 10.0 ** (np.floor(np.log10(price)) - 4)
+            step = 10.0 ** (np.floor(np.log10(1000 / price)) - 2)
+            markets[market] = {
+                "clobPairId": str(row),
+                "ticker": market,
+                "status": "ACTIVE",
+                "oraclePrice": f"{price:.6f}",
+                "tickSize": f"{tick:g}",
+                "stepSize": f"{step:g}",
+                "atomicResolution": -9,
+                "marketType": "CROSS",
+            }
+        return {"markets": markets}
+
+    def get_candles(self, market, resolution, fromISO=None, toISO=None, limit=100):
+        row = self.rows[market]
+        now = int(time.time())
+        to_epoch = _parse_iso(toISO) if toISO else now
+        from_epoch = _parse_iso(fromISO) if fromISO else None
+        last = min(to_epoch, now) // self.step * self.step
+
+        candles = []
+        for k in range(int(limit)):
+            epoch = last - k * self.step
+            if from_epoch is not None and epoch < from_epoch:
+                break
+            close = self.prices[row, (epoch // self.step) % MOCK_HISTORY]
+            open_ = self.prices[row, (epoch // self.step - 1) % MOCK_HISTORY]
+            candles.append({
+                "startedAt": datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "ticker": market,
+                "resolution": resolution,
+                "low": f"{min(open_, close) * 0.999:.6f}",
+                "high": f"{max(open_, close) * 1.001:.6f}",
+                "open": f"{open_:.6f}",
+                "close": f"{close:.6f}",
+                "baseTokenVolume": "1000",
+                "usdVolume": f"{close * 1000:.2f}",
+                "trades": 100,
+                "startingOpenInterest": "5000",
+            })
+        return {"candles": candles}
+
+    def get_subaccount(self, address, subaccount_number):
+        positions = self.positions.get((address, int(subaccount_number)), {})
+        return {"subaccount": {
+            "address": address,
+            "subaccountNumber": int(subaccount_number),
+            "equity": "1000000",
+            "freeCollateral": "1000000",
+            "openPerpetualPositions": dict(positions),
+            "assetPositions": {},
+            "marginEnabled": True,
+        }}
+
+    def get_positions(self, address, subaccountNumber, status=None, limit=None):
+        positions = self.positions.get((address, int(subaccountNumber)), {}).values()
+        return {"positions": [p for p in positions if status is None or p["status"] == status]}
+
+    def get_orders(self, address, subaccountNumber, ticker=None, status=None, limit=None, returnLatestOrders=None):
+        orders = self.orders.get((address, int(subaccountNumber)), [])
+        return [o for o in orders if (ticker is None or o["ticker"] == ticker) and (status is None or o["status"] == status)]
+
+    # --- CompositeClient ---
+
+    def place_order(self, subaccount, market, type, side, price, size, client_id, time_in_force,
+                    good_til_time_in_seconds, execution, post_only, reduce_only):
+        self._count("place_order")
+        key = (subaccount.wallet.address(), subaccount.subaccount_number)
+        side = side.name
+        with self._lock:
+            self.n_orders += 1
+            order = {
+                "id": f"{self.n_orders:08x}-0000-5000-8000-000000000000",
+                "subaccountNumber": key[1],
+                "clientId": str(client_id),
+                "clobPairId": str(self.rows[market]),
+                "side": side,
+                "size": _decimal(size),
+                "totalFilled": _decimal(size),
+                "price": _decimal(price),
+                "type": type.name,
+                "status": "FILLED",
+                "timeInForce": time_in_force.name,
+                "reduceOnly": reduce_only,
+                "orderFlags": "0",
+                "goodTilBlock": "1000",
+                "ticker": market,
+            }
+            self.orders.setdefault(key, []).insert(0, order)
+            positions = self.positions.setdefault(key, {})
+            if reduce_only:
+                positions.pop(market, None)
+            else:
+                positions[market] = {
+                    "market": market,
+                    "status": "OPEN",
+                    "side": "LONG" if side == "BUY" else "SHORT",
+                    "size": _decimal(size if side == "BUY" else -size),
+                    "maxSize": _decimal(size),
+                    "entryPrice": _decimal(price),
+                    "subaccountNumber": key[1],
+                }
+        return f"mock-tx-{self.n_orders}"
+
+    def cancel_order(self, subaccount, client_id, market, order_flags, good_til_time_in_seconds, good_til_block):
+        self._count("cancel_order")
+        for order in self.orders.get((subaccount.wallet.address(), subaccount.subaccount_number), []):
+            if order["clientId"] == str(client_id) and order["status"] == "OPEN":
+                order["status"] = "CANCELED"
+        return f"mock-tx-cancel-{client_id}"
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    # Connexions persistantes, comme l'indexer derrière le pool du transport
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, payload = self.server.indexer.handle(url.path, params)
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _parse_iso(iso):
+    return int(datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp())
@@ -0,0 +1,113 @@
+import numpy as np
+
+from constants import RESOLUTION
+from func_trade_store import get_trade_store
+from func_utils import resolution_seconds
+
+# Une ligne par paire ouverte ; les tailles sont signées (+ achat, - vente)
+OPEN_PAIR_DTYPE = np.dtype([
+    ("trade_id", np.int64),
+    ("market_1", "U32"),
+    ("market_2", "U32"),
+    ("hedge_ratio", np.float64),
+    ("z_traded", np.float64),
+    ("half_life", np.float64),
+    ("opened_at", np.float64),
+    ("entry_price_1", np.float64),
+    ("entry_price_2", np.float64),
+    ("size_1", np.float64),
+    ("size_2", np.float64),
+    ("open_1", np.bool_),
+    ("open_2", np.bool_),
+])
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class OpenPairBook:
+    """
+    Vue en colonnes des paires ouvertes du journal des trades.
+
+    `pairs` est un tableau structuré OPEN_PAIR_DTYPE (une ligne par paire, dans l'ordre de
+    `trades`) ; les règles de sortie l'évaluent en une seule passe vectorisée. `trades` garde
+    les dictionnaires BotAgent, utilisés seulement pour les paires à fermer.
+    Les paires ouvertes avant l'enregistrement des prix d'entrée ont des prix NaN :
+    le take-profit ne s'applique pas à elles.
+    `open_1` / `open_2` sont faux pour une jambe déjà fermée alors que l'autre ne l'est pas encore.
+    """
+
+    def __init__(self, trades, resolution=RESOLUTION):
+        self.trades = trades
+        self.step = resolution_seconds(resolution)
+        self.pairs = np.empty(len(trades), dtype=OPEN_PAIR_DTYPE)
+        self._rows = (None, None)
+
+        columns = {name: [] for name in OPEN_PAIR_DTYPE.names}
+        for trade in trades:
+            columns["trade_id"].append(trade["trade_id"])
+            columns["market_1"].append(trade["market_1"])
+            columns["market_2"].append(trade["market_2"])
+            columns["hedge_ratio"].append(_float(trade.get("hedge_ratio")))
+            columns["z_traded"].append(_float(trade.get("z_score")))
+            columns["half_life"].append(_float(trade.get("half_life")))
+            columns["opened_at"].append(_float(trade.get("opened_at")))
+            columns["entry_price_1"].append(_float(trade.get("entry_price_m1")))
+            columns["entry_price_2"].append(_float(trade.get("entry_price_m2")))
+            columns["size_1"].append(_float(trade.get("order_m1_size")) * (1 if trade.get("order_m1_side") == "BUY" else -1))
+            columns["size_2"].append(_float(trade.get("order_m2_size")) * (1 if trade.get("order_m2_side") == "BUY" else -1))
+            columns["open_1"].append(not trade.get("closed_m1"))
+            columns["open_2"].append(not trade.get("closed_m2"))
+        for name, values in columns.items():
+            self.pairs[name] = values
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def markets(self):
+        return list(self.pairs["market_1"]) + list(self.pairs["market_2"])
+
+    def last_prices(self, snapshot):
+        """
+        Dernier prix de chaque jambe dans l'instantané (NaN si le marché en est absent).
+        Les lignes de l'instantané sont mises en cache tant que l'instantané est le même.
+        """
+        if self._rows[0] is not snapshot:
+            self._rows = (snapshot, (snapshot.rows(self.pairs["market_1"]), snapshot.rows(self.pairs["market_2"])))
+        rows_1, rows_2 = self._rows[1]
+        last = snapshot.prices[:, -1]
+        if len(last) == 0:
+            return np.full(len(self), np.nan), np.full(len(self), np.nan)
+        return np.where(rows_1 >= 0, last[rows_1], np.nan), np.where(rows_2 >= 0, last[rows_2], np.nan)
+
+    def unrealized_pnl(self, price_1, price_2):
+        """
+        Returns:
+        tuple: (PnL latent en USD, notionnel d'entrée) de chaque paire.
+        """
+        pairs = self.pairs
+        pnl = pairs["size_1"] * (price_1 - pairs["entry_price_1"]) + pairs["size_2"] * (price_2 - pairs["entry_price_2"])
+        notional = np.abs(pairs["size_1"]) * pairs["entry_price_1"] + np.abs(pairs["size_2"]) * pairs["entry_price_2"]
+        return pnl, notional
+
+    def elapsed_candles(self, now):
+        return (now - self.pairs["opened_at"]) / self.step
+
+
+# Cache du processus : (journal, génération, OpenPairBook)
+_BOOK_CACHE = [None, None, None]
+
+
+def get_open_pair_book(trade_store=None):
+    """
+    OpenPairBook des paires ouvertes, reconstruit seulement quand le journal des trades a changé.
+    """
+    trade_store = trade_store or get_trade_store()
+    if _BOOK_CACHE[0] is not trade_store or _BOOK_CACHE[1] != trade_store.generation:
+        generation = trade_store.generation
+        _BOOK_CACHE[:] = [trade_store, generation, OpenPairBook(trade_store.open_trades())]
+    return _BOOK_CACHE[2]
@@ -0,0 +1,128 @@
+import os
+import time
+import zlib
+import numpy as np
+
+from constants import COINT_RESULTS_FILE, COINT_RESULTS_VERSION
+from func_open_book import get_open_pair_book
+from func_metrics import timed
+
+# Une ligne par paire cointégrée
+PAIRS_DTYPE = np.dtype([
+    ("base_market", "U32"),
+    ("quote_market", "U32"),
+    ("hedge_ratio", np.float64),
+    ("half_life", np.float64),
+    ("p_value", np.float64),
+    ("t_stat", np.float64),
+])
+
+# Cache du processus : (mtime, DataFrame)
+_PAIRS_CACHE = {}
+
+# Part des paires traitée par ce processus : (numéro, nombre de parts)
+_PAIR_SHARD = (0, 1)
+
+
+def pair_shard(base_market, quote_market, shards):
+    """
+    Part d'une paire : stable d'un processus à l'autre et d'une re-cointégration à l'autre.
+    """
+    return zlib.crc32(f"{base_market}/{quote_market}".encode()) % shards
+
+
+def set_pair_shard(shard, shards):
+    """
+    Ne garder, dans `load_cointegrated_pairs`, que les paires de la part `shard` sur `shards`.
+    """
+    global _PAIR_SHARD
+    _PAIR_SHARD = (shard, shards)
+    _PAIRS_CACHE.clear()
+
+
+@timed("pairs_save")
+def save_cointegrated_pairs(results, markets, index, path=COINT_RESULTS_FILE):
+    """
+    Écrire les paires cointégrées dans un fichier NumPy versionné et typé.
+
+    Parameters:
+    results (np.ndarray): Lignes COINT_DTYPE retenues par `store_cointegration_results`.
+    markets (list): Noms des marchés, indexés par les champs base / quote.
+    index (pd.DatetimeIndex): Index des prix utilisés, pour les bornes de la fenêtre.
+    path (str): Fichier de destination.
+    """
+    pairs = np.empty(len(results), dtype=PAIRS_DTYPE)
+    pairs["base_market"] = [markets[i] for i in results["base"]]
+    pairs["quote_market"] = [markets[i] for i in results["quote"]]
+    for field in ("hedge_ratio", "half_life", "p_value", "t_stat"):
+        pairs[field] = results[field]
+
+    window = index.values.astype("datetime64[s]").astype(np.int64) if len(index) > 0 else np.zeros(1, dtype=np.int64)
+
+    # Écriture atomique : fichier temporaire puis remplacement
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            version=np.int32(COINT_RESULTS_VERSION),
+            pairs=pairs,
+            window_start=np.int64(window[0]),
+            window_end=np.int64(window[-1]),
+            computed_at=np.int64(time.time()),
+        )
+    os.replace(tmp_path, path)
+
+
+def load_cointegrated_pairs(path=COINT_RESULTS_FILE):
+    """
+    Charger les paires cointégrées. Le fichier n'est relu que si sa date de modification a changé.
+    Dans un worker du superviseur, seules les paires de sa part sont gardées (`set_pair_shard`).
+
+    Returns:
+    pd.DataFrame: Colonnes base_market, quote_market, hedge_ratio, half_life, p_value, t_stat
+                  (vide si le fichier est absent ou d'une autre version).
+    """
+    import pandas as pd
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        print(f"Fichier {path} introuvable : lancez d'abord la recherche de paires cointégrées")
+        return pd.DataFrame(columns=list(PAIRS_DTYPE.names))
+
+    cached = _PAIRS_CACHE.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with np.load(path) as data:
+        version = int(data["version"])
+        if version != COINT_RESULTS_VERSION:
+            print(f"Version {version} de {path} non prise en charge (attendue : {COINT_RESULTS_VERSION})")
+            return pd.DataFrame(columns=list(PAIRS_DTYPE.names))
+        df = pd.DataFrame(data["pairs"])
+
+    shard, shards = _PAIR_SHARD
+    if shards > 1:
+        keep = [pair_shard(base, quote, shards) == shard for base, quote in zip(df["base_market"], df["quote_market"])]
+        df = df[keep].reset_index(drop=True)
+
+    _PAIRS_CACHE[path] = (mtime, df)
+    return df
+
+
+def get_tracked_markets():
+    """
+    Marchés utilisés par la boucle : ceux des paires cointégrées et ceux des positions ouvertes.
+
+    Returns:
+    list: Les marchés distincts.
+    """
+    df = load_cointegrated_pairs()
+    markets = list(df["base_market"]) + list(df["quote_market"])
+
+    try:
+        markets += get_open_pair_book().markets()
+    except Exception as e:
+        print(f"Erreur lors de la lecture du journal des trades : {e}")
+
+    return list(dict.fromkeys(markets))
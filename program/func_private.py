@@ -1,53 +1,135 @@
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from constants import INDEXER_MAX_RETRIES, ORDER_STATUS_TIMEOUT, ORDER_STATUS_INTERVAL
 from func_utils import format_number
+from func_public import get_markets_data
+from func_rate_limit import call_with_retry
+from func_trade_store import get_trade_store
+from func_metrics import timed
+import asyncio
 import time
-import json
-from pprint import pprint
 
-def is_open_positions(client, market):
+class PositionBook:
     """
-    Check if there are any open positions for the specified market.
-    
+    In-memory book of open positions, keyed by market.
+
+    Refreshed with a single get_positions call per loop, and kept up to date
+    between refreshes when our own orders fill, so "is this market open?" is O(1).
+    """
+
+    def __init__(self):
+        self.positions = {}
+        self.refreshed_at = None
+
+    @timed("positions")
+    def refresh(self, client):
+        """
+        Replace the book with the exchange's open positions of the client's subaccount.
+
+        Args:
+            client: The dYdX client object.
+
+        Returns:
+            PositionBook: The book itself.
+        """
+        response = client.private.get_positions(status="OPEN")
+        self.positions = {p["market"]: p for p in response.data["positions"]}
+        self.refreshed_at = time.time()
+        return self
+
+    def is_open(self, market):
+        return market in self.positions
+
+    def markets(self):
+        return set(self.positions.keys())
+
+    def mark_open(self, market, side=None, size=None):
+        """
+        Record a position opened by one of our filled orders.
+        """
+        self.positions[market] = {"market": market, "side": side, "size": size, "status": "OPEN"}
+
+    def mark_closed(self, market):
+        """
+        Record a position closed by one of our filled reduce-only orders.
+        """
+        self.positions.pop(market, None)
+
+
+@timed("orders")
+def place_pair_orders(client, legs):
+    """
+    Submit the legs of a pair concurrently to limit legging risk.
+
     Args:
         client: The dYdX client object.
-        market: The market to check for open positions.
-    
+        legs: List of place_market_order keyword arguments, one dict per leg.
+
     Returns:
-        bool: True if there are open positions, False otherwise.
+        list: The placed order data (None for a failed leg), in the order of legs.
     """
-    try:
-        # Protect API
-        time.sleep(0.2)
-        
-        # Get positions
-        all_positions = client.private.get_positions(market=market, status="OPEN")
-        
-        # Determine if open
-        return len(all_positions.data["positions"]) > 0
-    except Exception as e:
-        print(f"Error checking open positions: {e}")
-        return False
+    with ThreadPoolExecutor(max_workers=len(legs)) as executor:
+        futures = [executor.submit(place_market_order, client, **leg) for leg in legs]
+        return [future.result() for future in futures]
 
-def check_order_status(client, order_id):
+
+@timed("order_status")
+def get_orders(client, order_ids, retries=INDEXER_MAX_RETRIES):
     """
-    Check the status of a specific order by its ID.
-    
+    Fetch several orders concurrently, behind the indexer rate limiter.
+
     Args:
         client: The dYdX client object.
-        order_id: The ID of the order to check.
-    
+        order_ids: The IDs of the orders to fetch.
+        retries: Retries per order after a failed fetch.
+
     Returns:
-        str: The status of the order.
+        dict: Order data by order ID (orders that could not be fetched are missing).
     """
-    try:
-        order = client.private.get_order_by_id(order_id)
-        if order.data:
-            if "order" in order.data.keys():
-                return order.data["order"]["status"]
-        return "FAILED"
-    except Exception as e:
-        print(f"Error checking order status: {e}")
-        return "FAILED"
+    order_ids = list(dict.fromkeys(order_ids))
+
+    async def fetch_all():
+        async def fetch(order_id):
+            try:
+                order = await call_with_retry(client.private.get_order_by_id, order_id, retries=retries)
+                return order_id, order.data["order"]
+            except Exception as e:
+                print(f"Error fetching order {order_id}: {e}")
+                return order_id, None
+        return await asyncio.gather(*[fetch(order_id) for order_id in order_ids])
+
+    return {order_id: order for order_id, order in asyncio.run(fetch_all()) if order is not None}
+
+
+# Order statuses the indexer will not change anymore
+FINAL_ORDER_STATUSES = ("FILLED", "CANCELED", "BEST_EFFORT_CANCELED")
+
+
+def wait_for_orders(client, order_ids, timeout=ORDER_STATUS_TIMEOUT, interval=ORDER_STATUS_INTERVAL):
+    """
+    Poll orders until each one reaches a final status or the deadline passes.
+
+    The indexer lags the chain: an order just broadcast may be missing or still OPEN
+    for a few blocks, so a single read cannot tell an unfilled order from a late one.
+
+    Args:
+        client: The dYdX client object.
+        order_ids: The IDs of the orders to wait for.
+        timeout: Deadline in seconds.
+        interval: Delay between two polls, in seconds.
+
+    Returns:
+        dict: Latest order data by order ID (orders never seen by the indexer are missing).
+    """
+    deadline = time.monotonic() + timeout
+    orders = {}
+    pending = list(dict.fromkeys(order_ids))
+    while True:
+        orders.update(get_orders(client, pending, retries=0))
+        pending = [order_id for order_id in pending if orders.get(order_id, {}).get("status") not in FINAL_ORDER_STATUSES]
+        if not pending or time.monotonic() + interval > deadline:
+            return orders
+        time.sleep(interval)
+
 
 def place_market_order(client, market, side, size, price, reduce_only):
     """
@@ -65,27 +147,15 @@ def place_market_order(client, market, side, size, price, reduce_only):
         dict: The placed order data.
     """
     try:
-        # Get Position Id
-        account_response = client.private.get_account()
-        position_id = account_response.data["account"]["positionId"]
-        
-        # Get expiration time
-        server_time = client.public.get_time()
-        expiration = datetime.fromisoformat(server_time.data["iso"].replace("Z", "")) + timedelta(seconds=70)
-        
-        # Place an order
+        # Place an order (signed and broadcast for the client's subaccount)
         placed_order = client.private.create_order(
-            position_id=position_id,  # required for creating the order signature
             market=market,
             side=side,
-            order_type="MARKET",
-            post_only=False,
             size=size,
             price=price,
-            limit_fee='0.015',
-            expiration_epoch_seconds=expiration.timestamp(),
+            reduce_only=reduce_only,
+            order_type="MARKET",
             time_in_force="FOK",
-            reduce_only=reduce_only
         )
         
         return placed_order.data
@@ -93,12 +163,13 @@ def place_market_order(client, market, side, size, price, reduce_only):
         print(f"Error placing market order: {e}")
         return None
 
-def abort_all_positions(client):
+def abort_all_positions(client, trade_store=None):
     """
-    Abort all open positions by cancelling all orders and closing open positions.
+    Abort all open positions of the client's subaccount by cancelling all orders and closing open positions.
     
     Args:
         client: The dYdX client object.
+        trade_store: Trade journal of the subaccount (the process journal by default).
     
     Returns:
         list: A list of closed orders.
@@ -111,7 +182,7 @@ def abort_all_positions(client):
         time.sleep(0.5)
         
         # Get markets for reference of tick size
-        markets = client.public.get_markets().data
+        markets = get_markets_data(client)
         
         # Protect API
         time.sleep(0.5)
@@ -136,12 +207,15 @@ def abort_all_positions(client):
                 tick_size = float(markets["markets"][market]["tickSize"])
                 accept_price = format_number(accept_price, tick_size)
                 
+                # Get Size (signed on v4: negative for a short)
+                size = format_number(abs(float(position["size"])), markets["markets"][market]["stepSize"])
+                
                 # Place order to close
                 order = place_market_order(
                     client,
                     market,
                     side,
-                    position["size"],
+                    size,
                     accept_price,
                     True
                 )
@@ -152,10 +226,8 @@ def abort_all_positions(client):
                 # Protect API
                 time.sleep(0.2)
             
-            # Override json file with empty list
-            bot_agents = []
-            with open("bot_agents.json", "w") as f:
-                json.dump(bot_agents, f)
+            # Close every tracked pair in the trade journal
+            (trade_store or get_trade_store()).close_all()
             
         return close_orders
     except Exception as e:
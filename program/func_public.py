@@ -1,92 +1,333 @@
-from constants import RESOLUTION
-from func_utils import get_ISO_times
-import pandas as pd
+from constants import RESOLUTION, INDEXER_MAX_CONCURRENCY, USE_CANDLE_STORE, MARKETS_CACHE_TTL
+from func_utils import get_ISO_times, parse_iso_epochs, format_time, resolution_seconds, get_decimals
+from func_rate_limit import call_with_retry
+from func_candle_store import CandleStore
+from func_metrics import timed
+from func_transport import get_indexer_transport
+from datetime import datetime, timezone
 import numpy as np
+import asyncio
 import time
 
 # Get relevant time periods for ISO from and to
 ISO_TIMES = get_ISO_times()
 
-def get_candles_recent(client, market):
-    """
-    Récupérer les données récentes de bougies pour un marché donné.
+# Flux WebSocket actif (voir func_websocket), None en mode REST
+_MARKET_STREAM = None
 
-    Parameters:
-    client (obj): Client de l'API.
-    market (str): Le marché pour lequel les données de bougies sont récupérées.
+# Dernière réponse de get_markets et date de récupération (horloge monotone)
+_MARKETS_CACHE = {"data": None, "fetched_at": 0.0}
 
-    Returns:
-    np.array: Un tableau contenant les prix de clôture des bougies récentes.
+
+def set_market_stream(stream):
+    global _MARKET_STREAM
+    _MARKET_STREAM = stream
+
+
+def get_markets_data(client, force_refresh=False):
+    """
+    Métadonnées des marchés (status, tickSize, stepSize, ...), au format de la réponse /perpetualMarkets de l'indexer v4.
+    Lues depuis le flux WebSocket s'il est actif, sinon depuis un cache rafraîchi toutes les
+    MARKETS_CACHE_TTL secondes (ou immédiatement avec `force_refresh`).
+    En cas d'échec du rafraîchissement, la dernière réponse connue est conservée.
     """
-    
-    close_prices = []
+    if _MARKET_STREAM is not None and not force_refresh:
+        markets = _MARKET_STREAM.markets_data()
+        if markets is not None:
+            return markets
 
-    # Protéger les limites de l'API
-    time.sleep(0.2)
+    now = time.monotonic()
+    cached = _MARKETS_CACHE["data"]
+    if cached is not None and not force_refresh and now - _MARKETS_CACHE["fetched_at"] < MARKETS_CACHE_TTL:
+        return cached
 
     try:
-        # Récupérer les données
-        candles = client.public.get_candles(
-            market=market,
-            resolution=RESOLUTION,
-            limit=100
-        )
-        # Structurer les données
-        for candle in candles.data["candles"]:
-            close_prices.append(candle["close"])
+        transport = get_indexer_transport()
+        data = transport.get_markets() if transport is not None else client.public.get_markets().data
     except Exception as e:
-        print(f"Erreur lors de la récupération des bougies récentes pour {market} : {e}")
-        return np.array([])  # Retourner un tableau vide en cas d'erreur
+        if cached is None:
+            raise
+        print(f"Erreur lors du rafraîchissement des marchés, utilisation du cache : {e}")
+        return cached
+
+    # Précalculer les décimales utilisées par format_number
+    for market_info in data["markets"].values():
+        for field in ("tickSize", "stepSize"):
+            if field in market_info:
+                get_decimals(market_info[field])
+
+    _MARKETS_CACHE["data"] = data
+    _MARKETS_CACHE["fetched_at"] = now
+    return data
+
+class PriceSnapshot:
+    """
+    Instantané des prix de clôture récents de plusieurs marchés, partagé par l'entrée et la sortie.
+    Matrice (marchés x 100) en float64, chaque ligne alignée à droite (bougie la plus récente en dernier)
+    et complétée par des NaNs si l'indexer a renvoyé moins de bougies.
+    `epochs` contient la date d'ouverture (epoch) de la dernière bougie de chaque marché (0 si inconnue).
+    """
+
+    def __init__(self, markets, prices, epochs=None):
+        self.markets = list(markets)
+        self.index = {market: row for row, market in enumerate(self.markets)}
+        self.prices = prices
+        self.epochs = epochs if epochs is not None else np.zeros(len(self.markets), dtype=np.int64)
+
+    def __contains__(self, market):
+        return market in self.index
+
+    def rows(self, markets):
+        """
+        Lignes de la matrice pour chaque marché (-1 si absent).
+        """
+        return np.array([self.index.get(market, -1) for market in markets], dtype=np.int64)
+
+    def series(self, market):
+        """
+        Série des clôtures du marché, sans les NaNs (tableau vide si indisponible).
+        """
+        row = self.index.get(market)
+        if row is None:
+            return np.array([])
+        values = self.prices[row]
+        return values[~np.isnan(values)]
 
-    # Construire et retourner la série de prix de clôture
-    close_prices.reverse()
-    prices_result = np.array(close_prices).astype(np.float64)
-    return prices_result
 
+async def fetch_recent_prices(client, markets, limit=100):
+    """
+    Récupérer simultanément les bougies récentes de chaque marché, une seule fois par marché.
 
-def get_candles_historical(client, market):
+    Returns:
+    PriceSnapshot: L'instantané des prix de clôture.
     """
-    Récupérer les données historiques de bougies pour un marché donné.
+    semaphore = asyncio.Semaphore(INDEXER_MAX_CONCURRENCY)
+    markets = list(dict.fromkeys(markets))
+    prices = np.full((len(markets), limit), np.nan, dtype=np.float64)
+    epochs = np.zeros(len(markets), dtype=np.int64)
+
+    async def fetch_market(row, market):
+        try:
+            async with semaphore:
+                candle_epochs, closes = await _fetch_candles(client, market, limit=limit)
+        except Exception as e:
+            print(f"Erreur lors de la récupération des bougies récentes pour {market} : {e}")
+            return
+
+        closes = closes[-limit:]
+        if len(closes) > 0:
+            prices[row, limit - len(closes):] = closes
+            epochs[row] = candle_epochs[-1]
+
+    await asyncio.gather(*[fetch_market(row, market) for row, market in enumerate(markets)])
+    return PriceSnapshot(markets, prices, epochs)
+
+
+@timed("recent_prices")
+def get_recent_prices_snapshot(client, markets):
+    """
+    Construire l'instantané des prix récents de la boucle en cours.
 
     Parameters:
     client (obj): Client de l'API.
-    market (str): Le marché pour lequel les données de bougies sont récupérées.
+    markets (iterable): Les marchés nécessaires (doublons ignorés).
 
     Returns:
-    list: Une liste de dictionnaires contenant les prix de clôture historiques et leurs dates.
+    PriceSnapshot: L'instantané des prix de clôture.
     """
-    
-    close_prices = []
+    if _MARKET_STREAM is None:
+        return asyncio.run(fetch_recent_prices(client, markets))
+
+    # Mode WebSocket : seuls les marchés sans historique complet passent par l'API REST
+    missing = [market for market in dict.fromkeys(markets) if not _MARKET_STREAM.has_market(market)]
+    if missing:
+        rest_snapshot = asyncio.run(fetch_recent_prices(client, missing))
+        for row, market in enumerate(rest_snapshot.markets):
+            closes = rest_snapshot.prices[row]
+            valid = ~np.isnan(closes)
+            if valid.any():
+                step = resolution_seconds(RESOLUTION)
+                epochs = rest_snapshot.epochs[row] - step * np.arange(valid.sum())[::-1]
+                _MARKET_STREAM.update_candles(market, epochs, closes[valid])
+    return _MARKET_STREAM.snapshot(markets)
 
-    for timeframe in ISO_TIMES.keys():
-        tf_obj = ISO_TIMES[timeframe]
-        from_iso = tf_obj["from_iso"]
-        to_iso = tf_obj["to_iso"]
 
-        # Protéger les limites de l'API
-        time.sleep(0.2)
+async def get_candles_historical_async(client, market, semaphore=None, windows=None):
+    """
+    Récupérer les bougies historiques d'un marché : les fenêtres de ISO_TIMES
+    sont récupérées simultanément, sous le contrôle du limiteur de l'indexer.
+
+    Parameters:
+    client (obj): Client de l'API.
+    market (str): Le marché pour lequel les données de bougies sont récupérées.
+    semaphore (asyncio.Semaphore): Limite optionnelle du nombre de requêtes en vol.
+    windows (dict): Fenêtres {nom: {"from_iso", "to_iso"}} à récupérer (ISO_TIMES par défaut).
 
+    Returns:
+    tuple: (epochs int64, closes float64), triés par date croissante et sans doublons.
+    """
+
+    windows = windows or ISO_TIMES
+
+    async def fetch_window(timeframe):
+        tf_obj = windows[timeframe]
         try:
-            # Récupérer les données
-            candles = client.public.get_candles(
-                market=market,
-                resolution=RESOLUTION,
-                from_iso=from_iso,
-                to_iso=to_iso,
-                limit=100
-            )
-            # Structurer les données
-            for candle in candles.data["candles"]:
-                close_prices.append({"datetime": candle["startedAt"], market: candle["close"] })
+            if semaphore is None:
+                return await _fetch_candles(client, market, tf_obj["from_iso"], tf_obj["to_iso"])
+            async with semaphore:
+                return await _fetch_candles(client, market, tf_obj["from_iso"], tf_obj["to_iso"])
         except Exception as e:
-            print(f"Erreur lors de la récupération des bougies historiques pour {market} dans la période {timeframe} : {e}")
-            continue  # Passer à la période suivante en cas d'erreur
+            print(f"Erreur lors de la récupération des bougies historiques pour {market} dans la période {timeframe} : {e}")
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    results = await asyncio.gather(*[fetch_window(timeframe) for timeframe in windows.keys()])
+
+    # Les fenêtres peuvent se chevaucher à leurs bornes
+    epochs = np.concatenate([window[0] for window in results])
+    closes = np.concatenate([window[1] for window in results])
+    epochs, first = np.unique(epochs, return_index=True)
+    return epochs, closes[first]
+
+
+def get_topup_windows(from_epoch, to_epoch, limit=100):
+    """
+    Découper l'intervalle [from_epoch, to_epoch] en fenêtres d'au plus `limit` bougies.
+
+    Returns:
+    dict: Fenêtres au format de ISO_TIMES.
+    """
+    span = resolution_seconds(RESOLUTION) * limit
+    windows = {}
+    to_current = to_epoch
+    while to_current > from_epoch:
+        from_current = max(from_epoch, to_current - span)
+        windows[f"topup_{len(windows) + 1}"] = {
+            "from_iso": format_time(datetime.fromtimestamp(from_current, tz=timezone.utc)),
+            "to_iso": format_time(datetime.fromtimestamp(to_current, tz=timezone.utc)),
+        }
+        to_current = from_current
+    return windows
 
-    # Construire et retourner la liste des prix de clôture
-    close_prices.reverse()
-    return close_prices
 
+async def get_candles_incremental_async(client, market, store, semaphore=None):
+    """
+    Compléter les bougies stockées localement avec celles publiées depuis la dernière
+    bougie stockée. L'historique complet n'est récupéré que si le stockage est vide,
+    trop ancien ou ne couvre pas la fenêtre de lookback.
+
+    Returns:
+    tuple: (epochs int64, closes float64) sur la fenêtre de lookback.
+    """
+    stored_epochs, _ = store.load(market)
+    now = int(time.time())
+    lookback_start = now - store.lookback_seconds
+    step = resolution_seconds(RESOLUTION)
+
+    if len(stored_epochs) == 0 or stored_epochs[-1] < lookback_start or stored_epochs[0] > lookback_start + step:
+        epochs, closes = await get_candles_historical_async(client, market, semaphore)
+    else:
+        # Inclure la dernière bougie stockée, qui pouvait être encore ouverte
+        windows = get_topup_windows(int(stored_epochs[-1]), now)
+        epochs, closes = await get_candles_historical_async(client, market, semaphore, windows)
+
+    return store.update(market, epochs, closes, now)
+
+
+def candles_to_arrays(candles):
+    """
+    Convertir les bougies de l'indexer en tableaux NumPy typés.
+    `startedAt` est analysé une seule fois en secondes epoch (int64).
+
+    Returns:
+    tuple: (epochs int64, closes float64), triés par date croissante et sans doublons.
+    """
+    if len(candles) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    epochs = parse_iso_epochs([candle["startedAt"] for candle in candles])
+    closes = np.array([candle["close"] for candle in candles], dtype=np.float64)
+
+    # Les fenêtres peuvent se chevaucher à leurs bornes
+    epochs, first = np.unique(epochs, return_index=True)
+    return epochs, closes[first]
+
+
+async def _fetch_candles(client, market, from_iso=None, to_iso=None, limit=100):
+    """
+    Une requête de bougies, par le transport partagé s'il est configuré (décodage direct
+    en tableaux), sinon par le client.
+
+    Returns:
+    tuple: (epochs int64, closes float64), triés par date croissante.
+    """
+    transport = get_indexer_transport()
+    if transport is not None:
+        return await call_with_retry(transport.get_candles_arrays, market, RESOLUTION, from_iso=from_iso, to_iso=to_iso, limit=limit)
+
+    candles = await call_with_retry(
+        client.public.get_candles,
+        market=market,
+        resolution=RESOLUTION,
+        from_iso=from_iso,
+        to_iso=to_iso,
+        limit=limit
+    )
+    return candles_to_arrays(candles.data["candles"])
+
+
+async def fetch_historical_prices(client, markets, store=None):
+    """
+    Récupérer simultanément les bougies historiques de tous les marchés.
+    Avec un `CandleStore`, seules les bougies manquantes sont demandées à l'indexer.
 
+    Returns:
+    list: Les tableaux (epochs, closes) de chaque marché, dans l'ordre de `markets`.
+    """
+    semaphore = asyncio.Semaphore(INDEXER_MAX_CONCURRENCY)
+    if store is not None:
+        return await asyncio.gather(*[get_candles_incremental_async(client, market, store, semaphore) for market in markets])
+    return await asyncio.gather(*[get_candles_historical_async(client, market, semaphore) for market in markets])
+
+
+def build_market_prices_frame(markets, series):
+    """
+    Aligner les séries de tous les marchés sur un index de dates commun en une seule passe.
+
+    Parameters:
+    markets (list): Les noms des marchés, dans l'ordre des colonnes.
+    series (list): Les tableaux (epochs, closes) de chaque marché.
+
+    Returns:
+    pd.DataFrame: Prix de clôture float64, indexés par date UTC, sans les colonnes incomplètes.
+    """
+    import pandas as pd
+
+    # Index commun : union triée de toutes les dates
+    all_epochs = [epochs for epochs, _ in series]
+    index = np.unique(np.concatenate(all_epochs)) if all_epochs else np.empty(0, dtype=np.int64)
+
+    # Remplir un tampon préalloué colonne par colonne
+    values = np.full((len(index), len(markets)), np.nan, dtype=np.float64)
+    for col, (epochs, closes) in enumerate(series):
+        values[np.searchsorted(index, epochs), col] = closes
+
+    # Supprimer les colonnes contenant des NaNs
+    complete = ~np.isnan(values).any(axis=0)
+    nans = [market for market, keep in zip(markets, complete) if not keep]
+    if nans:
+        print("Suppression des colonnes : ")
+        print(nans)
+
+    df = pd.DataFrame(
+        values[:, complete],
+        index=pd.to_datetime(index, unit="s", utc=True),
+        columns=[market for market, keep in zip(markets, complete) if keep],
+    )
+    df.index.name = "datetime"
+    return df
+
+
+@timed("market_prices")
 def construct_market_prices(client):
     """
     Construire les prix du marché pour tous les marchés disponibles et en ligne.
@@ -97,39 +338,27 @@ def construct_market_prices(client):
     Returns:
     pd.DataFrame: Un DataFrame contenant les prix de clôture pour tous les marchés disponibles.
     """
-    
+    # pandas n'est chargé que par les étapes qui construisent un DataFrame
+    import pandas as pd
+
     tradeable_markets = []
 
     try:
-        markets = client.public.get_markets()
+        # Liste à jour (et cache rafraîchi pour la suite), par le transport partagé s'il est configuré
+        markets = get_markets_data(client, force_refresh=True)
     except Exception as e:
         print(f"Erreur lors de la récupération des données de marché : {e}")
         return pd.DataFrame()  # Retourner un DataFrame vide en cas d'erreur
 
-    # Trouver les paires échangeables
-    for market in markets.data["markets"].keys():
-        market_info = markets.data["markets"][market]
-        if market_info["status"] == "ONLINE" and market_info["type"] == "PERPETUAL":
+    # Trouver les paires échangeables (sur v4, tous les marchés sont des perpétuels)
+    for market in markets["markets"].keys():
+        market_info = markets["markets"][market]
+        if market_info["status"] == "ACTIVE":
             tradeable_markets.append(market)
 
-    # Initialiser le DataFrame avec le premier marché
-    close_prices = get_candles_historical(client, tradeable_markets[0])
-    df = pd.DataFrame(close_prices)
-    df.set_index("datetime", inplace=True)
-
-    # Ajouter les prix des autres marchés au DataFrame
-    for market in tradeable_markets[1:]:
-        close_prices_add = get_candles_historical(client, market)
-        df_add = pd.DataFrame(close_prices_add)
-        df_add.set_index("datetime", inplace=True)
-        df = pd.merge(df, df_add, how="outer", on="datetime", copy=False)
-        del df_add
-
-    # Vérifier les colonnes contenant des NaNs
-    nans = df.columns[df.isna().any()].tolist()
-    if nans:
-        print("Suppression des colonnes : ")
-        print(nans)
-        df.drop(columns=nans, inplace=True)
+    # Récupérer les bougies de tous les marchés simultanément
+    store = CandleStore() if USE_CANDLE_STORE else None
+    series = asyncio.run(fetch_historical_prices(client, tradeable_markets, store))
 
-    return df
+    # Construire le DataFrame aligné en une seule étape
+    return build_market_prices_frame(tradeable_markets, series)
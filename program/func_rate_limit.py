@@ -0,0 +1,98 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+
+from constants import (
+    INDEXER_RATE_LIMIT,
+    INDEXER_RATE_BURST,
+    INDEXER_MAX_RETRIES,
+    INDEXER_RETRY_BACKOFF,
+)
+from func_metrics import observe
+
+
+class TokenBucket:
+    """
+    Limiteur de débit à seau à jetons.
+
+    Le seau se recharge de `rate` jetons par seconde jusqu'à `capacity`.
+    Chaque requête consomme un jeton ; si le seau est vide, l'appelant attend
+    le temps nécessaire à la recharge au lieu d'un `time.sleep` fixe.
+    """
+
+    def __init__(self, rate=INDEXER_RATE_LIMIT, capacity=INDEXER_RATE_BURST):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """
+        Réserver des jetons et retourner le délai d'attente (s) avant de pouvoir les utiliser.
+        Le solde peut devenir négatif : les appelants suivants attendent d'autant plus longtemps.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    async def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            observe("rate_limit_wait_seconds", delay)
+            await asyncio.sleep(delay)
+
+    def acquire_blocking(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay > 0:
+            observe("rate_limit_wait_seconds", delay)
+            time.sleep(delay)
+
+
+# Limiteur partagé par tous les appels à l'indexer du processus
+_INDEXER_LIMITER = None
+
+
+def get_indexer_limiter():
+    global _INDEXER_LIMITER
+    if _INDEXER_LIMITER is None:
+        _INDEXER_LIMITER = TokenBucket()
+    return _INDEXER_LIMITER
+
+
+async def call_with_retry(func, *args, limiter=None, retries=INDEXER_MAX_RETRIES, backoff=INDEXER_RETRY_BACKOFF, **kwargs):
+    """
+    Exécuter un appel bloquant du client dans un thread, sous le contrôle du limiteur,
+    avec nouvelles tentatives et backoff exponentiel (avec gigue).
+
+    Parameters:
+    func (callable): Méthode du client à appeler.
+    limiter (TokenBucket): Limiteur à utiliser (par défaut celui de l'indexer).
+    retries (int): Nombre de nouvelles tentatives après le premier échec.
+    backoff (float): Délai initial entre deux tentatives, en secondes.
+
+    Returns:
+    Le résultat de `func`. La dernière exception est relancée si toutes les tentatives échouent.
+    """
+
+    limiter = limiter or get_indexer_limiter()
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        try:
+            return await loop.run_in_executor(None, call)
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            delay = backoff * (2 ** attempt) * (1 + random.random())
+            print(f"Nouvelle tentative dans {delay:.2f}s après l'erreur : {e}")
+            await asyncio.sleep(delay)
@@ -0,0 +1,257 @@
+import time
+import numpy as np
+import pandas as pd
+
+from constants import (
+    RESOLUTION,
+    COINT_PVALUE_THRESH,
+    RECOINT_INTERVAL_CANDLES,
+    RECOINT_REFIT_EVERY,
+    RECOINT_EXACT_CONFIRM,
+)
+from func_cointegration import COINT_DTYPE, compute_cointegration
+from func_pairs_store import save_cointegrated_pairs
+from func_metrics import timed
+from func_utils import resolution_seconds
+
+# Au-delà de cette statistique DF, la p-value dépasse largement tout seuil utile
+_MAX_DF_STAT = -1.5
+
+
+def _quadratic(matrix, bases, quotes, weights):
+    """
+    w' M w pour chaque paire, avec w = 1 sur la base et -weight sur la quote.
+    """
+    return (
+        matrix[bases, bases]
+        - weights * (matrix[bases, quotes] + matrix[quotes, bases])
+        + weights ** 2 * matrix[quotes, quotes]
+    )
+
+
+class RollingCointegration:
+    """
+    Cointégration glissante de toutes les paires, mise à jour à chaque nouvelle bougie.
+
+    La fenêtre des `window` dernières clôtures est conservée dans un tampon circulaire, avec
+    les statistiques suffisantes des régressions MCO :
+    - G = Σ p p' et S = Σ p, d'où les ratios de couverture (avec et sans constante) ;
+    - C = Σ p[t-1] p[t]', d'où les sommes de la régression de Dickey-Fuller sur les résidus.
+    Une nouvelle bougie coûte O(N²) (ajout de la nouvelle ligne, retrait de la plus ancienne)
+    au lieu d'un recalcul O(T·N²) ; les sommes sont recalculées entièrement toutes les
+    `refit_every` bougies pour borner l'accumulation des erreurs d'arrondi.
+
+    La statistique incrémentale est celle de Dickey-Fuller sans retard (comme la présélection) ;
+    les paires retenues peuvent être confirmées par le test ADF exact de `compute_cointegration`.
+    """
+
+    def __init__(self, markets, prices, epochs, resolution=RESOLUTION, refit_every=RECOINT_REFIT_EVERY):
+        self.markets = list(markets)
+        self.step = resolution_seconds(resolution)
+        self.refit_every = refit_every
+        self.buffer = np.array(prices, dtype=np.float64)
+        self.window = self.buffer.shape[0]
+        self.head = 0
+        self.last_epoch = int(epochs[-1])
+        self._refit()
+
+    @classmethod
+    def from_frame(cls, df_market_prices, resolution=RESOLUTION, now=None):
+        """
+        Initialiser à partir du DataFrame de `construct_market_prices`.
+        La dernière ligne est ignorée si sa bougie n'est pas encore clôturée.
+        """
+        epochs = df_market_prices.index.values.astype("datetime64[s]").astype(np.int64)
+        prices = df_market_prices.to_numpy(dtype=np.float64)
+        now = time.time() if now is None else now
+        if len(epochs) > 0 and epochs[-1] + resolution_seconds(resolution) > now:
+            epochs, prices = epochs[:-1], prices[:-1]
+        return cls(df_market_prices.columns, prices, epochs, resolution)
+
+    def prices(self):
+        """
+        Fenêtre courante, de la plus ancienne à la plus récente clôture (T x N).
+        """
+        return np.roll(self.buffer, -self.head, axis=0)
+
+    def _refit(self):
+        prices = self.prices()
+        self.gram = prices.T @ prices
+        self.sums = prices.sum(axis=0)
+        self.cross = prices[:-1].T @ prices[1:]
+        self.pushed = 0
+
+    def push(self, row, epoch):
+        """
+        Ajouter une bougie clôturée (une valeur par marché) et retirer la plus ancienne.
+        """
+        row = np.asarray(row, dtype=np.float64)
+        last = self.buffer[self.head - 1]
+        oldest = self.buffer[self.head]
+        second = self.buffer[(self.head + 1) % self.window]
+
+        self.gram += np.outer(row, row) - np.outer(oldest, oldest)
+        self.sums += row - oldest
+        self.cross += np.outer(last, row) - np.outer(oldest, second)
+
+        self.buffer[self.head] = row
+        self.head = (self.head + 1) % self.window
+        self.last_epoch = int(epoch)
+        self.pushed += 1
+        if self.pushed >= self.refit_every:
+            self._refit()
+
+    def update(self, snapshot):
+        """
+        Ajouter les bougies clôturées d'un instantané de prix postérieures à la dernière bougie connue.
+        Un marché sans valeur pour une bougie garde sa clôture précédente.
+
+        Returns:
+        int: Nombre de bougies ajoutées.
+        """
+        open_epoch = int(snapshot.epochs.max()) if len(snapshot.epochs) > 0 else 0
+        rows = snapshot.rows(self.markets)
+        n_cols = snapshot.prices.shape[1]
+        added = 0
+
+        for epoch in range(self.last_epoch + self.step, open_epoch, self.step):
+            row = self.buffer[self.head - 1].copy()
+            # Colonne de la bougie dans la ligne de chaque marché (alignée sur sa propre dernière bougie)
+            cols = n_cols - 1 - (snapshot.epochs[rows] - epoch) // self.step
+            valid = (rows >= 0) & (cols >= 0) & (cols < n_cols)
+            values = snapshot.prices[rows[valid], cols[valid]]
+            known = np.flatnonzero(valid)[~np.isnan(values)]
+            row[known] = values[~np.isnan(values)]
+            self.push(row, epoch)
+            added += 1
+
+        return added
+
+    def statistics(self, bases=None, quotes=None):
+        """
+        Ratios de couverture, statistiques de Dickey-Fuller et demi-vies de chaque paire (i < j par défaut),
+        calculés uniquement à partir des statistiques suffisantes.
+
+        Returns:
+        np.ndarray: Tableau structuré COINT_DTYPE (p_value à NaN, voir `select`).
+        """
+        if bases is None:
+            bases, quotes = np.triu_indices(len(self.markets), 1)
+        n = self.window
+        n_obs = n - 1
+        first = self.buffer[self.head]
+        last = self.buffer[self.head - 1]
+
+        # Sommes sur les transitions t-1 -> t
+        lag_gram = self.gram - np.outer(last, last)
+        lag_sums = self.sums - last
+        diff_sums = last - first
+        lag_diff = self.cross - lag_gram
+        diff_gram = (self.gram - np.outer(first, first)) - self.cross - self.cross.T + lag_gram
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Régression avec constante de la base sur la quote (Engle-Granger)
+            cov_bq = self.gram[bases, quotes] - self.sums[bases] * self.sums[quotes] / n
+            var_q = self.gram[quotes, quotes] - self.sums[quotes] ** 2 / n
+            slope = cov_bq / var_q
+            intercept = (self.sums[bases] - slope * self.sums[quotes]) / n
+
+            # Dickey-Fuller sans retard sur les résidus e = base - intercept - slope * quote
+            lag_ss = (
+                _quadratic(lag_gram, bases, quotes, slope)
+                - 2 * intercept * (lag_sums[bases] - slope * lag_sums[quotes])
+                + n_obs * intercept ** 2
+            )
+            lag_dot = _quadratic(lag_diff, bases, quotes, slope) - intercept * (diff_sums[bases] - slope * diff_sums[quotes])
+            diff_ss = _quadratic(diff_gram, bases, quotes, slope)
+            gamma = lag_dot / lag_ss
+            sigma2 = (diff_ss - gamma * lag_dot) / (n_obs - 1)
+            t_stat = gamma / np.sqrt(sigma2 / lag_ss)
+
+            # Sans constante, comme à l'entrée et à la sortie : spread = base - hedge_ratio * quote
+            hedge_ratio = self.gram[bases, quotes] / self.gram[quotes, quotes]
+
+            # Demi-vie : régression de Δspread sur le spread décalé centré
+            spread_lag = lag_sums[bases] - hedge_ratio * lag_sums[quotes]
+            spread_diff = diff_sums[bases] - hedge_ratio * diff_sums[quotes]
+            beta = (
+                (_quadratic(lag_diff, bases, quotes, hedge_ratio) - spread_lag * spread_diff / n_obs)
+                / (_quadratic(lag_gram, bases, quotes, hedge_ratio) - spread_lag ** 2 / n_obs)
+            )
+            half_life = np.where(beta < 0, np.round(-np.log(2) / beta), np.inf)
+
+        results = np.empty(len(bases), dtype=COINT_DTYPE)
+        results["base"] = bases
+        results["quote"] = quotes
+        results["t_stat"] = t_stat
+        results["p_value"] = np.nan
+        results["hedge_ratio"] = hedge_ratio
+        results["half_life"] = half_life
+        return results
+
+    def select(self, pvalue_thresh=COINT_PVALUE_THRESH, exact=RECOINT_EXACT_CONFIRM):
+        """
+        Paires cointégrées de la fenêtre courante.
+        Les p-values sont celles de MacKinnon sur la statistique incrémentale ; avec `exact`,
+        les paires retenues sont confirmées par le test ADF exact (peu de paires, donc peu coûteux).
+
+        Returns:
+        np.ndarray: Lignes COINT_DTYPE retenues.
+        """
+        from statsmodels.tsa.adfvalues import mackinnonp
+
+        results = self.statistics()
+        candidates = results[np.isfinite(results["t_stat"]) & (results["t_stat"] < _MAX_DF_STAT)]
+        candidates["p_value"] = [mackinnonp(t_stat, regression="c", N=2) for t_stat in candidates["t_stat"]]
+        selected = candidates[candidates["p_value"] < pvalue_thresh]
+
+        if exact and len(selected) > 0:
+            selected = compute_cointegration(self.prices(), (selected["base"], selected["quote"]), workers=1)
+            selected = selected[selected["p_value"] < pvalue_thresh]
+        return selected
+
+    def save(self, pvalue_thresh=COINT_PVALUE_THRESH, exact=RECOINT_EXACT_CONFIRM):
+        """
+        Sélectionner les paires et remplacer atomiquement le fichier des paires cointégrées.
+        La boucle principale recharge le fichier dès que sa date de modification change.
+
+        Returns:
+        np.ndarray: Lignes COINT_DTYPE retenues.
+        """
+        selected = self.select(pvalue_thresh, exact)
+        first_epoch = self.last_epoch - (self.window - 1) * self.step
+        index = pd.to_datetime(np.array([first_epoch, self.last_epoch]), unit="s", utc=True)
+        save_cointegrated_pairs(selected, self.markets, index)
+        return selected
+
+
+class RecointegrationJob:
+    """
+    Tâche de fond qui met à jour la cointégration après chaque clôture de bougie.
+
+    `run_once` est exécutée par le planificateur après chaque clôture : elle lit les bougies
+    récentes de l'univers dans l'instantané de la boucle (`LoopState`, qui inclut l'univers au
+    premier rafraîchissement de la bougie), met à jour `RollingCointegration` et, toutes les
+    `interval` bougies, remplace le fichier des paires. La boucle d'entrée / sortie n'est jamais
+    bloquée : elle lit l'ancien fichier jusqu'au remplacement atomique.
+    """
+
+    def __init__(self, model, state, interval=RECOINT_INTERVAL_CANDLES):
+        self.model = model
+        self.state = state
+        self.interval = interval
+        self.pending = 0
+
+    @timed("recointegration")
+    def run_once(self):
+        """
+        Une mise à jour : bougies manquantes, statistiques glissantes et, si c'est le moment, nouvelle sélection.
+        """
+        snapshot, _ = self.state.get(self.model.markets)
+        self.pending += self.model.update(snapshot)
+
+        if self.pending >= self.interval:
+            start = time.perf_counter()
+            selected = self.model.save()
+            self.pending = 0
+            print(f"Re-cointégration : {len(selected)} paires retenues en {time.perf_counter() - start:.1f}s")
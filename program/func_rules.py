@@ -0,0 +1,102 @@
+import numpy as np
+
+from constants import (
+    ZSCORE_THRESH,
+    CLOSE_AT_ZSCORE_CROSS,
+    EXIT_HALF_LIFE_MULT,
+    EXIT_STOP_ZSCORE,
+    EXIT_TAKE_PROFIT,
+)
+
+# Motifs de sortie renvoyés par `exit_reasons` (0 = rester en position)
+EXIT_NONE = 0
+EXIT_ZSCORE_CROSS = 1
+EXIT_TIME_STOP = 2
+EXIT_TAKE_PROFIT_HIT = 3
+EXIT_STOP_LOSS = 4
+EXIT_REASON_NAMES = ("none", "zscore_cross", "time_stop", "take_profit", "stop_loss")
+
+
+def entry_signals(z_scores, thresh=ZSCORE_THRESH):
+    """
+    Déclencheur d'entrée : |z| >= seuil (NaN ne déclenche jamais).
+    Fonctionne sur un scalaire ou un tableau.
+    """
+    with np.errstate(invalid="ignore"):
+        return np.abs(z_scores) >= thresh
+
+
+def entry_base_direction(z_scores):
+    """
+    Sens de la jambe de base : +1 (BUY) si z < 0, -1 (SELL) sinon. La jambe de cotation est de sens opposé.
+    """
+    return np.where(np.asarray(z_scores) < 0, 1, -1)
+
+
+def zscore_cross_exits(z_current, z_traded):
+    """
+    Règle de sortie CLOSE_AT_ZSCORE_CROSS : le z-score a changé de signe
+    et atteint au moins l'amplitude du z-score d'entrée.
+    """
+    with np.errstate(invalid="ignore"):
+        level_check = np.abs(z_current) >= np.abs(z_traded)
+        cross_check = ((z_current < 0) & (z_traded > 0)) | ((z_current > 0) & (z_traded < 0))
+        return level_check & cross_check
+
+
+def time_stop_exits(elapsed_candles, half_life, mult=EXIT_HALF_LIFE_MULT):
+    """
+    Stop temporel : la paire est ouverte depuis plus de `mult` demi-vies (demi-vie inconnue : jamais).
+    """
+    with np.errstate(invalid="ignore"):
+        valid = np.isfinite(half_life) & (half_life > 0)
+        return valid & (elapsed_candles >= mult * np.where(valid, half_life, 0))
+
+
+def stop_loss_exits(z_current, z_traded, stop=EXIT_STOP_ZSCORE):
+    """
+    Stop-loss sur le spread : le z-score s'éloigne encore de la moyenne, du côté de l'entrée,
+    jusqu'à |z| >= stop.
+    """
+    with np.errstate(invalid="ignore"):
+        return (np.abs(z_current) >= stop) & (np.sign(z_current) == np.sign(z_traded))
+
+
+def take_profit_exits(pnl, notional, target=EXIT_TAKE_PROFIT):
+    """
+    Take-profit : PnL latent >= `target` x notionnel d'entrée (PnL inconnu : jamais).
+    """
+    with np.errstate(invalid="ignore"):
+        return pnl >= target * notional
+
+
+def exit_reasons(
+    z_current,
+    z_traded,
+    elapsed_candles,
+    half_life,
+    pnl,
+    notional,
+    close_at_cross=CLOSE_AT_ZSCORE_CROSS,
+    half_life_mult=EXIT_HALF_LIFE_MULT,
+    stop_zscore=EXIT_STOP_ZSCORE,
+    take_profit=EXIT_TAKE_PROFIT,
+):
+    """
+    Toutes les règles de sortie en une passe vectorisée sur les paires ouvertes.
+    Une règle à None est désactivée. Si plusieurs règles se déclenchent, le motif retenu
+    est le plus prioritaire : stop-loss, take-profit, croisement du z-score, stop temporel.
+
+    Returns:
+    np.ndarray: Motif de sortie de chaque paire (int8, EXIT_NONE pour rester en position).
+    """
+    reasons = np.zeros(len(z_current), dtype=np.int8)
+    if half_life_mult is not None:
+        reasons[time_stop_exits(elapsed_candles, half_life, half_life_mult)] = EXIT_TIME_STOP
+    if close_at_cross:
+        reasons[zscore_cross_exits(z_current, z_traded)] = EXIT_ZSCORE_CROSS
+    if take_profit is not None:
+        reasons[take_profit_exits(pnl, notional, take_profit)] = EXIT_TAKE_PROFIT_HIT
+    if stop_zscore is not None:
+        reasons[stop_loss_exits(z_current, z_traded, stop_zscore)] = EXIT_STOP_LOSS
+    return reasons
@@ -0,0 +1,194 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import (
+    RESOLUTION,
+    SCHEDULE_DELAY,
+    SCHEDULE_RETRY_BACKOFF,
+    SCHEDULE_MAX_BACKOFF,
+    SCHEDULE_SNAPSHOT_MAX_AGE,
+)
+from func_metrics import inc, observe, timed
+from func_pairs_store import get_tracked_markets
+from func_private import PositionBook
+from func_public import get_recent_prices_snapshot
+from func_utils import resolution_seconds
+
+
+class LoopState:
+    """
+    Instantané des prix et positions ouvertes partagé par les tâches de trading.
+
+    Les tâches lancées à la même échéance (sorties puis entrées à la clôture d'une bougie)
+    réutilisent le même instantané tant qu'il a moins de `max_age` secondes ; les ordres
+    passés entre-temps sont reportés dans le PositionBook par `mark_open` / `mark_closed`.
+    `universe` : marchés ajoutés au premier rafraîchissement de chaque bougie (l'univers de la
+    re-cointégration), pour qu'une seule requête par marché et par bougie serve toutes les tâches.
+    `tracked` : fonction renvoyant les marchés suivis à chaque rafraîchissement.
+    `positions` : False pour un processus qui ne trade pas (superviseur).
+    """
+
+    def __init__(self, client, max_age=SCHEDULE_SNAPSHOT_MAX_AGE, universe=(), tracked=get_tracked_markets,
+                 positions=True, resolution=RESOLUTION):
+        self.client = client
+        self.max_age = max_age
+        self.universe = list(universe)
+        self.tracked = tracked
+        self.step = resolution_seconds(resolution)
+        self.positions = PositionBook() if positions else None
+        self.snapshot = None
+        self.updated = 0.0
+        self.universe_candle = None
+        self._lock = threading.Lock()
+
+    @timed("snapshot")
+    def get(self, markets=()):
+        """
+        `markets` : marchés supplémentaires que l'instantané doit contenir.
+
+        Returns:
+        tuple: (PriceSnapshot, PositionBook), rafraîchis si l'instantané est trop ancien
+        ou ne contient pas tous les marchés demandés.
+        """
+        with self._lock:
+            now = time.time()
+            stale = self.snapshot is None or now - self.updated > self.max_age
+            if stale or not all(market in self.snapshot for market in markets):
+                wanted = list(self.tracked()) + list(markets)
+                candle = int(now // self.step)
+                if self.universe and candle != self.universe_candle:
+                    wanted += self.universe
+                    self.universe_candle = candle
+                self.snapshot = get_recent_prices_snapshot(self.client, list(dict.fromkeys(wanted)))
+                if self.positions is not None:
+                    self.positions.refresh(self.client)
+                self.updated = now
+            return self.snapshot, self.positions
+
+
+class ScheduledTask:
+    """
+    Une tâche périodique du planificateur et ses statistiques d'exécution.
+    """
+
+    def __init__(self, name, func, interval, delay, executor, run_at_start):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.delay = delay
+        self.executor = executor
+        self.run_at_start = run_at_start
+        self.runs = 0
+        self.errors = 0
+        self.failures = 0
+        self.last_success = None
+        self.last_error = None
+        self.last_duration = None
+
+    def next_boundary(self, now):
+        """
+        Prochaine échéance alignée sur les multiples de `interval` depuis l'epoch, plus `delay`.
+        """
+        return (now // self.interval + 1) * self.interval + self.delay
+
+
+class Scheduler:
+    """
+    Planificateur asyncio de la boucle principale.
+
+    Chaque tâche a sa propre cadence, alignée sur les frontières de bougie : un intervalle qui
+    divise la durée de RESOLUTION tombe aussi sur chaque clôture, et `delay` laisse à l'indexer
+    le temps de publier la bougie. Les fonctions (bloquantes) s'exécutent dans un exécuteur ;
+    les tâches de trading partagent un exécuteur à un seul thread pour ne jamais se chevaucher.
+
+    Une exception n'arrête que la tâche concernée : elle est signalée une fois, puis la tâche
+    est relancée avec un backoff exponentiel (sans dépasser sa prochaine échéance normale).
+    """
+
+    def __init__(self, resolution=RESOLUTION, notify=None, retry_backoff=SCHEDULE_RETRY_BACKOFF, max_backoff=SCHEDULE_MAX_BACKOFF):
+        self.step = resolution_seconds(resolution)
+        self.notify = notify
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.tasks = []
+        self.trading_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trading")
+
+    def add(self, name, func, interval=None, delay=SCHEDULE_DELAY, executor=None, run_at_start=True):
+        """
+        Ajouter une tâche.
+
+        Parameters:
+        name (str): Nom de la tâche (journal et notifications).
+        func (callable): Fonction sans argument à exécuter.
+        interval (int): Cadence en secondes (None = une fois par bougie).
+        delay (float): Décalage après chaque frontière, en secondes.
+        executor (Executor): Exécuteur dédié (par défaut, celui des tâches de trading).
+        run_at_start (bool): Exécuter la tâche dès le démarrage, sans attendre la première frontière.
+        """
+        task = ScheduledTask(name, func, interval or self.step, delay, executor or self.trading_executor, run_at_start)
+        self.tasks.append(task)
+        return task
+
+    def _notify(self, message):
+        print(message)
+        if self.notify is not None:
+            self.notify(message)
+
+    async def _run_task(self, task):
+        loop = asyncio.get_running_loop()
+        next_run = time.time() if task.run_at_start else task.next_boundary(time.time())
+
+        while True:
+            await asyncio.sleep(max(0.0, next_run - time.time()))
+
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(task.executor, task.func)
+            except Exception as e:
+                task.runs += 1
+                task.errors += 1
+                task.failures += 1
+                task.last_error = f"{type(e).__name__}: {e}"
+                inc("task_errors_total", task=task.name)
+                if task.failures == 1:
+                    self._notify(f"Erreur dans la tâche {task.name} : {e}")
+                backoff = min(self.retry_backoff * 2 ** (task.failures - 1), self.max_backoff)
+                backoff *= random.uniform(0.8, 1.2)
+                next_run = min(time.time() + backoff, task.next_boundary(time.time()))
+                continue
+            finally:
+                task.last_duration = time.perf_counter() - start
+                observe("task_seconds", task.last_duration, task=task.name)
+
+            task.runs += 1
+            if task.failures > 0:
+                self._notify(f"Tâche {task.name} rétablie après {task.failures} échecs")
+            task.failures = 0
+            task.last_success = time.time()
+            next_run = task.next_boundary(time.time())
+
+    def status(self):
+        """
+        Returns:
+        dict: {nom: statistiques d'exécution} de chaque tâche.
+        """
+        return {
+            task.name: {
+                "runs": task.runs,
+                "errors": task.errors,
+                "failures": task.failures,
+                "last_success": task.last_success,
+                "last_error": task.last_error,
+                "last_duration": task.last_duration,
+            }
+            for task in self.tasks
+        }
+
+    async def run(self):
+        await asyncio.gather(*[self._run_task(task) for task in self.tasks])
+
+    def run_forever(self):
+        asyncio.run(self.run())
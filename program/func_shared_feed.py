@@ -0,0 +1,178 @@
+import json
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+from constants import SUPERVISOR_FEED_MAX_AGE, SUPERVISOR_MARKETS_BYTES
+from func_public import PriceSnapshot
+
+# En-tête du segment (int64) : compteur de séquence, nombre de marchés, bougies par marché,
+# taille réservée aux métadonnées, taille des métadonnées, version des métadonnées, date de publication (ms)
+_HEADER = 8
+_SEQ, _CAPACITY, _LIMIT, _MARKETS_BYTES, _MARKETS_LEN, _MARKETS_VERSION, _UPDATED_MS = range(7)
+_NAME_DTYPE = np.dtype("S32")
+
+
+class SharedMarketFeed:
+    """
+    Instantané des prix et des métadonnées des marchés en mémoire partagée, publié par un seul
+    processus (le superviseur) et lu par les workers sans nouvel appel à l'indexer.
+
+    Le segment contient la liste fixe des marchés, la date de la dernière bougie de chaque marché,
+    la matrice des prix (marchés x `limit`, alignée comme `PriceSnapshot`) et les métadonnées des
+    marchés en JSON. L'écrivain rend le compteur de séquence impair pendant une publication ; un
+    lecteur recommence sa copie si le compteur était impair ou a changé entre-temps (seqlock).
+
+    Côté worker, l'objet remplace le flux WebSocket (`set_market_stream`) : mêmes méthodes
+    `has_market`, `update_candles`, `snapshot` et `markets_data`. Un marché absent du segment, ou
+    un segment qui n'est plus publié depuis SUPERVISOR_FEED_MAX_AGE secondes, repasse par l'API REST.
+    """
+
+    def __init__(self, shm, owner, max_age=SUPERVISOR_FEED_MAX_AGE):
+        self.shm = shm
+        self.owner = owner
+        self.max_age = max_age
+        self.header = np.ndarray(_HEADER, dtype=np.int64, buffer=shm.buf)
+        capacity, limit, markets_bytes = (int(v) for v in self.header[[_CAPACITY, _LIMIT, _MARKETS_BYTES]])
+        offset = self.header.nbytes
+        self.names = np.ndarray(capacity, dtype=_NAME_DTYPE, buffer=shm.buf, offset=offset)
+        offset += self.names.nbytes
+        self.epochs = np.ndarray(capacity, dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.epochs.nbytes
+        self.prices = np.ndarray((capacity, limit), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += self.prices.nbytes
+        self.markets_json = np.ndarray(markets_bytes, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+        self.limit = limit
+        self.index = {name.decode(): row for row, name in enumerate(self.names)}
+        self.local = {}
+        self._markets_cache = (None, None)
+
+    @classmethod
+    def create(cls, markets, limit=100, markets_bytes=SUPERVISOR_MARKETS_BYTES):
+        """
+        Créer le segment pour une liste fixe de marchés (côté superviseur).
+        """
+        markets = list(dict.fromkeys(markets))
+        size = (_HEADER * 8 + len(markets) * (_NAME_DTYPE.itemsize + 8 + limit * 8) + markets_bytes)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        header = np.ndarray(_HEADER, dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[[_CAPACITY, _LIMIT, _MARKETS_BYTES]] = (len(markets), limit, markets_bytes)
+        del header
+        feed = cls(shm, owner=True)
+        feed.names[:] = [market.encode() for market in markets]
+        feed.index = {market: row for row, market in enumerate(markets)}
+        feed.epochs[:] = 0
+        feed.prices[:] = np.nan
+        return feed
+
+    @classmethod
+    def attach(cls, name, max_age=SUPERVISOR_FEED_MAX_AGE):
+        """
+        Ouvrir un segment existant (côté worker).
+        """
+        return cls(shared_memory.SharedMemory(name=name), owner=False, max_age=max_age)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    # --- Écriture (superviseur) ---
+
+    def publish(self, snapshot, markets_data=None):
+        """
+        Publier les lignes connues d'un `PriceSnapshot` et, éventuellement, les métadonnées des marchés.
+        """
+        rows = np.array([self.index.get(market, -1) for market in snapshot.markets], dtype=np.int64)
+        known = (rows >= 0) & (snapshot.epochs > 0)
+        encoded = None
+        if markets_data is not None:
+            encoded = np.frombuffer(json.dumps(markets_data).encode(), dtype=np.uint8)
+            if len(encoded) > len(self.markets_json):
+                print(f"Métadonnées des marchés trop grandes pour le segment partagé ({len(encoded)} octets)")
+                encoded = None
+
+        self.header[_SEQ] += 1
+        try:
+            self.epochs[rows[known]] = snapshot.epochs[known]
+            self.prices[rows[known]] = snapshot.prices[known][:, -self.limit:]
+            if encoded is not None:
+                self.markets_json[:len(encoded)] = encoded
+                self.header[_MARKETS_LEN] = len(encoded)
+                self.header[_MARKETS_VERSION] += 1
+            self.header[_UPDATED_MS] = int(time.time() * 1000)
+        finally:
+            self.header[_SEQ] += 1
+        return int(known.sum())
+
+    # --- Lecture (workers) ---
+
+    def _read(self, copy, attempts=1000):
+        # Copie cohérente : recommencer si une publication a eu lieu pendant la copie
+        for _ in range(attempts):
+            seq = int(self.header[_SEQ])
+            if seq % 2 == 0:
+                result = copy()
+                if int(self.header[_SEQ]) == seq:
+                    return result
+            time.sleep(0.0005)
+        raise RuntimeError("shared market feed busy")
+
+    def is_fresh(self):
+        updated = self.header[_UPDATED_MS] / 1000
+        return updated > 0 and time.time() - updated <= self.max_age
+
+    def has_market(self, market):
+        row = self.index.get(market)
+        return row is not None and self.epochs[row] > 0 and self.is_fresh()
+
+    def update_candles(self, market, epochs, closes):
+        """
+        Bougies obtenues par l'API REST pour un marché que le segment ne fournit pas.
+        Elles ne servent qu'au prochain `snapshot` : le marché repassera par l'API REST ensuite.
+        """
+        self.local[market] = (epochs[-self.limit:], closes[-self.limit:])
+
+    def snapshot(self, markets):
+        """
+        Construire un `PriceSnapshot` à partir du segment (NaN pour les marchés sans données).
+        """
+        markets = list(dict.fromkeys(markets))
+        rows = np.array([self.index.get(market, -1) for market in markets], dtype=np.int64)
+        shared = (rows >= 0) & (self.epochs[rows] > 0) & self.is_fresh()
+
+        def copy():
+            return self.prices[rows[shared]], self.epochs[rows[shared]]
+
+        prices = np.full((len(markets), self.limit), np.nan, dtype=np.float64)
+        epochs = np.zeros(len(markets), dtype=np.int64)
+        prices[shared], epochs[shared] = self._read(copy)
+
+        local, self.local = self.local, {}
+        for row in np.flatnonzero(~shared):
+            stored = local.get(markets[row])
+            if stored is not None and len(stored[0]) > 0:
+                prices[row, self.limit - len(stored[1]):] = stored[1]
+                epochs[row] = stored[0][-1]
+        return PriceSnapshot(markets, prices, epochs)
+
+    def markets_data(self):
+        """
+        Métadonnées des marchés au format de la réponse /perpetualMarkets (None si pas encore publiées).
+        Le JSON n'est décodé qu'après une nouvelle publication.
+        """
+        version = int(self.header[_MARKETS_VERSION])
+        if version == 0:
+            return None
+        if self._markets_cache[0] != version:
+            data, version = self._read(lambda: (self.markets_json[:int(self.header[_MARKETS_LEN])].tobytes(), int(self.header[_MARKETS_VERSION])))
+            self._markets_cache = (version, json.loads(data))
+        return self._markets_cache[1]
+
+    def close(self):
+        # Libérer les vues NumPy avant de fermer le segment
+        self.header = self.names = self.epochs = self.prices = self.markets_json = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,181 @@
+import multiprocessing
+import time
+
+from constants import (
+    PLACE_TRADES,
+    MANAGE_EXITS,
+    SCHEDULE_EXITS_INTERVAL,
+    SCHEDULE_ENTRIES_INTERVAL,
+    SCHEDULE_DELAY,
+    SUPERVISOR_WORKER_LAG,
+    SUPERVISOR_SUBACCOUNTS,
+    TRADE_STORE_COMPACT_INTERVAL,
+    METRICS_ENABLED,
+    METRICS_PORT,
+    METRICS_LOG_INTERVAL,
+)
+from func_pairs_store import load_cointegrated_pairs
+from func_public import get_recent_prices_snapshot, get_markets_data
+from func_shared_feed import SharedMarketFeed
+from func_trade_store import TradeStore, trade_store_path
+
+
+class Supervisor:
+    """
+    Exécution répartie sur plusieurs processus.
+
+    Les paires cointégrées sont réparties en `workers` parts (`pair_shard`) ; chaque worker est
+    un processus qui trade sa part sur son subcompte, avec son propre journal des trades. Le
+    superviseur est le seul à interroger l'indexer pour les prix : `refresh_feed` publie un
+    instantané des marchés de toutes les parts (et des positions ouvertes de tous les workers)
+    dans un `SharedMarketFeed` que les workers lisent. La charge de l'API ne dépend donc pas du
+    nombre de workers. Un worker arrêté est signalé puis relancé par `check_workers`.
+    """
+
+    def __init__(self, workers, subaccounts=SUPERVISOR_SUBACCOUNTS, notify=None):
+        self.subaccounts = list(subaccounts) if subaccounts is not None else list(range(workers))
+        if len(self.subaccounts) != workers:
+            raise ValueError(f"{workers} workers but {len(self.subaccounts)} subaccounts")
+        self.notify = notify
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = [None] * workers
+        self.feed = None
+        self._trade_stores = None
+
+    def abort_positions(self):
+        """
+        Annuler les ordres et fermer les positions de chaque subcompte, une seule fois, avant le
+        lancement des workers (un worker relancé par `check_workers` ne ferme rien).
+        """
+        from func_connections import get_client
+        from func_private import abort_all_positions
+
+        for subaccount in self.subaccounts:
+            close_orders = abort_all_positions(get_client(subaccount), worker_trade_store(subaccount))
+            print(f"Subcompte {subaccount} : {len(close_orders)} position(s) fermée(s)")
+
+    def start(self, client, markets):
+        """
+        Créer le segment partagé pour `markets` (tous les marchés échangeables), y publier un
+        premier instantané, puis lancer les workers.
+        """
+        self.feed = SharedMarketFeed.create(markets)
+        self.refresh_feed(client)
+        for index in range(len(self.processes)):
+            self._spawn(index)
+        return self
+
+    def _spawn(self, index):
+        process = self.context.Process(
+            target=run_worker,
+            args=(index, len(self.processes), self.subaccounts[index], self.feed.name),
+            name=f"worker-{self.subaccounts[index]}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+        print(f"Worker {index} démarré (subcompte {self.subaccounts[index]}, pid {process.pid})")
+
+    def tracked_markets(self):
+        """
+        Marchés de toutes les parts : paires cointégrées et positions ouvertes de chaque worker.
+        """
+        df = load_cointegrated_pairs()
+        markets = list(df["base_market"]) + list(df["quote_market"])
+
+        # Lecture seule des journaux des workers (ils y écrivent, chacun le sien)
+        if self._trade_stores is None:
+            self._trade_stores = [TradeStore(trade_store_path(subaccount), legacy_json=None) for subaccount in self.subaccounts]
+        for trade_store in self._trade_stores:
+            try:
+                for trade in trade_store.open_trades():
+                    markets += [trade["market_1"], trade["market_2"]]
+            except Exception as e:
+                print(f"Erreur lors de la lecture du journal {trade_store.path} : {e}")
+
+        return list(dict.fromkeys(markets))
+
+    def refresh_feed(self, client, snapshot=None):
+        """
+        Publier un nouvel instantané des prix et les métadonnées des marchés pour les workers.
+        `snapshot` : instantané déjà récupéré (LoopState du superviseur), construit ici s'il n'est pas fourni.
+        """
+        if snapshot is None:
+            snapshot = get_recent_prices_snapshot(client, self.tracked_markets())
+        published = self.feed.publish(snapshot, get_markets_data(client))
+        print(f"Instantané partagé : {published}/{len(snapshot.markets)} marchés")
+
+    def check_workers(self):
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            message = f"Worker {index} (subcompte {self.subaccounts[index]}) arrêté (code {process.exitcode}), redémarrage"
+            print(message)
+            if self.notify is not None:
+                self.notify(message)
+            self._spawn(index)
+
+    def stop(self, timeout=10):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+        if self.feed is not None:
+            self.feed.close()
+            self.feed = None
+
+
+def worker_trade_store(subaccount_number):
+    # Seul le journal du subcompte 0 reprend l'ancien bot_agents.json
+    return TradeStore(trade_store_path(subaccount_number), legacy_json="bot_agents.json" if subaccount_number == 0 else None)
+
+
+def run_worker(index, workers, subaccount_number, feed_name):
+    """
+    Point d'entrée d'un worker : boucle de trading (sorties et entrées) sur la part `index`
+    des paires, pour le subcompte `subaccount_number`, avec les prix du segment partagé.
+    """
+    from func_connections import get_client
+    from func_messaging import send_message
+    from func_metrics import instrument_client, start_metrics_server, log_metrics_summary
+    from func_pairs_store import set_pair_shard
+    from func_public import set_market_stream
+    from func_scheduler import Scheduler, LoopState
+    from func_trade_store import set_trade_store, get_trade_store
+
+    def notify(message):
+        send_message(f"[subaccount {subaccount_number}] {message}")
+
+    set_pair_shard(index, workers)
+    set_trade_store(worker_trade_store(subaccount_number))
+    set_market_stream(SharedMarketFeed.attach(feed_name))
+
+    try:
+        client = instrument_client(get_client(subaccount_number))
+    except Exception as e:
+        print(f"Worker {index} : connexion impossible : {e}")
+        notify(f"Failed to connect to client {e}")
+        raise SystemExit(1)
+
+    # Le superviseur publie les prix SCHEDULE_DELAY secondes après chaque frontière
+    scheduler = Scheduler(notify=notify)
+    state = LoopState(client)
+    delay = SCHEDULE_DELAY + SUPERVISOR_WORKER_LAG
+    if MANAGE_EXITS:
+        from func_exit_pairs import manage_trade_exits
+        scheduler.add("exits", lambda: manage_trade_exits(client, *state.get()), interval=SCHEDULE_EXITS_INTERVAL, delay=delay)
+    if PLACE_TRADES:
+        from func_entry_pairs import open_positions
+        scheduler.add("entries", lambda: open_positions(client, *state.get()), interval=SCHEDULE_ENTRIES_INTERVAL, delay=delay)
+    scheduler.add("compact", get_trade_store().compact, interval=TRADE_STORE_COMPACT_INTERVAL, run_at_start=False)
+
+    # Un endpoint de métriques par worker, sur les ports suivant celui du superviseur
+    if METRICS_ENABLED:
+        start_metrics_server(port=METRICS_PORT + 1 + index if METRICS_PORT is not None else None)
+        scheduler.add("metrics", log_metrics_summary, interval=METRICS_LOG_INTERVAL, run_at_start=False)
+
+    print(f"Worker {index} : {len(load_cointegrated_pairs())} paires, subcompte {subaccount_number}")
+    scheduler.run_forever()
@@ -0,0 +1,161 @@
+import itertools
+import os
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from constants import (
+    SWEEP_ZSCORE_THRESHOLDS,
+    SWEEP_ZSCORE_WINDOWS,
+    SWEEP_LOOKBACK_HOURS,
+    SWEEP_PVALUE_THRESHOLDS,
+    SWEEP_TRAIN_FRACTION,
+    SWEEP_WORKERS,
+    SWEEP_RESULTS_FILE,
+    RESOLUTION,
+)
+from func_backtest import run_backtest
+from func_cointegration import compute_cointegration, prefilter_pairs
+from func_utils import resolution_seconds
+
+# État des processus du pool : matrice de prix attachée en mémoire partagée (sans copie)
+_WORKER = {}
+
+
+def _init_sweep_worker(name, shape, markets, candidates, split, markets_data):
+    # Le processus parent reste propriétaire du segment et le libère
+    shm = shared_memory.SharedMemory(name=name)
+    prices = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+    _WORKER.update(shm=shm, prices=prices, markets=markets, candidates=candidates, split=split, markets_data=markets_data)
+
+
+def _run_point(point):
+    lookback, pvalue, thresh, window = point
+    candidates = _WORKER["candidates"][lookback]
+    pairs = candidates[candidates["p_value"] < pvalue]
+
+    # Backtest hors échantillon, avec `window` bougies d'amorçage pour le z-score
+    start = max(0, _WORKER["split"] - window)
+    result = run_backtest(
+        _WORKER["prices"][start:],
+        _WORKER["markets"],
+        pairs,
+        zscore_thresh=thresh,
+        window=window,
+        markets_data=_WORKER["markets_data"],
+    )
+    return {
+        "lookback_hours": lookback,
+        "p_value_thresh": pvalue,
+        "zscore_thresh": thresh,
+        "zscore_window": window,
+        "n_pairs": len(pairs),
+        "n_trades": result["n_trades"],
+        "pnl": result["pnl"],
+        "sharpe": result["sharpe"],
+        "turnover": result["turnover"],
+        "run_time": result["elapsed"],
+    }
+
+
+def cointegration_candidates(prices, markets, split, lookbacks, max_pvalue):
+    """
+    Paires candidates de chaque lookback, calculées une seule fois sur les bougies précédant `split`.
+
+    Returns:
+    dict: {lookback: pd.DataFrame(base_market, quote_market, hedge_ratio, p_value)}.
+    """
+    step_hours = resolution_seconds(RESOLUTION) / 3600
+    candidates = {}
+    for lookback in lookbacks:
+        n_candles = int(lookback / step_hours)
+        window = prices[max(0, split - n_candles):split]
+        results = compute_cointegration(window, prefilter_pairs(window))
+        results = results[results["p_value"] < max_pvalue]
+        candidates[lookback] = pd.DataFrame({
+            "base_market": [markets[i] for i in results["base"]],
+            "quote_market": [markets[i] for i in results["quote"]],
+            "hedge_ratio": results["hedge_ratio"].astype(np.float64),
+            "half_life": results["half_life"].astype(np.float64),
+            "p_value": results["p_value"].astype(np.float64),
+        })
+    return candidates
+
+
+def run_sweep(
+    df_market_prices,
+    zscore_thresholds=SWEEP_ZSCORE_THRESHOLDS,
+    zscore_windows=SWEEP_ZSCORE_WINDOWS,
+    lookbacks=SWEEP_LOOKBACK_HOURS,
+    pvalues=SWEEP_PVALUE_THRESHOLDS,
+    split=None,
+    markets_data=None,
+    workers=SWEEP_WORKERS,
+    results_file=SWEEP_RESULTS_FILE,
+):
+    """
+    Balayage conjoint de ZSCORE_THRESH, de la fenêtre du z-score, du lookback et du seuil de p-value.
+
+    La cointégration est calculée une fois par lookback sur les bougies précédant `split`
+    (au plus `split` bougies, même si le lookback est plus long), puis chaque point de la
+    grille est backtesté sur les bougies suivantes. La matrice de prix
+    est placée en mémoire partagée et lue sans copie par les processus du pool.
+
+    Parameters:
+    df_market_prices (pd.DataFrame): Prix de clôture, une colonne par marché.
+    split (int): Première bougie hors échantillon (par défaut SWEEP_TRAIN_FRACTION des bougies).
+    markets_data (dict): Métadonnées des marchés pour l'arrondi tick / step (optionnel).
+    workers (int): Nombre de processus (None = nombre de cœurs, 1 = sans pool).
+    results_file (str): Fichier CSV des résultats (None pour ne pas l'écrire).
+
+    Returns:
+    pd.DataFrame: Une ligne par configuration : PnL, Sharpe, turnover, trades et durée, triée par Sharpe.
+    """
+    start = time.perf_counter()
+    markets = df_market_prices.columns.to_list()
+    prices = np.ascontiguousarray(df_market_prices.to_numpy(dtype=np.float64))
+    if split is None:
+        split = int(len(prices) * SWEEP_TRAIN_FRACTION)
+    if split >= len(prices) - max(zscore_windows):
+        raise ValueError(
+            f"split={split} leaves no out-of-sample data: {len(prices)} candles, z-score window up to {max(zscore_windows)}"
+        )
+
+    candidates = cointegration_candidates(prices, markets, split, lookbacks, max(pvalues))
+    grid = list(itertools.product(lookbacks, pvalues, zscore_thresholds, zscore_windows))
+
+    shm = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    try:
+        shared = np.ndarray(prices.shape, dtype=np.float64, buffer=shm.buf)
+        shared[:] = prices
+        initargs = (shm.name, prices.shape, markets, candidates, split, markets_data)
+
+        if workers == 1:
+            _WORKER.update(prices=shared, markets=markets, candidates=candidates, split=split, markets_data=markets_data)
+            rows = [_run_point(point) for point in grid]
+            _WORKER.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep_worker, initargs=initargs) as executor:
+                rows = list(executor.map(_run_point, grid, chunksize=max(1, len(grid) // 64)))
+    finally:
+        shm.close()
+        shm.unlink()
+
+    results = pd.DataFrame(rows).sort_values("sharpe", ascending=False).reset_index(drop=True)
+    if results_file:
+        results.to_csv(results_file, index=False)
+    print(f"Balayage : {len(grid)} configurations en {time.perf_counter() - start:.1f}s")
+    return results
+
+
+if __name__ == "__main__":
+    # Balayage hors ligne sur les bougies stockées localement
+    from func_candle_store import CandleStore
+    from func_public import build_market_prices_frame
+
+    store = CandleStore()
+    markets = sorted(f.rsplit("_", 1)[0] for f in os.listdir(store.directory) if f.endswith(f"_{RESOLUTION}.npy"))
+    df = build_market_prices_frame(markets, [store.load(market) for market in markets])
+    print(run_sweep(df).head(10))
@@ -0,0 +1,161 @@
+import os
+import json
+import sqlite3
+import threading
+import time
+
+from constants import TRADE_STORE_FILE
+from func_metrics import timed
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    trade_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    market_1 TEXT NOT NULL,
+    market_2 TEXT NOT NULL,
+    order_id_m1 TEXT,
+    order_id_m2 TEXT,
+    status TEXT NOT NULL,
+    opened_at REAL NOT NULL,
+    closed_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trades_status ON trades (status);
+"""
+
+
+class TradeStore:
+    """
+    Journal transactionnel des paires ouvertes (SQLite en mode WAL).
+
+    Chaque paire est une ligne : l'ouverture et la fermeture ne touchent que la paire
+    concernée, et chaque écriture est atomique ; `compact` (tâche planifiée) intègre
+    périodiquement le journal WAL dans la base. Le dictionnaire BotAgent complet est conservé
+    dans `data` ; `open_trades()` le restitue avec ses clés `trade_id` et `opened_at`.
+    `generation` augmente à chaque écriture, pour invalider les vues en cache.
+    """
+
+    def __init__(self, path=TRADE_STORE_FILE, legacy_json="bot_agents.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        if legacy_json:
+            self._import_legacy_json(legacy_json)
+
+    def _import_legacy_json(self, legacy_json):
+        # Reprendre une seule fois les paires de l'ancien fichier bot_agents.json
+        if not os.path.exists(legacy_json):
+            return
+        try:
+            with open(legacy_json) as f:
+                agents = json.load(f)
+            with self._lock, self._conn:
+                self._conn.execute("BEGIN")
+                for agent in agents:
+                    self._insert(agent)
+            os.replace(legacy_json, legacy_json + ".imported")
+            print(f"{len(agents)} paires importées depuis {legacy_json}")
+        except Exception as e:
+            print(f"Erreur lors de l'import de {legacy_json} : {e}")
+
+    def _insert(self, agent):
+        cursor = self._conn.execute(
+            "INSERT INTO trades (market_1, market_2, order_id_m1, order_id_m2, status, opened_at, data) VALUES (?, ?, ?, ?, 'LIVE', ?, ?)",
+            (agent["market_1"], agent["market_2"], agent.get("order_id_m1"), agent.get("order_id_m2"), time.time(), json.dumps(agent)),
+        )
+        self.generation += 1
+        return cursor.lastrowid
+
+    @timed("trade_store")
+    def insert(self, agent):
+        """
+        Enregistrer une nouvelle paire ouverte.
+
+        Returns:
+        int: L'identifiant de la paire.
+        """
+        with self._lock, self._conn:
+            return self._insert(agent)
+
+    @timed("trade_store")
+    def close(self, trade_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE trades SET status = 'CLOSED', closed_at = ? WHERE trade_id = ? AND status = 'LIVE'",
+                (time.time(), trade_id),
+            )
+            self.generation += 1
+
+    @timed("trade_store")
+    def update(self, trade_id, fields):
+        """
+        Compléter le dictionnaire BotAgent d'une paire encore ouverte (par ex. une jambe déjà fermée).
+        """
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT data FROM trades WHERE trade_id = ? AND status = 'LIVE'", (trade_id,)).fetchone()
+            if row is None:
+                return
+            agent = json.loads(row[0])
+            agent.update(fields)
+            self._conn.execute("UPDATE trades SET data = ? WHERE trade_id = ?", (json.dumps(agent), trade_id))
+            self.generation += 1
+
+    @timed("trade_store")
+    def close_all(self):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE trades SET status = 'CLOSED', closed_at = ? WHERE status = 'LIVE'", (time.time(),))
+            self.generation += 1
+
+    def open_trades(self):
+        """
+        Paires encore ouvertes, dans l'ordre d'ouverture.
+
+        Returns:
+        list: Dictionnaires BotAgent, avec leur `trade_id` et leur date d'ouverture `opened_at` (epoch).
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT trade_id, opened_at, data FROM trades WHERE status = 'LIVE' ORDER BY trade_id").fetchall()
+        trades = []
+        for trade_id, opened_at, data in rows:
+            agent = json.loads(data)
+            agent["trade_id"] = trade_id
+            agent["opened_at"] = opened_at
+            trades.append(agent)
+        return trades
+
+    @timed("trade_store")
+    def compact(self):
+        """
+        Intégrer le journal WAL dans la base principale (et le tronquer).
+        """
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+# Journal partagé par le processus
+_TRADE_STORE = None
+
+
+def trade_store_path(subaccount_number=0):
+    """
+    Journal des trades d'un subcompte (celui du subcompte 0 est TRADE_STORE_FILE).
+    """
+    if subaccount_number == 0:
+        return TRADE_STORE_FILE
+    root, ext = os.path.splitext(TRADE_STORE_FILE)
+    return f"{root}_{subaccount_number}{ext}"
+
+
+def set_trade_store(trade_store):
+    global _TRADE_STORE
+    _TRADE_STORE = trade_store
+
+
+def get_trade_store():
+    global _TRADE_STORE
+    if _TRADE_STORE is None:
+        _TRADE_STORE = TradeStore()
+    return _TRADE_STORE
@@ -0,0 +1,120 @@
+import json
+import re
+import time
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from constants import INDEXER_REST_URL, INDEXER_MAX_CONCURRENCY, INDEXER_HTTP_TIMEOUT
+from func_metrics import inc, observe
+
+# Analyseur JSON rapide optionnel
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Champs des bougies lus directement dans la réponse brute
+_CLOSE_RE = re.compile(rb'"close"\s*:\s*"([^"]*)"')
+_STARTED_AT_RE = re.compile(rb'"startedAt"\s*:\s*"([^"]{19})')
+
+
+def decode_candles(body):
+    """
+    Décoder une réponse /candles directement en tableaux NumPy, sans créer un dictionnaire par bougie.
+    Si la réponse n'a pas la forme attendue, elle est décodée comme du JSON.
+
+    Returns:
+    tuple: (epochs int64, closes float64), triés par date croissante et sans doublons.
+    """
+    closes = _CLOSE_RE.findall(body)
+    started = _STARTED_AT_RE.findall(body)
+    if len(closes) != len(started):
+        candles = json_loads(body)["candles"]
+        closes = [candle["close"] for candle in candles]
+        started = [candle["startedAt"][:19] for candle in candles]
+    if len(closes) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    epochs = np.array(started, dtype="S19").astype("datetime64[s]").astype(np.int64)
+    closes = np.array(closes, dtype="S32").astype(np.float64)
+    epochs, first = np.unique(epochs, return_index=True)
+    return epochs, closes[first]
+
+
+class IndexerTransport:
+    """
+    Transport HTTP partagé pour l'API REST de l'indexer dYdX v4.
+
+    Une seule session `requests` : pool de connexions persistantes (keep-alive) dimensionné
+    sur INDEXER_MAX_CONCURRENCY, réponses compressées, délais d'attente. Les réponses JSON
+    sont décodées par orjson s'il est installé ; les bougies sont décodées directement en
+    tableaux NumPy (`decode_candles`).
+    """
+
+    def __init__(self, base_url=INDEXER_REST_URL, pool_size=INDEXER_MAX_CONCURRENCY, timeout=INDEXER_HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip, deflate"})
+
+    def get(self, path, params=None, endpoint=None):
+        """
+        Requête GET ; lève une exception si le statut n'est pas 2xx (pour `call_with_retry`).
+
+        Returns:
+        bytes: Le corps de la réponse, décompressé.
+        """
+        endpoint = endpoint or path
+        start = time.perf_counter()
+        try:
+            response = self.session.get(self.base_url + path, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.content
+        except Exception:
+            inc("api_errors_total", endpoint=f"transport.{endpoint}")
+            raise
+        finally:
+            inc("api_calls_total", endpoint=f"transport.{endpoint}")
+            observe("api_call_seconds", time.perf_counter() - start, endpoint=f"transport.{endpoint}")
+
+    def get_json(self, path, params=None, endpoint=None):
+        return json_loads(self.get(path, params, endpoint))
+
+    def get_markets(self):
+        """
+        Returns:
+        dict: {"markets": {ticker: {"status", "tickSize", "stepSize", ...}}}, la réponse /perpetualMarkets.
+        """
+        return self.get_json("/perpetualMarkets", endpoint="get_markets")
+
+    def get_candles_arrays(self, market, resolution, from_iso=None, to_iso=None, limit=100):
+        """
+        Bougies d'un marché, décodées directement en tableaux.
+
+        Returns:
+        tuple: (epochs int64, closes float64), triés par date croissante.
+        """
+        params = {"resolution": resolution, "limit": limit}
+        if from_iso:
+            params["fromISO"] = from_iso
+        if to_iso:
+            params["toISO"] = to_iso
+        return decode_candles(self.get(f"/candles/perpetualMarkets/{market}", params, endpoint="get_candles"))
+
+
+# Transport du processus (None = appels par le client)
+_INDEXER_TRANSPORT = None
+
+
+def set_indexer_transport(transport):
+    global _INDEXER_TRANSPORT
+    _INDEXER_TRANSPORT = transport
+
+
+def get_indexer_transport():
+    return _INDEXER_TRANSPORT
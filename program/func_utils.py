@@ -1,4 +1,21 @@
 from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+import numpy as np
+from constants import CANDLE_LOOKBACK_HOURS
+
+
+# Count decimals of a tick / step size
+@lru_cache(maxsize=4096)
+def get_decimals(match_num):
+
+  """
+    Number of decimals of an example number such as "0.001" or 1e-05
+    Cached, so tick and step sizes are only parsed once
+  """
+
+  exponent = Decimal(str(match_num)).as_tuple().exponent
+  return max(0, -exponent)
 
 
 # Format number
@@ -9,14 +26,9 @@ def format_number(curr_num, match_num):
     Function will return the correctly formatted string
   """
 
-  curr_num_string = f"{curr_num}"
-  match_num_string = f"{match_num}"
-
-  if "." in match_num_string:
-    match_decimals = len(match_num_string.split(".")[1])
-    curr_num_string = f"{curr_num:.{match_decimals}f}"
-    curr_num_string = curr_num_string[:]
-    return curr_num_string
+  match_decimals = get_decimals(match_num)
+  if match_decimals > 0:
+    return f"{curr_num:.{match_decimals}f}"
   else:
     return f"{int(curr_num)}"
 
@@ -26,35 +38,55 @@ def format_time(timestamp):
   return timestamp.replace(microsecond=0).isoformat()
 
 
+# Candle resolutions in seconds
+RESOLUTION_SECONDS = {
+  "1MIN": 60,
+  "5MINS": 300,
+  "15MINS": 900,
+  "30MINS": 1800,
+  "1HOUR": 3600,
+  "4HOURS": 14400,
+  "1DAY": 86400,
+}
+
+
+def resolution_seconds(resolution):
+  return RESOLUTION_SECONDS[resolution]
+
+
+# Parse ISO timestamps
+def parse_iso_epochs(iso_strings):
+
+  """
+    Convert indexer timestamps such as "2024-01-01T00:00:00.000Z"
+    into int64 epoch seconds in one vectorized pass
+  """
+
+  seconds = [iso[:19] for iso in iso_strings]
+  return np.array(seconds, dtype="datetime64[s]").astype(np.int64)
+
+
 # Get ISO Times
-def get_ISO_times():
+def get_ISO_times(lookback_hours=CANDLE_LOOKBACK_HOURS):
+
+  """
+    Split the lookback into windows of 100 hours (one candles request each)
+    Returns {"range_1": {"from_iso", "to_iso"}, ...}, most recent window first
+  """
 
   # Get timestamps
-  date_start_0 = datetime.now()
-  date_start_1 = date_start_0 - timedelta(hours=100)
-  date_start_2 = date_start_1 - timedelta(hours=100)
-  date_start_3 = date_start_2 - timedelta(hours=100)
-  date_start_4 = date_start_3 - timedelta(hours=100)
-
-  # Format datetimes
-  times_dict = {
-    "range_1": {
-      "from_iso": format_time(date_start_1),
-      "to_iso": format_time(date_start_0),
-    },
-    "range_2": {
-      "from_iso": format_time(date_start_2),
-      "to_iso": format_time(date_start_1),
-    },
-    "range_3": {
-      "from_iso": format_time(date_start_3),
-      "to_iso": format_time(date_start_2),
-    },
-    "range_4": {
-      "from_iso": format_time(date_start_4),
-      "to_iso": format_time(date_start_3),
-    },
-  }
+  date_start = datetime.now()
+  times_dict = {}
+  remaining = lookback_hours
+  while remaining > 0:
+    hours = min(100, remaining)
+    date_end = date_start
+    date_start = date_end - timedelta(hours=hours)
+    times_dict[f"range_{len(times_dict) + 1}"] = {
+      "from_iso": format_time(date_start),
+      "to_iso": format_time(date_end),
+    }
+    remaining -= hours
 
   # Return result
   return times_dict
@@ -0,0 +1,161 @@
+import random
+from types import SimpleNamespace
+
+from constants import ORDER_GOOD_TIL_SECONDS
+from func_transport import IndexerTransport
+
+
+class _Response(SimpleNamespace):
+    pass
+
+
+def _chain_enums():
+    # v4_client_py (grpc, web3...) n'est importé qu'au premier ordre
+    from v4_client_py.clients.helpers import chain_helpers
+    return chain_helpers
+
+
+def make_order_id(market, client_id):
+    """
+    Identifiant d'ordre du bot : marché et clientId. L'indexer ne filtre pas les ordres par
+    clientId, le marché permet de retrouver l'ordre avec une seule requête.
+    """
+    return f"{market}:{client_id}"
+
+
+def parse_order_id(order_id):
+    market, client_id = order_id.rsplit(":", 1)
+    return market, client_id
+
+
+class DydxV4Client:
+    """
+    Client dYdX v4 du bot, pour un subcompte.
+
+    Enveloppe le CompositeClient de v4_client_py derrière les espaces `public` et `private`
+    utilisés par le bot (et chronométrés par `instrument_client`) :
+    - les lectures passent par l'API REST de l'indexer (`IndexerTransport`), filtrées par
+      l'adresse du portefeuille et le numéro de subcompte ;
+    - les ordres sont signés et diffusés par le CompositeClient (`place_order`, `cancel_order`).
+    Les réponses ont la forme de l'indexer, dans l'attribut `data`.
+    `enums` : énumérations des ordres (OrderType, OrderSide, ...), celles de v4_client_py par défaut.
+    """
+
+    def __init__(self, composite, subaccount, transport=None, enums=None):
+        self.composite = composite
+        self.subaccount = subaccount
+        self.address = str(subaccount.wallet.address())
+        self.subaccount_number = subaccount.subaccount_number
+        self.transport = transport or IndexerTransport()
+        self.enums = enums
+
+        self.public = SimpleNamespace(
+            get_markets=self.get_markets,
+            get_candles=self.get_candles,
+        )
+        self.private = SimpleNamespace(
+            get_account=self.get_account,
+            get_positions=self.get_positions,
+            get_order_by_id=self.get_order_by_id,
+            create_order=self.create_order,
+            cancel_all_orders=self.cancel_all_orders,
+        )
+
+    def _scope(self, **params):
+        return dict(address=self.address, subaccountNumber=self.subaccount_number, **params)
+
+    # --- Public ---
+
+    def get_markets(self):
+        return _Response(data=self.transport.get_markets())
+
+    def get_candles(self, market, resolution, from_iso=None, to_iso=None, limit=100):
+        params = {"resolution": resolution, "limit": limit}
+        if from_iso:
+            params["fromISO"] = from_iso
+        if to_iso:
+            params["toISO"] = to_iso
+        return _Response(data=self.transport.get_json(f"/candles/perpetualMarkets/{market}", params, endpoint="get_candles"))
+
+    # --- Private ---
+
+    def get_account(self):
+        """
+        Returns:
+        _Response: data = {"subaccount": {"equity", "freeCollateral", ...}}.
+        """
+        path = f"/addresses/{self.address}/subaccountNumber/{self.subaccount_number}"
+        return _Response(data=self.transport.get_json(path, endpoint="get_account"))
+
+    def get_positions(self, status=None, market=None):
+        """
+        Returns:
+        _Response: data = {"positions": [{"market", "side", "size" (signé), "entryPrice", ...}]}.
+        """
+        params = self._scope(status=status) if status else self._scope()
+        positions = self.transport.get_json("/perpetualPositions", params, endpoint="get_positions")["positions"]
+        if market is not None:
+            positions = [p for p in positions if p["market"] == market]
+        return _Response(data={"positions": positions})
+
+    def get_order_by_id(self, order_id):
+        """
+        Dernier état d'un ordre du bot (voir `make_order_id`).
+
+        Returns:
+        _Response: data = {"order": {"id", "market", "side", "size", "status", "totalFilled", ...}}.
+        """
+        market, client_id = parse_order_id(order_id)
+        params = self._scope(ticker=market, returnLatestOrders="true")
+        for order in self.transport.get_json("/orders", params, endpoint="get_orders"):
+            if str(order["clientId"]) == client_id:
+                return _Response(data={"order": dict(order, id=order_id, market=order["ticker"])})
+        raise LookupError(f"order {order_id} not found")
+
+    def create_order(self, market, side, size, price, reduce_only, order_type="MARKET", time_in_force="FOK",
+                     post_only=False, good_til_seconds=ORDER_GOOD_TIL_SECONDS):
+        """
+        Signer et diffuser un ordre ; son état est ensuite lu par `get_order_by_id`.
+
+        Returns:
+        _Response: data = {"order": {"id", "market", "side", "size", "price", "status": "PENDING", ...}}.
+        """
+        enums = self.enums or _chain_enums()
+        client_id = random.randint(0, 2 ** 32 - 1)
+        tx = self.composite.place_order(
+            self.subaccount,
+            market=market,
+            type=enums.OrderType[order_type],
+            side=enums.OrderSide[side],
+            price=float(price),
+            size=float(size),
+            client_id=client_id,
+            time_in_force=enums.OrderTimeInForce[time_in_force],
+            good_til_time_in_seconds=good_til_seconds,
+            execution=enums.OrderExecution.DEFAULT,
+            post_only=post_only,
+            reduce_only=reduce_only,
+        )
+        order = {"id": make_order_id(market, client_id), "clientId": str(client_id), "market": market, "side": side,
+                 "size": size, "price": price, "reduceOnly": reduce_only, "status": "PENDING", "tx": str(tx)}
+        return _Response(data={"order": order})
+
+    def cancel_all_orders(self, market=None):
+        """
+        Annuler les ordres ouverts du subcompte (d'un marché, ou de tous).
+
+        Returns:
+        _Response: data = {"cancelOrders": [ordres annulés]}.
+        """
+        params = self._scope(status="OPEN", ticker=market) if market else self._scope(status="OPEN")
+        orders = self.transport.get_json("/orders", params, endpoint="get_orders")
+        for order in orders:
+            self.composite.cancel_order(
+                self.subaccount,
+                client_id=int(order["clientId"]),
+                market=order["ticker"],
+                order_flags=int(order["orderFlags"]),
+                good_til_time_in_seconds=ORDER_GOOD_TIL_SECONDS,
+                good_til_block=int(order.get("goodTilBlock") or 0),
+            )
+        return _Response(data={"cancelOrders": orders})
@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+import numpy as np
+import websocket
+
+from constants import RESOLUTION, INDEXER_WS_URL, WS_RECONNECT_DELAY
+from func_public import PriceSnapshot, set_market_stream
+from func_utils import parse_iso_epochs, resolution_seconds
+
+
+class MarketDataStream:
+    """
+    Flux WebSocket de l'indexer : bougies (v4_candles) et métadonnées des marchés (v4_markets).
+
+    Les messages sont traités dans un thread d'arrière-plan et tenus dans un stockage en mémoire,
+    toujours à jour, lu par l'entrée et la sortie à la place des appels REST :
+    - `snapshot(markets)` retourne un `PriceSnapshot` des 100 dernières clôtures ;
+    - `markets_data()` retourne les métadonnées au format de la réponse /perpetualMarkets.
+    """
+
+    def __init__(self, url=INDEXER_WS_URL, resolution=RESOLUTION, limit=100):
+        self.url = url
+        self.resolution = resolution
+        self.step = resolution_seconds(resolution)
+        self.limit = limit
+        self.candles = {}
+        self.markets = {}
+        self.subscribed = set()
+        self.connected = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._subscribe_lock = threading.Lock()
+        self._ws = None
+        self._thread = None
+
+    # Connexion
+
+    def start(self):
+        """
+        Démarrer la connexion dans un thread d'arrière-plan (reconnexion automatique).
+        """
+        self._ws = websocket.WebSocketApp(
+            self.url,
+            on_open=self._on_open,
+            on_message=self._on_message,
+            on_error=self._on_error,
+            on_close=self._on_close,
+        )
+        self._thread = threading.Thread(
+            target=self._run,
+            name="market-data-stream",
+            daemon=True,
+        )
+        self._thread.start()
+        set_market_stream(self)
+        return self
+
+    def _run(self):
+        # Reconnexion gérée ici plutôt que par run_forever(reconnect=...), qui n'appelle pas
+        # on_close lors d'une coupure : `connected` doit refléter l'état réel de la connexion
+        while not self._stopping.is_set():
+            self._ws.run_forever()
+            self._stopping.wait(WS_RECONNECT_DELAY)
+
+    def stop(self):
+        set_market_stream(None)
+        self._stopping.set()
+        if self._ws is not None:
+            self._ws.close()
+
+    def subscribe(self, markets):
+        """
+        S'abonner aux bougies des marchés qui ne sont pas encore suivis.
+        """
+        # Sous verrou : une connexion qui s'ouvre en même temps n'envoie pas l'abonnement une seconde fois
+        with self._subscribe_lock:
+            for market in markets:
+                if market in self.subscribed:
+                    continue
+                self.subscribed.add(market)
+                if self.connected.is_set():
+                    self._send_candles_subscription(market)
+
+    def _send_candles_subscription(self, market):
+        self._ws.send(json.dumps({"type": "subscribe", "channel": "v4_candles", "id": f"{market}/{self.resolution}"}))
+
+    def _on_open(self, ws):
+        print("Flux WebSocket connecté")
+        ws.send(json.dumps({"type": "subscribe", "channel": "v4_markets", "batched": True}))
+        with self._subscribe_lock:
+            self.connected.set()
+            for market in self.subscribed:
+                self._send_candles_subscription(market)
+
+    def _on_error(self, ws, error):
+        print(f"Erreur du flux WebSocket : {error}")
+
+    def _on_close(self, ws, status_code, message):
+        self.connected.clear()
+        print(f"Flux WebSocket fermé ({status_code})")
+
+    # Messages
+
+    def _on_message(self, ws, message):
+        try:
+            data = json.loads(message)
+            channel = data.get("channel")
+            if data.get("type") == "channel_batch_data":
+                contents = data["contents"]
+            elif data.get("type") in ("subscribed", "channel_data"):
+                contents = [data["contents"]]
+            else:
+                return
+
+            for content in contents:
+                if channel == "v4_candles":
+                    self._handle_candles(data["id"].split("/")[0], content)
+                elif channel == "v4_markets":
+                    self._handle_markets(content)
+        except Exception as e:
+            print(f"Message WebSocket ignoré : {e}")
+
+    def _handle_candles(self, market, content):
+        # Message initial : historique complet ; ensuite : une bougie à la fois
+        candles = content["candles"] if "candles" in content else [content]
+        if len(candles) == 0:
+            return
+
+        epochs = parse_iso_epochs([candle["startedAt"] for candle in candles])
+        closes = np.array([candle["close"] for candle in candles], dtype=np.float64)
+        order = np.argsort(epochs, kind="stable")
+        self.update_candles(market, epochs[order], closes[order])
+
+    def _handle_markets(self, content):
+        with self._lock:
+            for key in ("markets", "trading"):
+                for market, fields in content.get(key, {}).items():
+                    self.markets.setdefault(market, {}).update(fields)
+
+    # Stockage
+
+    def update_candles(self, market, epochs, closes):
+        """
+        Fusionner des bougies (triées par date croissante) dans le stockage du marché.
+        Une bougie déjà connue (même date) est remplacée : c'est la bougie en cours.
+        """
+        with self._lock:
+            stored = self.candles.get(market)
+            if stored is not None:
+                epochs = np.concatenate([epochs, stored[0]])
+                closes = np.concatenate([closes, stored[1]])
+            epochs, first = np.unique(epochs, return_index=True)
+            self.candles[market] = (epochs[-self.limit:], closes[first][-self.limit:])
+
+    def has_market(self, market):
+        """
+        Le stockage peut servir le marché : flux connecté, historique complet et bougie en cours
+        ouverte depuis moins d'une résolution (sinon l'appelant repasse par l'API REST).
+        """
+        if not self.connected.is_set():
+            return False
+        stored = self.candles.get(market)
+        return stored is not None and len(stored[0]) >= self.limit and time.time() - stored[0][-1] <= self.step
+
+    def snapshot(self, markets):
+        """
+        Construire un `PriceSnapshot` à partir du stockage (NaN pour les marchés sans données).
+        """
+        markets = list(dict.fromkeys(markets))
+        self.subscribe(markets)
+        prices = np.full((len(markets), self.limit), np.nan, dtype=np.float64)
+        epochs = np.zeros(len(markets), dtype=np.int64)
+        with self._lock:
+            for row, market in enumerate(markets):
+                stored = self.candles.get(market)
+                if stored is None or len(stored[0]) == 0:
+                    continue
+                prices[row, self.limit - len(stored[1]):] = stored[1]
+                epochs[row] = stored[0][-1]
+        return PriceSnapshot(markets, prices, epochs)
+
+    def markets_data(self):
+        """
+        Métadonnées des marchés au format de la réponse /perpetualMarkets (None si pas encore reçues).
+        """
+        with self._lock:
+            if not self.markets:
+                return None
+            return {"markets": {market: dict(fields) for market, fields in self.markets.items()}}
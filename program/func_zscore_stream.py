@@ -0,0 +1,144 @@
+import numpy as np
+
+from constants import RESOLUTION, ZSCORE_WINDOW
+from func_metrics import timed
+from func_utils import resolution_seconds
+
+
+class StreamingZScores:
+    """
+    Z-scores glissants maintenus de façon incrémentale pour un ensemble de paires.
+
+    Chaque paire garde un tampon circulaire des `window` derniers spreads ainsi que
+    la moyenne et la somme des carrés des écarts (Welford sur fenêtre glissante).
+    À chaque instantané de prix, une paire coûte O(1) :
+    - même bougie qu'au tick précédent : la dernière valeur du tampon est remplacée ;
+    - une nouvelle bougie : la précédente est finalisée puis la nouvelle est ajoutée ;
+    - sinon (première vue, trou de données, nouveau ratio de couverture) : la paire est
+      réinitialisée à partir de l'historique de l'instantané.
+    L'état est indexé par paire (base, quote) : quand l'ensemble des paires change, les paires
+    déjà suivies gardent leur fenêtre. Toutes les mises à jour sont vectorisées sur l'ensemble des paires.
+    """
+
+    def __init__(self, window=ZSCORE_WINDOW, resolution=RESOLUTION):
+        self.window = window
+        self.step = resolution_seconds(resolution)
+        self.keys = []
+        self._resize([])
+
+    def _resize(self, keys):
+        # Réordonner l'état selon `keys` : les paires déjà suivies le gardent, les nouvelles partent vides
+        old_rows = {key: row for row, key in enumerate(self.keys)}
+        rows = np.array([old_rows.get(key, -1) for key in keys], dtype=np.int64)
+        kept = np.flatnonzero(rows >= 0)
+        state = [
+            ("buffer", np.full((len(keys), self.window), np.nan)),
+            ("head", np.zeros(len(keys), dtype=np.int64)),
+            ("mean", np.full(len(keys), np.nan)),
+            ("m2", np.full(len(keys), np.nan)),
+            ("last_epoch", np.zeros(len(keys), dtype=np.int64)),
+            ("hedge_ratios", np.full(len(keys), np.nan)),
+        ]
+        for name, values in state:
+            if len(kept):
+                values[kept] = getattr(self, name)[rows[kept]]
+            setattr(self, name, values)
+        self.keys = keys
+
+    def _seed(self, pairs, spreads):
+        """
+        Réinitialiser les paires `pairs` à partir de leurs `window` derniers spreads (pairs x window).
+        """
+        self.buffer[pairs] = spreads
+        self.head[pairs] = self.window - 1
+        self.mean[pairs] = spreads.mean(axis=1)
+        self.m2[pairs] = ((spreads - self.mean[pairs][:, np.newaxis]) ** 2).sum(axis=1)
+
+    def _replace_head(self, pairs, values):
+        old = self.buffer[pairs, self.head[pairs]]
+        self._slide(pairs, old, values)
+        self.buffer[pairs, self.head[pairs]] = values
+
+    def _push(self, pairs, values):
+        self.head[pairs] = (self.head[pairs] + 1) % self.window
+        old = self.buffer[pairs, self.head[pairs]]
+        self._slide(pairs, old, values)
+        self.buffer[pairs, self.head[pairs]] = values
+
+    def _slide(self, pairs, old, new):
+        # Remplacer `old` par `new` dans une fenêtre de taille fixe
+        mean_old = self.mean[pairs]
+        mean_new = mean_old + (new - old) / self.window
+        self.m2[pairs] += (new - old) * (new - mean_new + old - mean_old)
+        self.mean[pairs] = mean_new
+
+    @timed("zscores")
+    def update(self, snapshot, base_markets, quote_markets, hedge_ratios):
+        """
+        Mettre à jour l'état à partir d'un instantané de prix et retourner les z-scores courants.
+
+        Parameters:
+        snapshot (PriceSnapshot): Instantané des prix récents.
+        base_markets, quote_markets (iterable): Marchés de chaque paire.
+        hedge_ratios (iterable): Ratio de couverture de chaque paire.
+
+        Returns:
+        np.ndarray: Z-score courant de chaque paire (NaN si les données sont insuffisantes).
+        """
+        base_markets = list(base_markets)
+        quote_markets = list(quote_markets)
+        hedge_ratios = np.asarray(hedge_ratios, dtype=np.float64)
+        keys = list(zip(base_markets, quote_markets))
+        if keys != self.keys:
+            self._resize(keys)
+
+        # Un nouveau ratio (re-cointégration) change tout le spread : seules ces paires sont réinitialisées
+        rehedged = self.hedge_ratios != hedge_ratios
+        self.hedge_ratios = hedge_ratios.copy()
+
+        bases = snapshot.rows(base_markets)
+        quotes = snapshot.rows(quote_markets)
+        available = (bases >= 0) & (quotes >= 0)
+        epochs = np.where(available, np.minimum(snapshot.epochs[bases], snapshot.epochs[quotes]), 0)
+
+        # Spreads des deux dernières bougies
+        last = np.full((len(keys), 2), np.nan)
+        last[available] = snapshot.prices[bases[available], -2:] - hedge_ratios[available, np.newaxis] * snapshot.prices[quotes[available], -2:]
+
+        # Une valeur manquante forcerait NaN dans l'état : réinitialiser plutôt que mettre à jour
+        known = available & ~rehedged & (self.last_epoch > 0) & (epochs > 0) & np.isfinite(last).all(axis=1) & np.isfinite(self.mean)
+        same = known & (epochs == self.last_epoch)
+        advanced = known & (epochs == self.last_epoch + self.step)
+        reseed = available & ~same & ~advanced
+
+        if same.any():
+            pairs = np.flatnonzero(same)
+            self._replace_head(pairs, last[pairs, 1])
+
+        if advanced.any():
+            pairs = np.flatnonzero(advanced)
+            self._replace_head(pairs, last[pairs, 0])
+            self._push(pairs, last[pairs, 1])
+
+        if reseed.any():
+            pairs = np.flatnonzero(reseed)
+            spreads = snapshot.prices[bases[pairs], -self.window:] - hedge_ratios[pairs, np.newaxis] * snapshot.prices[quotes[pairs], -self.window:]
+            self._seed(pairs, spreads)
+
+        self.last_epoch = np.where(available, epochs, 0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            std = np.sqrt(self.m2 / (self.window - 1))
+            z_scores = (self.buffer[np.arange(len(keys)), self.head] - self.mean) / std
+        z_scores[~available] = np.nan
+        return z_scores
+
+
+# Un état par usage (entrée, sortie), conservé pendant toute la vie du processus
+_BOOKS = {}
+
+
+def get_zscore_book(name):
+    if name not in _BOOKS:
+        _BOOKS[name] = StreamingZScores()
+    return _BOOKS[name]
@@ -1,78 +1,223 @@
-from constants import ABORT_ALL_POSITIONS, FIND_COINTEGRATED, PLACE_TRADES, MANAGE_EXITS
-from func_connections import connect_dydx_v4
-from func_private import abort_all_positions_v4
-from func_public import construct_market_prices_v4
-from func_cointegration import store_cointegration_results_v4
-from func_entry_pairs import open_positions_v4
-from func_exit_pairs import manage_trade_exits_v4
-from func_messaging import send_message_v4
+import atexit
+import time
+
+_STARTED = time.perf_counter()
+
+from constants import (
+    ABORT_ALL_POSITIONS,
+    FIND_COINTEGRATED,
+    PLACE_TRADES,
+    MANAGE_EXITS,
+    USE_WEBSOCKET,
+    RECOINTEGRATE,
+    SCHEDULE_EXITS_INTERVAL,
+    SCHEDULE_ENTRIES_INTERVAL,
+    SCHEDULE_HEALTH_INTERVAL,
+    TRADE_STORE_COMPACT_INTERVAL,
+    METRICS_ENABLED,
+    METRICS_LOG_INTERVAL,
+    USE_INDEXER_TRANSPORT,
+    SUPERVISOR_WORKERS,
+    SUPERVISOR_CHECK_INTERVAL,
+)
+from concurrent.futures import ThreadPoolExecutor
+from func_connections import get_client
+from func_public import get_markets_data
+from func_messaging import send_message
+from func_scheduler import Scheduler, LoopState
+from func_metrics import instrument_client, start_metrics_server, log_metrics_summary, observe
+from func_transport import IndexerTransport, set_indexer_transport
+
+# Stage modules (statsmodels, pandas, the v4 order client...) are imported only when their stage is enabled
+
+
+class StartupReport:
+    """
+    Durée de chaque phase du démarrage, affichée une fois le planificateur prêt.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.last = started
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        observe("stage_seconds", now - self.last, stage=f"startup.{phase}")
+        self.last = now
+
+    def summary(self):
+        phases = ", ".join(f"{phase} {seconds:.3f} s" for phase, seconds in self.phases)
+        return f"Startup in {self.last - self.started:.3f} s ({phases})"
+
+
+def check_health(client, scheduler, stream=None):
+    """
+    Contrôle de santé périodique : indexer joignable, flux WebSocket connecté, état des tâches.
+    """
+    get_markets_data(client, force_refresh=True)
+    if stream is not None and not stream.connected.is_set():
+        raise RuntimeError("market data stream disconnected")
+    summary = ", ".join(f"{name} {s['runs']} runs / {s['errors']} errors" for name, s in scheduler.status().items())
+    print(f"Health: {summary}")
 
 
 # MAIN FUNCTION
 if __name__ == "__main__":
+    startup = StartupReport(_STARTED)
+    startup.mark("imports")
+
     # Message on start
-    send_message_v4("Bot launch successful")
+    send_message("Bot launch successful")
 
     # Connect to client
     try:
         print("Connecting to Client...")
-        client = connect_dydx_v4()
+        client = instrument_client(get_client())
     except Exception as e:
         print("Error connecting to client: ", e)
-        send_message_v4(f"Failed to connect to client {e}")
+        send_message(f"Failed to connect to client {e}")
         exit(1)
+    startup.mark("connect")
+
+    # Candles and market metadata go through one pooled keep-alive transport
+    if USE_INDEXER_TRANSPORT:
+        set_indexer_transport(IndexerTransport())
 
     # Abort all open positions
-    if ABORT_ALL_POSITIONS:
+    # (in supervisor mode, the supervisor aborts every worker subaccount once, before spawning them)
+    if ABORT_ALL_POSITIONS and not SUPERVISOR_WORKERS:
+        from func_private import abort_all_positions
         try:
             print("Closing all positions...")
-            close_orders = abort_all_positions_v4(client)
+            close_orders = abort_all_positions(client)
         except Exception as e:
             print("Error closing all positions: ", e)
-            send_message_v4(f"Error closing all positions {e}")
+            send_message(f"Error closing all positions {e}")
             exit(1)
+        startup.mark("abort")
+
+    scheduler = Scheduler(notify=send_message)
+
+    # The recointegration universe is fetched with the loop's first snapshot of each candle
+    universe = ()
 
     # Find Cointegrated Pairs
     if FIND_COINTEGRATED:
+        from func_public import construct_market_prices
+        from func_cointegration import store_cointegration_results
+        from func_recointegration import RollingCointegration, RecointegrationJob
+
         # Construct Market Prices
         try:
-            print("Fetching market prices, please allow 3 mins...")
-            df_market_prices = construct_market_prices_v4(client)
+            print("Fetching market prices...")
+            df_market_prices = construct_market_prices(client)
         except Exception as e:
             print("Error constructing market prices: ", e)
-            send_message_v4(f"Error constructing market prices {e}")
+            send_message(f"Error constructing market prices {e}")
             exit(1)
 
         # Store Cointegrated Pairs
         try:
             print("Storing cointegrated pairs...")
-            stores_result = store_cointegration_results_v4(df_market_prices)
+            stores_result = store_cointegration_results(df_market_prices)
             if stores_result != "saved":
                 print("Error saving cointegrated pairs")
                 exit(1)
         except Exception as e:
             print("Error saving cointegrated pairs: ", e)
-            send_message_v4(f"Error saving cointegrated pairs {e}")
+            send_message(f"Error saving cointegrated pairs {e}")
             exit(1)
+        startup.mark("cointegration")
 
-    # Run as always on
-    while True:
-        # Manage exits
-        if MANAGE_EXITS:
+        # Keep cointegration up to date in the background, once per candle
+        if RECOINTEGRATE:
+            recointegration = RollingCointegration.from_frame(df_market_prices)
+            universe = recointegration.markets
+
+    # Stream prices and market metadata instead of polling them
+    stream = None
+    if USE_WEBSOCKET:
+        from func_websocket import MarketDataStream
+        print("Starting market data stream...")
+        stream = MarketDataStream().start()
+
+    if SUPERVISOR_WORKERS:
+        # Trading runs in one worker process per subaccount; this process only feeds them prices
+        from func_supervisor import Supervisor
+        print(f"Starting {SUPERVISOR_WORKERS} workers...")
+        supervisor = Supervisor(SUPERVISOR_WORKERS, notify=send_message)
+        atexit.register(supervisor.stop)
+        if ABORT_ALL_POSITIONS:
             try:
-                print("Managing exits...")
-                manage_trade_exits_v4(client)
+                print("Closing all positions...")
+                supervisor.abort_positions()
             except Exception as e:
-                print("Error managing exiting positions: ", e)
-                send_message_v4(f"Error managing exiting positions {e}")
+                print("Error closing all positions: ", e)
+                send_message(f"Error closing all positions {e}")
                 exit(1)
+            startup.mark("abort")
+        supervisor.start(client, get_markets_data(client)["markets"].keys())
+        state = LoopState(client, universe=universe, tracked=supervisor.tracked_markets, positions=False)
+        scheduler.add("feed", lambda: supervisor.refresh_feed(client, state.get()[0]), interval=SCHEDULE_EXITS_INTERVAL, run_at_start=False)
+        scheduler.add(
+            "workers",
+            supervisor.check_workers,
+            interval=SUPERVISOR_CHECK_INTERVAL,
+            executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="workers"),
+            run_at_start=False,
+        )
+    else:
+        # Trading tasks share one snapshot per candle boundary and run one at a time
+        state = LoopState(client, universe=universe)
+
+        # Manage exits
+        if MANAGE_EXITS:
+            from func_exit_pairs import manage_trade_exits
+            scheduler.add("exits", lambda: manage_trade_exits(client, *state.get()), interval=SCHEDULE_EXITS_INTERVAL)
 
         # Place trades for opening positions
         if PLACE_TRADES:
-            try:
-                print("Finding trading opportunities...")
-                open_positions_v4(client)
-            except Exception as e:
-                print("Error trading pairs: ", e)
-                send_message_v4(f"Error opening trades {e}")
-                exit(1)
+            from func_entry_pairs import open_positions
+            scheduler.add("entries", lambda: open_positions(client, *state.get()), interval=SCHEDULE_ENTRIES_INTERVAL)
+
+        # Fold the trade journal's WAL back into the database, between two trading tasks
+        from func_trade_store import get_trade_store
+        scheduler.add("compact", get_trade_store().compact, interval=TRADE_STORE_COMPACT_INTERVAL, run_at_start=False)
+
+    # Recointegration reads the same snapshot, its selection runs off the trading thread
+    if universe:
+        job = RecointegrationJob(recointegration, state)
+        scheduler.add(
+            "recointegration",
+            job.run_once,
+            executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="recointegration"),
+            run_at_start=False,
+        )
+
+    scheduler.add(
+        "health",
+        lambda: check_health(client, scheduler, stream),
+        interval=SCHEDULE_HEALTH_INTERVAL,
+        executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="health"),
+        run_at_start=False,
+    )
+
+    # Latency metrics: Prometheus endpoint and periodic summary
+    if METRICS_ENABLED:
+        start_metrics_server()
+        scheduler.add(
+            "metrics",
+            log_metrics_summary,
+            interval=METRICS_LOG_INTERVAL,
+            executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="metrics"),
+            run_at_start=False,
+        )
+
+    startup.mark("tasks")
+    print(startup.summary())
+
+    # Run as always on
+    print("Starting scheduler...")
+    scheduler.run_forever()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Les modules du bot sont importés à plat depuis program/, comme le fait main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
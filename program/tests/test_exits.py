@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import func_exit_pairs
+import func_public
+import func_trade_store
+import func_transport
+from func_exit_pairs import manage_trade_exits
+from func_mock_indexer import MockIndexer
+from func_private import PositionBook, place_pair_orders
+from func_trade_store import TradeStore
+
+
+@pytest.fixture
+def indexer(monkeypatch, tmp_path):
+    indexer = MockIndexer(n_markets=4, n_groups=1).start()
+    monkeypatch.setattr(func_public, "_MARKET_STREAM", None)
+    monkeypatch.setattr(func_public, "_MARKETS_CACHE", {"data": None, "fetched_at": 0.0})
+    monkeypatch.setattr(func_public, "USE_CANDLE_STORE", False)
+    monkeypatch.setattr(func_trade_store, "_TRADE_STORE", TradeStore(str(tmp_path / "trades.db"), legacy_json=None))
+    # Toutes les paires ouvertes sont à fermer
+    monkeypatch.setattr(func_exit_pairs, "exit_reasons", lambda z_scores, *args: np.ones(len(z_scores), dtype=np.int8))
+    yield indexer
+    indexer.stop()
+
+
+def open_trade(client, markets):
+    orders = place_pair_orders(client, [
+        dict(market=market, side=side, size="2", price="100", reduce_only=False)
+        for market, side in zip(markets, ("BUY", "SELL"))
+    ])
+    # Tailles au format de format_number : l'indexer les renvoie sans zéros finaux
+    return func_trade_store.get_trade_store().insert({
+        "market_1": markets[0], "market_2": markets[1], "hedge_ratio": 1.0, "z_score": -2.0, "half_life": 10.0,
+        "order_id_m1": orders[0]["order"]["id"], "order_m1_size": "2.00", "order_m1_side": "BUY",
+        "order_id_m2": orders[1]["order"]["id"], "order_m2_size": "2.00", "order_m2_side": "SELL",
+    })
+
+
+def test_failed_leg_stays_open_and_is_retried_alone(indexer, monkeypatch):
+    client = indexer.client()
+    monkeypatch.setattr(func_transport, "_INDEXER_TRANSPORT", client.transport)
+    m0, m1, _, _ = indexer.markets
+    open_trade(client, [m0, m1])
+    store = func_trade_store.get_trade_store()
+
+    # L'ordre de fermeture de la deuxième jambe est refusé
+    place_order = indexer.place_order
+    def reject_m1(subaccount, market, **kwargs):
+        if market == m1:
+            raise RuntimeError("broadcast failed")
+        return place_order(subaccount, market=market, **kwargs)
+    monkeypatch.setattr(indexer, "place_order", reject_m1)
+
+    manage_trade_exits(client)
+
+    # La paire reste ouverte, avec sa jambe fermée notée dans le journal
+    assert PositionBook().refresh(client).markets() == {m1}
+    [trade] = store.open_trades()
+    assert trade["closed_m1"] and not trade.get("closed_m2")
+
+    # Au passage suivant, seule la jambe restante est fermée
+    monkeypatch.setattr(indexer, "place_order", place_order)
+    indexer.reset_counters()
+    manage_trade_exits(client)
+
+    assert indexer.calls["place_order"] == 1
+    assert PositionBook().refresh(client).markets() == set()
+    assert store.open_trades() == []
@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from func_messaging import Notifier
+
+PROGRAM_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TelegramHandler(BaseHTTPRequestHandler):
+    """
+    API Telegram minimale : enregistre les messages reçus sur /bot<token>/sendMessage.
+    """
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        fields = {key: values[0] for key, values in parse_qs(body).items()}
+        time.sleep(self.server.delay)
+        self.server.messages.append((self.path, fields["chat_id"], fields["text"]))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def telegram():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramHandler)
+    server.messages = []
+    server.delay = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def texts(telegram):
+    return [text for _, _, text in telegram.messages]
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_identical_messages_are_coalesced(telegram):
+    notifier = Notifier("TOKEN", "42", api_url=telegram.url, window=0.2, rate=100, burst=100)
+    assert notifier.send("Échec de l'ordre") == "queued"
+    assert notifier.send("Échec de l'ordre") == "coalesced"
+    assert notifier.send("Échec de l'ordre") == "coalesced"
+    assert notifier.send("Autre message") == "queued"
+
+    notifier.start()
+    # Le résumé part à la fin de la fenêtre, au prochain passage du thread (au plus 1 s sans message)
+    assert wait_for(lambda: notifier.sent == 3)
+    assert telegram.messages[0] == ("/botTOKEN/sendMessage", "42", "Échec de l'ordre")
+    assert texts(telegram)[1:] == ["Autre message", "Échec de l'ordre (répété 2 fois en 0.2 s)"]
+    assert len(telegram.messages) == 3 and notifier.failed == 0
+
+    # Fenêtre terminée : le message repart normalement
+    assert notifier.send("Échec de l'ordre") == "queued"
+
+
+def test_full_queue_drops_without_blocking(telegram):
+    notifier = Notifier("TOKEN", "42", api_url=telegram.url, maxsize=2, rate=100, burst=100)
+    started = time.monotonic()
+    assert [notifier.send(f"message {i}") for i in range(4)] == ["queued", "queued", "dropped", "dropped"]
+    assert time.monotonic() - started < 0.1
+    assert notifier.dropped == 2
+
+    notifier.start()
+    notifier.flush()
+    assert texts(telegram) == ["message 0", "message 1"]
+
+
+def test_pending_messages_are_sent_at_exit(telegram):
+    # Le notificateur du processus (get_notifier) vide sa file à la sortie de l'interpréteur
+    telegram.delay = 0.1
+    script = textwrap.dedent(f"""
+        import constants
+        constants.NOTIFY_API_URL = "{telegram.url}"
+        from func_messaging import send_message
+        for i in range(5):
+            assert send_message(f"message {{i}}") == "queued"
+        raise SystemExit(1)
+    """)
+    env = dict(os.environ, TELEGRAM_TOKEN="TOKEN", TELEGRAM_CHAT_ID="42")
+    result = subprocess.run([sys.executable, "-c", script], cwd=PROGRAM_DIR, env=env, timeout=30)
+
+    assert result.returncode == 1
+    assert texts(telegram) == [f"message {i}" for i in range(5)]
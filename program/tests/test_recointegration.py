@@ -0,0 +1,47 @@
+import numpy as np
+import statsmodels.api as sm
+from statsmodels.tsa.stattools import adfuller
+
+from func_recointegration import RollingCointegration
+
+STEP = 3600
+
+
+def batch_statistics(prices, base, quote):
+    """
+    Les mêmes statistiques recalculées sur la fenêtre entière : MCO, ADF sans retard, demi-vie.
+    """
+    y, x = prices[:, base], prices[:, quote]
+    intercept, slope = sm.OLS(y, sm.add_constant(x)).fit().params
+    t_stat = adfuller(y - intercept - slope * x, maxlag=0, autolag=None, regression="n")[0]
+    hedge_ratio = sm.OLS(y, x).fit().params[0]
+    spread = y - hedge_ratio * x
+    beta = sm.OLS(np.diff(spread), sm.add_constant(spread[:-1])).fit().params[1]
+    half_life = round(-np.log(2) / beta) if beta < 0 else np.inf
+    return t_stat, hedge_ratio, half_life
+
+
+def test_rolling_statistics_match_batch_ols_and_adf():
+    rng = np.random.default_rng(11)
+    common = 100 + np.cumsum(rng.normal(0, 1, 300))
+    # Deux marchés cointégrés avec le facteur commun, un troisième indépendant
+    prices = np.column_stack([
+        common + rng.normal(0, 1, 300),
+        0.5 * common + 20 + rng.normal(0, 0.5, 300),
+        50 + np.cumsum(rng.normal(0, 1, 300)),
+    ])
+    epochs = 1_700_000_000 // STEP * STEP + STEP * np.arange(300)
+
+    # Fenêtre de 200 bougies, puis 100 bougies ajoutées sans recalcul complet des sommes
+    rolling = RollingCointegration(["A-USD", "B-USD", "C-USD"], prices[:200], epochs[:200], resolution="1HOUR", refit_every=10_000)
+    for t in range(200, 300):
+        rolling.push(prices[t], epochs[t])
+    np.testing.assert_array_equal(rolling.prices(), prices[100:])
+
+    # COINT_DTYPE stocke les statistiques en float32
+    results = rolling.statistics()
+    for row in results:
+        t_stat, hedge_ratio, half_life = batch_statistics(prices[100:], row["base"], row["quote"])
+        np.testing.assert_allclose(row["t_stat"], t_stat, rtol=1e-6)
+        np.testing.assert_allclose(row["hedge_ratio"], hedge_ratio, rtol=1e-6)
+        assert row["half_life"] == half_life
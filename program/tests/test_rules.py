@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from func_backtest import run_backtest
+from func_rules import (
+    exit_reasons,
+    EXIT_NONE,
+    EXIT_ZSCORE_CROSS,
+    EXIT_TIME_STOP,
+    EXIT_TAKE_PROFIT_HIT,
+    EXIT_STOP_LOSS,
+)
+
+RULES = dict(close_at_cross=True, half_life_mult=3.0, stop_zscore=4.0, take_profit=0.02)
+
+
+# (z courant, z d'entrée, bougies écoulées, demi-vie, PnL latent) pour un notionnel de 1000
+@pytest.mark.parametrize("z_current, z_traded, elapsed, half_life, pnl, expected", [
+    (-1.0, -2.0, 5, 10.0, 0.0, EXIT_NONE),
+    (2.5, -2.0, 5, 10.0, 0.0, EXIT_ZSCORE_CROSS),
+    (-1.0, -2.0, 30, 10.0, 0.0, EXIT_TIME_STOP),
+    (-1.0, -2.0, 5, 10.0, 20.0, EXIT_TAKE_PROFIT_HIT),
+    (-4.5, -2.0, 5, 10.0, 0.0, EXIT_STOP_LOSS),
+    # Plusieurs règles : stop-loss > take-profit > croisement du z-score > stop temporel
+    (2.5, -2.0, 30, 10.0, 0.0, EXIT_ZSCORE_CROSS),
+    (2.5, -2.0, 30, 10.0, 20.0, EXIT_TAKE_PROFIT_HIT),
+    (-4.5, -2.0, 30, 10.0, 20.0, EXIT_STOP_LOSS),
+    # Valeurs inconnues : la règle ne se déclenche pas
+    (np.nan, -2.0, 5, np.nan, np.nan, EXIT_NONE),
+])
+def test_exit_reason_priority(z_current, z_traded, elapsed, half_life, pnl, expected):
+    reasons = exit_reasons(np.array([z_current]), np.array([z_traded]), np.array([elapsed]), np.array([half_life]),
+                           np.array([pnl]), np.array([1000.0]), **RULES)
+    assert reasons.tolist() == [expected]
+
+
+def test_disabled_rule_lets_the_next_one_through():
+    args = [np.array([-4.5]), np.array([-2.0]), np.array([30]), np.array([10.0]), np.array([20.0]), np.array([1000.0])]
+    assert exit_reasons(*args, **dict(RULES, stop_zscore=None)).tolist() == [EXIT_TAKE_PROFIT_HIT]
+    assert exit_reasons(*args, **dict(RULES, stop_zscore=None, take_profit=None)).tolist() == [EXIT_TIME_STOP]
+    assert exit_reasons(*args, close_at_cross=False, half_life_mult=None, stop_zscore=None, take_profit=None).tolist() == [EXIT_NONE]
+
+
+def test_backtest_applies_the_same_rules():
+    rng = np.random.default_rng(3)
+    common = 100 + np.cumsum(rng.normal(0, 1, 600))
+    prices = np.column_stack([common + rng.normal(0, 1, 600), common + rng.normal(0, 1, 600)])
+    pairs = pd.DataFrame({"base_market": ["A-USD"], "quote_market": ["B-USD"], "hedge_ratio": [1.0], "half_life": [2.0]})
+
+    # Seul le stop temporel est actif : chaque paire sort après 3 demi-vies exactement
+    result = run_backtest(prices, ["A-USD", "B-USD"], pairs, close_at_cross=False, half_life_mult=3.0, stop_zscore=None, take_profit=None)
+    trades = result["trades"]
+    assert len(trades) > 0
+    assert set(trades["exit_reason"]) == {"time_stop"}
+    assert ((trades["exit_step"] - trades["entry_step"]) == 6).all()
@@ -0,0 +1,55 @@
+import pytest
+
+import func_public
+from func_mock_indexer import MockIndexer
+from func_private import PositionBook, abort_all_positions, place_pair_orders
+from func_trade_store import TradeStore
+
+
+@pytest.fixture
+def indexer(monkeypatch):
+    indexer = MockIndexer(n_markets=4, n_groups=1).start()
+    monkeypatch.setattr(func_public, "_MARKET_STREAM", None)
+    monkeypatch.setattr(func_public, "_MARKETS_CACHE", {"data": None, "fetched_at": 0.0})
+    yield indexer
+    indexer.stop()
+
+
+def open_legs(client, markets):
+    return place_pair_orders(client, [
+        dict(market=market, side=side, size="2", price="100", reduce_only=False)
+        for market, side in zip(markets, ("BUY", "SELL"))
+    ])
+
+
+def test_positions_and_orders_are_scoped_to_the_subaccount(indexer):
+    first, second = indexer.client(0), indexer.client(1)
+    m0, m1, m2, _ = indexer.markets
+
+    orders = open_legs(first, [m0, m1])
+    open_legs(second, [m2, m1])
+
+    assert PositionBook().refresh(first).markets() == {m0, m1}
+    assert PositionBook().refresh(second).markets() == {m1, m2}
+    assert second.private.get_account().data["subaccount"]["subaccountNumber"] == 1
+
+    # Les ordres se retrouvent par leur identifiant sur leur seul subcompte
+    order = first.private.get_order_by_id(orders[1]["order"]["id"]).data["order"]
+    assert (order["market"], order["side"], order["size"], order["status"]) == (m1, "SELL", "2", "FILLED")
+    with pytest.raises(LookupError):
+        second.private.get_order_by_id(orders[1]["order"]["id"])
+
+
+def test_abort_closes_only_its_subaccount(indexer, tmp_path):
+    first, second = indexer.client(0), indexer.client(1)
+    m0, m1, m2, _ = indexer.markets
+    open_legs(first, [m0, m1])
+    open_legs(second, [m2, m1])
+    store = TradeStore(str(tmp_path / "trades_1.db"), legacy_json=None)
+
+    closed = abort_all_positions(second, store)
+
+    # Position courte : l'ordre de fermeture porte la taille absolue
+    assert sorted((o["order"]["market"], o["order"]["side"], float(o["order"]["size"])) for o in closed) == [(m1, "BUY", 2), (m2, "SELL", 2)]
+    assert PositionBook().refresh(second).markets() == set()
+    assert PositionBook().refresh(first).markets() == {m0, m1}
@@ -0,0 +1,45 @@
+import json
+
+from func_trade_store import TradeStore
+
+
+def agent(market_1, market_2):
+    return {
+        "market_1": market_1, "market_2": market_2, "hedge_ratio": 0.75, "z_score": -2.1, "half_life": 12.0,
+        "order_id_m1": f"{market_1}:1", "order_m1_size": "2.00", "order_m1_side": "BUY",
+        "order_id_m2": f"{market_2}:2", "order_m2_size": "1.50", "order_m2_side": "SELL",
+        "pair_status": "LIVE",
+    }
+
+
+def test_insert_close_reload(tmp_path):
+    path = str(tmp_path / "trades.db")
+    store = TradeStore(path, legacy_json=None)
+    first = store.insert(agent("BTC-USD", "ETH-USD"))
+    second = store.insert(agent("SOL-USD", "AVAX-USD"))
+    generation = store.generation
+
+    store.close(first)
+    store.update(second, {"closed_m1": True})
+    assert store.generation == generation + 2
+
+    # Un nouveau processus relit le même journal : seule la paire encore ouverte en sort, complète
+    [trade] = TradeStore(path, legacy_json=None).open_trades()
+    assert trade == dict(agent("SOL-USD", "AVAX-USD"), closed_m1=True, trade_id=second, opened_at=trade["opened_at"])
+
+    store.close_all()
+    reloaded = TradeStore(path, legacy_json=None)
+    assert reloaded.open_trades() == []
+    assert reloaded.insert(agent("BTC-USD", "ETH-USD")) > second
+
+
+def test_legacy_json_is_imported_once(tmp_path):
+    legacy = tmp_path / "bot_agents.json"
+    legacy.write_text(json.dumps([agent("BTC-USD", "ETH-USD")]))
+    path = str(tmp_path / "trades.db")
+
+    TradeStore(path, legacy_json=str(legacy))
+    TradeStore(path, legacy_json=str(legacy))
+
+    assert [t["market_1"] for t in TradeStore(path, legacy_json=None).open_trades()] == ["BTC-USD"]
+    assert not legacy.exists() and (tmp_path / "bot_agents.json.imported").exists()
@@ -0,0 +1,128 @@
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+
+import func_public
+import func_transport
+from func_public import construct_market_prices, get_markets_data
+from func_transport import IndexerTransport
+
+# Réponse /v4/perpetualMarkets de l'indexer (champs réels, valeurs abrégées)
+PERPETUAL_MARKETS = {"markets": {
+    "BTC-USD": {
+        "clobPairId": "0", "ticker": "BTC-USD", "status": "ACTIVE", "oraclePrice": "67012.34",
+        "priceChange24H": "-512.1", "volume24H": "812345678.9", "trades24H": 123456,
+        "nextFundingRate": "0.00001", "initialMarginFraction": "0.05", "maintenanceMarginFraction": "0.03",
+        "openInterest": "1234.5678", "atomicResolution": -10, "quantumConversionExponent": -9,
+        "tickSize": "1", "stepSize": "0.0001", "stepBaseQuantums": 1000000, "subticksPerTick": 100000,
+        "marketType": "CROSS", "openInterestLowerCap": "0", "openInterestUpperCap": "0", "baseOpenInterest": "1200.1",
+    },
+    "ETH-USD": {
+        "clobPairId": "1", "ticker": "ETH-USD", "status": "ACTIVE", "oraclePrice": "3456.78",
+        "priceChange24H": "12.3", "volume24H": "412345678.9", "trades24H": 98765,
+        "nextFundingRate": "0.00001", "initialMarginFraction": "0.05", "maintenanceMarginFraction": "0.03",
+        "openInterest": "23456.7", "atomicResolution": -9, "quantumConversionExponent": -9,
+        "tickSize": "0.1", "stepSize": "0.001", "stepBaseQuantums": 1000000, "subticksPerTick": 100000,
+        "marketType": "CROSS", "openInterestLowerCap": "0", "openInterestUpperCap": "0", "baseOpenInterest": "23000.2",
+    },
+    "LUNA-USD": {
+        "clobPairId": "33", "ticker": "LUNA-USD", "status": "FINAL_SETTLEMENT", "oraclePrice": "0.41",
+        "priceChange24H": "0", "volume24H": "0", "trades24H": 0,
+        "nextFundingRate": "0", "initialMarginFraction": "1", "maintenanceMarginFraction": "1",
+        "openInterest": "0", "atomicResolution": -6, "quantumConversionExponent": -9,
+        "tickSize": "0.0001", "stepSize": "1", "stepBaseQuantums": 1000000, "subticksPerTick": 1000000,
+        "marketType": "ISOLATED", "openInterestLowerCap": "0", "openInterestUpperCap": "500000", "baseOpenInterest": "0",
+    },
+}}
+
+
+def _epoch(iso):
+    return int(datetime.strptime(iso[:19], "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def close_price(market, epoch):
+    return round(float(PERPETUAL_MARKETS["markets"][market]["oraclePrice"])) + (epoch // 3600) % 50
+
+
+class IndexerHandler(BaseHTTPRequestHandler):
+    """
+    API REST minimale de l'indexer v4 : /v4/perpetualMarkets et /v4/candles/perpetualMarkets/{ticker},
+    bougies horaires les plus récentes en premier, comme l'indexer.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append(url.path)
+        if url.path == "/v4/perpetualMarkets":
+            self.send_json(PERPETUAL_MARKETS)
+        elif url.path.startswith("/v4/candles/perpetualMarkets/"):
+            market = url.path.rsplit("/", 1)[1]
+            to_epoch = _epoch(params["toISO"]) // 3600 * 3600
+            from_epoch = _epoch(params["fromISO"])
+            epochs = [e for e in range(to_epoch, from_epoch - 1, -3600)][:int(params["limit"])]
+            self.send_json({"candles": [{
+                "startedAt": _iso(e), "ticker": market, "resolution": params["resolution"],
+                "low": "1", "high": "2", "open": "1.5", "close": str(close_price(market, e)),
+                "baseTokenVolume": "10", "usdVolume": "1000", "trades": 12,
+                "startingOpenInterest": "100", "id": f"{market}-{e}",
+            } for e in epochs]})
+        else:
+            self.send_error(404)
+
+    def send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def indexer(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), IndexerHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(func_transport, "_INDEXER_TRANSPORT", IndexerTransport(f"http://127.0.0.1:{server.server_address[1]}/v4"))
+    monkeypatch.setattr(func_public, "_MARKET_STREAM", None)
+    monkeypatch.setattr(func_public, "_MARKETS_CACHE", {"data": None, "fetched_at": 0.0})
+    monkeypatch.setattr(func_public, "USE_CANDLE_STORE", False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_candles_decode_from_v4_payload(indexer):
+    transport = func_transport.get_indexer_transport()
+    epochs, closes = transport.get_candles_arrays("ETH-USD", "1HOUR", "2024-05-01T00:00:00.000Z", "2024-05-01T05:30:00.000Z", limit=100)
+
+    start = _epoch("2024-05-01T00:00:00")
+    np.testing.assert_array_equal(epochs, start + 3600 * np.arange(6))
+    np.testing.assert_array_equal(closes, [close_price("ETH-USD", e) for e in epochs])
+
+
+def test_market_prices_from_v4_markets(indexer):
+    markets = get_markets_data(None, force_refresh=True)
+    assert markets["markets"]["BTC-USD"]["stepSize"] == "0.0001"
+
+    df = construct_market_prices(None)
+
+    # Seuls les marchés ACTIVE sont récupérés
+    assert list(df.columns) == ["BTC-USD", "ETH-USD"]
+    assert not any("LUNA-USD" in path for path in indexer.requests)
+    assert len(df) > 0 and not df.isna().any().any()
+    epochs = [int(timestamp.timestamp()) for timestamp in df.index]
+    np.testing.assert_array_equal(df["ETH-USD"].to_numpy(), [close_price("ETH-USD", e) for e in epochs])
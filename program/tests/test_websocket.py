@@ -0,0 +1,233 @@
+import base64
+import hashlib
+import json
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import func_public
+import func_websocket
+from func_public import PriceSnapshot, get_recent_prices_snapshot
+from func_websocket import MarketDataStream
+
+_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+LIMIT = 5
+
+
+def _iso(epoch):
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(epoch))
+
+
+class IndexerHandler(socketserver.BaseRequestHandler):
+    """
+    Indexer WebSocket minimal (RFC 6455, sans extension) : répond aux abonnements comme l'indexer
+    dYdX, puis ferme la connexion quand le test le demande.
+    """
+
+    def handle(self):
+        server = self.server
+        self.buffer = b""
+        self._handshake()
+        server.connections.put(self)
+        while True:
+            try:
+                opcode, payload = self._read_frame()
+            except (ConnectionError, OSError):
+                return
+            if opcode == 0x8:
+                return
+            if opcode != 0x1:
+                continue
+            message = json.loads(payload)
+            server.received.put(message)
+            if message["channel"] == "v4_markets":
+                self.send_json({"type": "subscribed", "channel": "v4_markets", "contents": {"markets": {
+                    "BTC-USD": {"tickSize": "1", "stepSize": "0.001"},
+                    "ETH-USD": {"tickSize": "0.1", "stepSize": "0.01"},
+                }}})
+                self.send_json({"type": "channel_batch_data", "channel": "v4_markets", "contents": [
+                    {"trading": {"BTC-USD": {"tickSize": "0.5"}}},
+                ]})
+            elif message["channel"] == "v4_candles" and message["id"].split("/")[0] in server.candle_markets:
+                # Historique en ordre décroissant, comme l'indexer, puis la bougie en cours et une nouvelle bougie
+                start = server.start
+                candles = [{"startedAt": _iso(start + 3600 * h), "close": str(100 + h)} for h in reversed(range(LIMIT))]
+                self.send_json({"type": "subscribed", "channel": "v4_candles", "id": message["id"], "contents": {"candles": candles}})
+                self.send_json({"type": "channel_data", "channel": "v4_candles", "id": message["id"],
+                                "contents": {"startedAt": _iso(start + 3600 * (LIMIT - 1)), "close": "150"}})
+                self.send_json({"type": "channel_data", "channel": "v4_candles", "id": message["id"],
+                                "contents": {"startedAt": _iso(start + 3600 * LIMIT), "close": "160"}})
+
+    def _handshake(self):
+        while b"\r\n\r\n" not in self.buffer:
+            self.buffer += self.request.recv(4096)
+        head, self.buffer = self.buffer.split(b"\r\n\r\n", 1)
+        headers = dict(line.split(": ", 1) for line in head.decode().split("\r\n")[1:])
+        accept = base64.b64encode(hashlib.sha1((headers["Sec-WebSocket-Key"] + _GUID).encode()).digest()).decode()
+        self.request.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+
+    def _recv(self, size):
+        while len(self.buffer) < size:
+            chunk = self.request.recv(4096)
+            if not chunk:
+                raise ConnectionError("connexion fermée")
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def _read_frame(self):
+        first, second = self._recv(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", self._recv(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", self._recv(8))[0]
+        mask = self._recv(4) if second & 0x80 else b"\x00" * 4
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv(length)))
+        return first & 0x0F, payload
+
+    def _send_frame(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        self.request.sendall(header + payload)
+
+    def send_json(self, message):
+        self._send_frame(0x1, json.dumps(message).encode())
+
+    def disconnect(self):
+        self._send_frame(0x8, struct.pack("!H", 1001))
+        try:
+            self.request.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # Le client a déjà répondu à la fermeture et la connexion est close
+            pass
+
+
+class IndexerServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture
+def indexer():
+    server = IndexerServer(("127.0.0.1", 0), IndexerHandler)
+    # La dernière bougie envoyée est la bougie en cours
+    server.start = int(time.time()) // 3600 * 3600 - 3600 * LIMIT
+    server.candle_markets = {"BTC-USD", "ETH-USD"}
+    server.connections = queue.Queue()
+    server.received = queue.Queue()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stream(indexer, monkeypatch):
+    monkeypatch.setattr(func_websocket, "WS_RECONNECT_DELAY", 1)
+    stream = MarketDataStream(url=f"ws://127.0.0.1:{indexer.server_address[1]}", limit=LIMIT).start()
+    yield stream
+    stream.stop()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def next_subscription(indexer, channel):
+    while True:
+        message = indexer.received.get(timeout=5)
+        if message["channel"] == channel:
+            return message
+
+
+def test_markets_data_merges_subscribed_and_batched_updates(indexer, stream):
+    assert next_subscription(indexer, "v4_markets") == {"type": "subscribe", "channel": "v4_markets", "batched": True}
+    assert wait_for(lambda: (stream.markets_data() or {}).get("markets", {}).get("BTC-USD", {}).get("tickSize") == "0.5")
+
+    markets = stream.markets_data()["markets"]
+    assert markets["BTC-USD"] == {"tickSize": "0.5", "stepSize": "0.001"}
+    assert markets["ETH-USD"] == {"tickSize": "0.1", "stepSize": "0.01"}
+
+
+def test_snapshot_applies_candle_updates(indexer, stream):
+    assert stream.connected.wait(5)
+    stream.subscribe(["BTC-USD", "DOGE-USD"])
+    assert next_subscription(indexer, "v4_candles")["id"] == "BTC-USD/1HOUR"
+    assert wait_for(lambda: stream.snapshot(["BTC-USD"]).epochs[0] == indexer.start + 3600 * LIMIT)
+
+    snapshot = stream.snapshot(["BTC-USD", "DOGE-USD"])
+    # La bougie en cours est remplacée, la nouvelle décale la fenêtre
+    np.testing.assert_array_equal(snapshot.prices[0], [101, 102, 103, 150, 160])
+    assert np.isnan(snapshot.prices[1]).all() and snapshot.epochs[1] == 0
+    assert stream.has_market("BTC-USD") and not stream.has_market("DOGE-USD")
+
+
+def test_disconnect_falls_back_to_rest_and_resubscribes(indexer, stream, monkeypatch):
+    rest_calls = []
+
+    async def fetch_recent_prices(client, markets, limit=100):
+        rest_calls.append(list(markets))
+        prices = np.full((len(markets), LIMIT), np.nan)
+        prices[:, -2:] = [170, 180]
+        return PriceSnapshot(markets, prices, np.full(len(markets), indexer.start + 3600 * LIMIT))
+
+    monkeypatch.setattr(func_public, "fetch_recent_prices", fetch_recent_prices)
+    monkeypatch.setattr(func_public, "_MARKET_STREAM", stream)
+
+    stream.subscribe(["ETH-USD"])
+    first = indexer.connections.get(timeout=5)
+    assert next_subscription(indexer, "v4_candles")["id"] == "ETH-USD/1HOUR"
+    assert wait_for(lambda: stream.snapshot(["ETH-USD"]).epochs[0] == indexer.start + 3600 * LIMIT)
+    assert wait_for(lambda: stream.markets_data() is not None)
+    before = get_recent_prices_snapshot(None, ["ETH-USD"])
+    np.testing.assert_array_equal(before.prices[0], [101, 102, 103, 150, 160])
+    assert rest_calls == []
+
+    first.disconnect()
+    # Pendant la coupure (WS_RECONNECT_DELAY), le stockage ne sert plus le marché : l'API REST prend le relais
+    assert wait_for(lambda: not stream.has_market("ETH-USD"))
+    during = get_recent_prices_snapshot(None, ["ETH-USD"])
+    assert rest_calls == [["ETH-USD"]]
+    np.testing.assert_array_equal(during.prices[0], [101, 102, 103, 170, 180])
+
+    # Reconnexion : les abonnements sont renvoyés sur la nouvelle connexion
+    indexer.connections.get(timeout=5)
+    assert next_subscription(indexer, "v4_markets")["channel"] == "v4_markets"
+    assert next_subscription(indexer, "v4_candles")["id"] == "ETH-USD/1HOUR"
+
+    # L'historique renvoyé se fusionne avec le stockage sans doublon et le flux sert de nouveau le marché
+    assert wait_for(lambda: np.array_equal(stream.snapshot(["ETH-USD"]).prices, before.prices))
+    assert wait_for(lambda: stream.has_market("ETH-USD"))
+    assert get_recent_prices_snapshot(None, ["ETH-USD"]).epochs[0] == before.epochs[0]
+    assert rest_calls == [["ETH-USD"]]
+    assert stream.markets_data()["markets"]["ETH-USD"]["tickSize"] == "0.1"
+
+
+def test_stale_candles_are_not_served(indexer, stream):
+    # Le flux reste connecté mais la dernière bougie date de plus d'une résolution
+    indexer.start -= 2 * 3600
+    stream.subscribe(["BTC-USD"])
+    assert wait_for(lambda: stream.snapshot(["BTC-USD"]).epochs[0] == indexer.start + 3600 * LIMIT)
+    assert stream.connected.is_set() and not stream.has_market("BTC-USD")
@@ -0,0 +1,35 @@
+import numpy as np
+
+from func_cointegration import calculate_zscore_matrix
+from func_public import PriceSnapshot
+from func_zscore_stream import StreamingZScores
+
+STEP = 3600
+LIMIT = 100
+
+
+def snapshot_at(prices, t, epoch_0):
+    # Les `LIMIT` dernières bougies jusqu'à la bougie `t` incluse, comme fetch_recent_prices
+    return PriceSnapshot(["A-USD", "B-USD", "C-USD"], prices[:, t - LIMIT + 1:t + 1].copy(), np.full(3, epoch_0 + t * STEP, dtype=np.int64))
+
+
+def test_streaming_zscores_match_batch():
+    rng = np.random.default_rng(7)
+    prices = 100 + np.cumsum(rng.normal(0, 1, (3, 400)), axis=1)
+    epoch_0 = 1_700_000_000 // STEP * STEP
+    stream = StreamingZScores(window=21, resolution="1HOUR")
+    hedge_ratios = np.array([0.8, 1.3])
+
+    for t in range(LIMIT - 1, prices.shape[1]):
+        # Une re-cointégration change le ratio d'une paire en cours de route
+        if t == 250:
+            hedge_ratios = np.array([0.8, 0.5])
+
+        # Cotation en cours de bougie, puis clôture définitive de la même bougie
+        live = prices.copy()
+        live[:, t] += 0.3
+        stream.update(snapshot_at(live, t, epoch_0), ["A-USD", "A-USD"], ["B-USD", "C-USD"], hedge_ratios)
+        z_scores = stream.update(snapshot_at(prices, t, epoch_0), ["A-USD", "A-USD"], ["B-USD", "C-USD"], hedge_ratios)
+
+        spreads = prices[[0, 0], :t + 1] - hedge_ratios[:, np.newaxis] * prices[[1, 2], :t + 1]
+        np.testing.assert_allclose(z_scores, calculate_zscore_matrix(spreads, window=21)[:, -1], rtol=1e-9, atol=1e-9)